@@ -5,6 +5,7 @@
 from flask import Blueprint, request, current_app
 from models.user import User
 from utils.auth import require_admin
+from utils.user_cache import auth_cache
 from utils.response import success_response, error_response
 from utils.helpers import generate_id, hash_password, paginate, get_beijing_now
 from utils.validators import validate_email, validate_phone, validate_username, validate_password
@@ -205,6 +206,7 @@ def update_user():
         user.updated_at = get_beijing_now()
         
         db.session.commit()
+        auth_cache.invalidate_user(user.id)
         
         current_app.logger.info(f'更新用户: {user.username}')
         
@@ -244,6 +246,7 @@ def delete_user():
         # 删除用户
         db.session.delete(user)
         db.session.commit()
+        auth_cache.invalidate_user(user_id)
         
         current_app.logger.info(f'删除用户: {username}')
         
@@ -282,6 +285,7 @@ def toggle_status():
         user.updated_at = get_beijing_now()
         
         db.session.commit()
+        auth_cache.invalidate_user(user.id)
         
         current_app.logger.info(f'切换用户状态: {user.username} -> {status}')
         
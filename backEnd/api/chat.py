@@ -2,18 +2,23 @@
 智能问答模块API
 包含会话管理、消息发送等接口
 """
-from flask import Blueprint, request, current_app
+from flask import Blueprint, request, current_app, Response, stream_with_context
 from models.knowledge_base import KnowledgeBase, KnowledgeBasePermission
 from models.model import Model
 from models.chat import ChatSession, ChatMessage
 from utils.auth import require_auth
 from utils.response import success_response, error_response
 from utils.helpers import generate_id, get_beijing_now
+from utils.metrics import metrics
 from extensions import db
 from datetime import datetime
+import json
 
 chat_bp = Blueprint('chat', __name__)
 
+FALLBACK_ANSWER = '抱歉，生成回答时出现了问题。请稍后重试或联系管理员。'
+TRUNCATED_NOTICE = '\n\n（回答生成中断，以上内容不完整）'
+
 
 @chat_bp.route('/knowledge-bases', methods=['POST'])
 @require_auth
@@ -26,17 +31,7 @@ def get_knowledge_bases():
         from flask import g
         
         # 查询用户可访问的知识库
-        if g.current_user.is_admin():
-            kbs = KnowledgeBase.query.filter_by(status='active').all()
-        else:
-            kbs = KnowledgeBase.query.filter(
-                KnowledgeBase.status == 'active',
-                (KnowledgeBase.visible == 'all') |
-                (KnowledgeBase.id.in_(
-                    db.session.query(KnowledgeBasePermission.knowledge_base_id)
-                    .filter_by(user_id=g.user_id)
-                ))
-            ).all()
+        kbs = _accessible_knowledge_bases(g.current_user).all()
         
         kb_list = [{'id': kb.id, 'name': kb.name} for kb in kbs]
         
@@ -199,30 +194,11 @@ def send_message():
         # 调用 RAG 引擎生成答案
         try:
             from utils.rag_service import rag_service
-            from models.model import Model
-            
-            # 获取模型信息
-            model = Model.query.get(session.model_id)
-            model_name = model.name if model else None
-            
-            # 获取知识库配置
-            kb_id = session.knowledge_base_id
-            similarity_threshold = current_app.config.get('SIMILARITY_THRESHOLD', 0.7)
-            top_k = current_app.config.get('TOP_K', 5)
-            
-            # 如果知识库有自定义阈值，使用知识库的配置
-            if kb_id:
-                kb = KnowledgeBase.query.get(kb_id)
-                if kb and kb.similarity_threshold:
-                    similarity_threshold = kb.similarity_threshold
             
             # 调用 RAG 服务
             rag_result = rag_service.chat(
                 question=question,
-                kb_id=kb_id,
-                model_name=model_name,
-                top_k=top_k,
-                similarity_threshold=similarity_threshold
+                **_resolve_rag_options(session, g.current_user)
             )
             
             answer = rag_result['answer']
@@ -235,28 +211,29 @@ def send_message():
             
         except Exception as e:
             current_app.logger.error(f'RAG 回答失败: {str(e)}', exc_info=True)
-            answer = '抱歉，生成回答时出现了问题。请稍后重试或联系管理员。'
+            answer = FALLBACK_ANSWER
             references = []
         
-        # 保存助手消息
-        assistant_message = ChatMessage(
-            id=generate_id('msg'),
-            session_id=session_id,
-            role='assistant',
-            content=answer,
-            references=references,
-            created_at=get_beijing_now()
-        )
-        db.session.add(assistant_message)
-        
-        # 更新会话时间
-        session.updated_at = get_beijing_now()
-        
-        # 自动生成会话标题（第一条消息）
-        if session.messages.count() == 0:
-            session.title = question[:20] + ('...' if len(question) > 20 else '')
-        
-        db.session.commit()
+        with metrics.stage('chat', 'db_write'):
+            # 保存助手消息
+            assistant_message = ChatMessage(
+                id=generate_id('msg'),
+                session_id=session_id,
+                role='assistant',
+                content=answer,
+                references=references,
+                created_at=get_beijing_now()
+            )
+            db.session.add(assistant_message)
+            
+            # 更新会话时间
+            session.updated_at = get_beijing_now()
+            
+            # 自动生成会话标题（第一条消息）
+            if session.messages.count() == 0:
+                session.title = question[:20] + ('...' if len(question) > 20 else '')
+            
+            db.session.commit()
         
         current_app.logger.info(f'发送消息: session={session_id}')
         
@@ -271,6 +248,91 @@ def send_message():
         return error_response(500, '发送消息失败')
 
 
+@chat_bp.route('/message/stream', methods=['POST'])
+@require_auth
+def stream_message():
+    """
+    发送消息（流式返回）
+    POST /api/chat/message/stream
+    
+    以 Server-Sent Events 返回：先发送 references 事件，再逐段发送 token 事件，
+    生成结束后保存助手消息并发送 done 事件；生成失败时先发送 error 事件，
+    done 事件的 truncated 表示保存的是中断的部分回答。
+    客户端中途断开时同样保存已生成的部分回答（带中断说明）
+    """
+    try:
+        from flask import g
+        
+        session_id, question, rag_options = _begin_stream_message(g.current_user, request.get_json())
+        
+    except ChatRequestError as e:
+        return error_response(e.code, e.message)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'发送消息异常: {str(e)}', exc_info=True)
+        return error_response(500, '发送消息失败')
+    
+    def generate():
+        from utils.rag_service import rag_service
+        
+        answer_parts = []
+        references = []
+        failed = False
+        saved = False
+        
+        try:
+            try:
+                for event in rag_service.chat_stream(question=question, **rag_options):
+                    if event['type'] == 'references':
+                        references = event['references']
+                        yield _sse_event('references', {'references': references})
+                    else:
+                        answer_parts.append(event['content'])
+                        yield _sse_event('token', {'content': event['content']})
+            
+            except Exception as e:
+                current_app.logger.error(f'RAG 流式回答失败: {str(e)}', exc_info=True)
+                failed = True
+            
+            answer = ''.join(answer_parts)
+            truncated = failed and bool(answer_parts)
+            if failed:
+                answer, error_message = _failed_stream_answer(answer_parts)
+                yield _sse_event('error', {'message': error_message, 'truncated': truncated})
+            
+            # 生成结束后保存助手消息
+            try:
+                saved = True
+                message_id = _save_stream_answer(session_id, answer, references)
+                yield _sse_event('done', {'messageId': message_id, 'truncated': truncated})
+            
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f'保存助手消息异常: {str(e)}', exc_info=True)
+                yield _sse_event('error', {'message': '保存回答失败'})
+        
+        except GeneratorExit:
+            # 客户端断开连接：生成器在 yield 处被关闭，保存已生成的部分回答后退出
+            if not saved:
+                current_app.logger.warning(f'客户端断开流式连接: session={session_id}')
+                try:
+                    answer, _ = _failed_stream_answer(answer_parts)
+                    _save_stream_answer(session_id, answer, references)
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f'保存助手消息异常: {str(e)}', exc_info=True)
+            raise
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 关闭 Nginx 代理缓冲
+        }
+    )
+
+
 @chat_bp.route('/session/messages', methods=['POST'])
 @require_auth
 def get_session_messages():
@@ -388,3 +450,208 @@ def rename_session():
         current_app.logger.error(f'重命名会话异常: {str(e)}', exc_info=True)
         return error_response(500, '重命名会话失败')
 
+
+
+# 辅助函数
+class ChatRequestError(Exception):
+    """发送消息的请求参数或会话校验失败"""
+    
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _begin_stream_message(user, data):
+    """
+    流式问答的准备阶段：校验参数和会话权限，保存用户消息，解析 RAG 调用参数
+    （Flask 流式接口和 ASGI 异步接口共用，需要应用上下文）
+    
+    先保存用户消息，生成过程中断也不会丢失提问
+    
+    Args:
+        user: 当前用户
+        data: 请求体
+    
+    Returns:
+        tuple: (session_id, question, rag_options)
+    
+    Raises:
+        ChatRequestError: 参数错误、会话不存在或无权限
+    """
+    data = data or {}
+    session_id = data.get('sessionId')
+    question = (data.get('question') or '').strip()
+    
+    # 参数验证
+    if not session_id or not question:
+        raise ChatRequestError(3001, '会话ID和问题不能为空')
+    
+    if len(question) > 1000:
+        raise ChatRequestError(3002, '问题长度不能超过1000字符')
+    
+    # 查询会话
+    session = ChatSession.query.get(session_id)
+    if not session:
+        raise ChatRequestError(3003, '会话不存在')
+    
+    # 权限检查
+    if session.user_id != user.id:
+        raise ChatRequestError(403, '无权限访问该会话')
+    
+    is_first_message = session.messages.count() == 0
+    
+    user_message = ChatMessage(
+        id=generate_id('msg'),
+        session_id=session_id,
+        role='user',
+        content=question,
+        created_at=get_beijing_now()
+    )
+    db.session.add(user_message)
+    
+    if is_first_message:
+        session.title = question[:20] + ('...' if len(question) > 20 else '')
+    session.updated_at = get_beijing_now()
+    
+    with metrics.stage('chat', 'db_write'):
+        db.session.commit()
+    
+    return session_id, question, _resolve_rag_options(session, user)
+
+
+def _save_stream_answer(session_id, answer, references):
+    """
+    流式生成结束后保存助手消息（需要应用上下文）
+    
+    Args:
+        session_id: 会话ID
+        answer: 完整回答
+        references: 引用列表
+    
+    Returns:
+        str: 助手消息ID
+    """
+    assistant_message = ChatMessage(
+        id=generate_id('msg'),
+        session_id=session_id,
+        role='assistant',
+        content=answer,
+        references=references,
+        created_at=get_beijing_now()
+    )
+    db.session.add(assistant_message)
+    
+    with metrics.stage('chat', 'db_write'):
+        chat_session = ChatSession.query.get(session_id)
+        if chat_session:
+            chat_session.updated_at = get_beijing_now()
+        
+        db.session.commit()
+    
+    current_app.logger.info(f'流式发送消息: session={session_id}')
+    return assistant_message.id
+
+
+def _failed_stream_answer(answer_parts):
+    """
+    流式生成失败时要保存的回答和发给客户端的错误信息
+    （Flask 流式接口和 ASGI 异步接口共用）
+    
+    已输出部分内容时保存部分回答并追加中断说明，避免被当作完整回答；否则保存兜底回答
+    
+    Args:
+        answer_parts: 失败前已输出的回答片段
+    
+    Returns:
+        tuple: (answer, error_message)
+    """
+    if not answer_parts:
+        return FALLBACK_ANSWER, FALLBACK_ANSWER
+    return ''.join(answer_parts) + TRUNCATED_NOTICE, '回答生成中断，内容不完整，请重试'
+
+
+def _resolve_rag_options(session, user):
+    """
+    获取会话对应的 RAG 调用参数（知识库配置和模型名称来自进程内缓存）
+    
+    Args:
+        session: ChatSession 对象
+        user: 当前用户（全部知识库模式下按其权限确定检索范围）
+    
+    Returns:
+        dict: kb_id, model_name, top_k, similarity_threshold, embedding_model,
+              kb_ids, embedding_models（后两项仅在全部知识库模式下有值）
+    """
+    from utils.kb_settings import kb_settings_cache
+    
+    # 获取模型信息
+    model_name = kb_settings_cache.get_model_name(session.model_id)
+    
+    # 获取知识库配置
+    kb_id = session.knowledge_base_id
+    similarity_threshold = current_app.config.get('SIMILARITY_THRESHOLD', 0.7)
+    top_k = current_app.config.get('TOP_K', 5)
+    embedding_model = None
+    
+    # 如果知识库有自定义配置，使用知识库的配置
+    settings = kb_settings_cache.get(kb_id)
+    if settings:
+        if settings['similarity_threshold']:
+            similarity_threshold = settings['similarity_threshold']
+        if settings['top_k']:
+            top_k = settings['top_k']
+        embedding_model = settings['embedding_model']
+    
+    # 全部知识库模式：检索用户可访问的所有知识库，使用系统默认的 top_k 和阈值
+    kb_ids = None
+    embedding_models = None
+    if not kb_id:
+        # 一次查询取出可访问知识库的向量模型ID，每个模型只解析一次名称
+        rows = _accessible_knowledge_bases(user).with_entities(
+            KnowledgeBase.id, KnowledgeBase.vector_model_id
+        ).all()
+        model_names = {
+            model_id: kb_settings_cache.get_model_name(model_id)
+            for model_id in {row.vector_model_id for row in rows if row.vector_model_id}
+        }
+        kb_ids = [row.id for row in rows]
+        embedding_models = {row.id: model_names.get(row.vector_model_id) for row in rows}
+    
+    return {
+        'kb_id': kb_id,
+        'model_name': model_name,
+        'top_k': top_k,
+        'similarity_threshold': similarity_threshold,
+        'embedding_model': embedding_model,
+        'kb_ids': kb_ids,
+        'embedding_models': embedding_models
+    }
+
+
+def _accessible_knowledge_bases(user):
+    """
+    用户可访问的知识库查询（管理员可访问全部启用的知识库）
+    
+    Args:
+        user: User 对象
+    
+    Returns:
+        KnowledgeBase 查询对象
+    """
+    if user.is_admin():
+        return KnowledgeBase.query.filter_by(status='active')
+    
+    return KnowledgeBase.query.filter(
+        KnowledgeBase.status == 'active',
+        (KnowledgeBase.visible == 'all') |
+        (KnowledgeBase.id.in_(
+            db.session.query(KnowledgeBasePermission.knowledge_base_id)
+            .filter_by(user_id=user.id)
+        ))
+    )
+
+
+def _sse_event(event, data):
+    """格式化 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -170,6 +170,45 @@ def get_system_status():
         return error_response(500, '获取系统状态失败')
 
 
+@dashboard_bp.route('/cache-stats', methods=['POST'])
+@require_admin
+def get_cache_stats():
+    """
+    获取缓存命中统计
+    POST /api/dashboard/cache-stats
+    """
+    try:
+        from utils.rag_service import rag_service
+        from utils.kb_settings import kb_settings_cache
+        from utils.user_cache import auth_cache
+        
+        stats = rag_service.get_cache_stats()
+        stats['kbSettings'] = kb_settings_cache.stats()
+        stats['auth'] = auth_cache.stats()
+        return success_response(stats)
+        
+    except Exception as e:
+        current_app.logger.error(f'获取缓存统计异常: {str(e)}', exc_info=True)
+        return error_response(500, '获取缓存统计失败')
+
+
+@dashboard_bp.route('/http-pool-stats', methods=['POST'])
+@require_admin
+def get_http_pool_stats():
+    """
+    获取模型服务 HTTP 连接池统计
+    POST /api/dashboard/http-pool-stats
+    """
+    try:
+        from utils.http_client import http_client
+        
+        return success_response(http_client.stats())
+        
+    except Exception as e:
+        current_app.logger.error(f'获取连接池统计异常: {str(e)}', exc_info=True)
+        return error_response(500, '获取连接池统计失败')
+
+
 @dashboard_bp.route('/refresh-status', methods=['POST'])
 @require_admin
 def refresh_status():
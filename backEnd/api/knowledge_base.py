@@ -82,8 +82,19 @@ def get_list():
         page_size = int(data.get('pageSize', 20))
         keyword = data.get('keyword', '').strip()
         
-        # 构建查询
-        query = KnowledgeBase.query
+        # 构建查询（文档数、存储大小、授权人数由分组子查询一并查出，每页查询次数固定）
+        document_stats = document_stats_subquery()
+        permission_stats = permission_stats_subquery()
+        query = db.session.query(
+            KnowledgeBase,
+            db.func.coalesce(document_stats.c.document_count, 0),
+            db.func.coalesce(document_stats.c.total_size, 0),
+            db.func.coalesce(permission_stats.c.permission_count, 0)
+        ).outerjoin(
+            document_stats, document_stats.c.knowledge_base_id == KnowledgeBase.id
+        ).outerjoin(
+            permission_stats, permission_stats.c.knowledge_base_id == KnowledgeBase.id
+        )
         
         # 权限过滤
         if not g.current_user.is_admin():
@@ -110,14 +121,16 @@ def get_list():
         result = paginate(query, page, page_size)
         
         # 添加统计信息
-        for item in result['list']:
-            kb = KnowledgeBase.query.get(item['id'])
-            if kb:
-                item['documentCount'] = kb.documents.count()
-                item['storageSize'] = format_storage_size(kb)
-                item['lastUpdate'] = format_relative_time(kb.updated_at)
-                item['viewers'] = get_kb_viewers(kb)
-                item['tags'] = []
+        items = []
+        for kb, document_count, total_size, permission_count in result['list']:
+            item = kb.to_dict()
+            item['documentCount'] = document_count
+            item['storageSize'] = format_storage_size(total_size)
+            item['lastUpdate'] = format_relative_time(kb.updated_at)
+            item['viewers'] = 0 if kb.visible == 'all' else permission_count
+            item['tags'] = []
+            items.append(item)
+        result['list'] = items
         
         return success_response(result)
         
@@ -157,8 +170,18 @@ def get_detail():
         
         # 构建响应数据
         detail = kb.to_dict()
-        detail['storageSize'] = format_storage_size(kb)
+        detail['storageSize'] = format_storage_size(
+            db.session.query(db.func.coalesce(db.func.sum(Document.file_size), 0))
+            .filter(Document.knowledge_base_id == kb_id)
+            .scalar()
+        )
         detail['viewers'] = get_kb_viewers(kb)
+        detail['topK'] = kb.top_k
+        detail['similarityThreshold'] = kb.similarity_threshold
+        detail['chunkSize'] = kb.chunk_size
+        detail['chunkOverlap'] = kb.chunk_overlap
+        detail['vectorModelId'] = kb.vector_model_id
+        detail['indexConfig'] = kb.index_config or {}
         
         # 权限信息
         if g.current_user.is_admin():
@@ -257,6 +280,28 @@ def update():
             if not permission:
                 return error_response(403, '无权限管理该知识库')
         
+        # 检索和分块配置校验
+        top_k = int(data['topK']) if 'topK' in data else kb.top_k
+        chunk_size = int(data['chunkSize']) if 'chunkSize' in data else kb.chunk_size
+        chunk_overlap = int(data['chunkOverlap']) if 'chunkOverlap' in data else kb.chunk_overlap
+        if top_k is not None and top_k < 1:
+            return error_response(2001, '召回数量必须大于0')
+        if chunk_size is not None and chunk_size < 1:
+            return error_response(2001, '分块大小必须大于0')
+        if chunk_overlap is not None and chunk_size is not None and not 0 <= chunk_overlap < chunk_size:
+            return error_response(2001, '分块重叠必须小于分块大小')
+        
+        # 已入库的向量由原模型生成，更换向量模型需要先清空文档
+        if 'vectorModelId' in data and (data['vectorModelId'] or None) != kb.vector_model_id:
+            vector_model_id = data['vectorModelId'] or None
+            if vector_model_id:
+                vector_model = Model.query.get(vector_model_id)
+                if not vector_model or vector_model.type != 'embedding':
+                    return error_response(2002, '向量模型不存在')
+            if kb.documents.count() > 0:
+                return error_response(2005, '知识库已有文档，不能更换向量模型')
+            kb.vector_model_id = vector_model_id
+        
         # 更新字段
         if 'name' in data:
             kb.name = data['name'].strip()
@@ -264,11 +309,18 @@ def update():
             kb.description = data['description'].strip()
         if 'similarityThreshold' in data:
             kb.similarity_threshold = float(data['similarityThreshold'])
+        kb.top_k = top_k
+        kb.chunk_size = chunk_size
+        kb.chunk_overlap = chunk_overlap
         
         kb.updated_at = get_beijing_now()
         
         db.session.commit()
         
+        # 使检索配置缓存失效
+        from utils.kb_settings import kb_settings_cache
+        kb_settings_cache.invalidate(kb_id)
+        
         current_app.logger.info(f'更新知识库: {kb.name} (ID: {kb_id})')
         
         return success_response(kb.to_dict(), '知识库更新成功')
@@ -321,6 +373,9 @@ def delete():
         db.session.delete(kb)
         db.session.commit()
         
+        from utils.kb_settings import kb_settings_cache
+        kb_settings_cache.invalidate(kb_id)
+        
         current_app.logger.info(f'删除知识库: {kb.name} (ID: {kb_id})')
         
         return success_response(message='知识库删除成功')
@@ -387,8 +442,7 @@ def upload_document():
     try:
         from flask import g
         from werkzeug.utils import secure_filename
-        from utils.document_processor import document_processor
-        from utils.rag_service import rag_service
+        from utils.ingestion_queue import ingestion_queue
         
         current_app.logger.info('=' * 80)
         current_app.logger.info('开始处理文档上传请求')
@@ -491,55 +545,7 @@ def upload_document():
                 file_size = os.path.getsize(file_path)
                 current_app.logger.info(f'✓ 文件保存成功: {file_path}, 大小: {file_size} 字节')
                 
-                # 解析文档
-                try:
-                    current_app.logger.info('开始解析文档内容...')
-                    text = document_processor.extract_text(file_path, file_ext)
-                    current_app.logger.info(f'✓ 文档解析成功，文本长度: {len(text)} 字符')
-                    
-                    if not text or len(text) < 10:
-                        os.remove(file_path)
-                        error_msg = '文档内容为空或无法解析'
-                        current_app.logger.warning(error_msg)
-                        failed_files.append({'name': filename, 'reason': error_msg})
-                        continue
-                        
-                except Exception as e:
-                    os.remove(file_path)
-                    error_msg = f'文档解析失败: {str(e)}'
-                    current_app.logger.error(error_msg, exc_info=True)
-                    failed_files.append({'name': filename, 'reason': error_msg})
-                    continue
-                
-                # 分块处理
-                chunk_size = current_app.config.get('CHUNK_SIZE', 500)
-                chunk_overlap = current_app.config.get('CHUNK_OVERLAP', 50)
-                current_app.logger.info(f'开始分块处理 (chunk_size={chunk_size}, overlap={chunk_overlap})...')
-                
-                chunks = document_processor.create_chunks_with_metadata(
-                    text=text,
-                    document_id=doc_id,
-                    document_name=filename,
-                    kb_id=kb_id,
-                    chunk_size=chunk_size,
-                    chunk_overlap=chunk_overlap
-                )
-                current_app.logger.info(f'✓ 文档分块完成: {len(chunks)} 个块')
-                
-                # 向量化并存储到 ChromaDB
-                try:
-                    current_app.logger.info('开始向量化并存储到ChromaDB...')
-                    rag_service.add_documents(kb_id, chunks)
-                    current_app.logger.info('✓ 向量化存储成功')
-                except Exception as e:
-                    os.remove(file_path)
-                    error_msg = f'向量化存储失败: {str(e)}'
-                    current_app.logger.error(error_msg, exc_info=True)
-                    failed_files.append({'name': filename, 'reason': error_msg})
-                    continue
-                
-                # 保存文档记录到数据库
-                current_app.logger.info('保存文档记录到数据库...')
+                # 登记文档记录，解析和向量化由入库任务异步完成
                 document = Document(
                     id=doc_id,
                     knowledge_base_id=kb_id,
@@ -548,46 +554,51 @@ def upload_document():
                     file_path=saved_filename,
                     file_type=file_ext,
                     file_size=file_size,
-                    status='completed',
-                    chunk_count=len(chunks),
+                    status='pending',
+                    chunk_count=0,
                     uploaded_by=g.user_id,
                     uploaded_at=get_beijing_now()
                 )
-                
                 db.session.add(document)
-                current_app.logger.info('✓ 文档记录已添加到数据库会话')
                 
                 uploaded_docs.append({
                     'documentId': doc_id,
                     'documentName': filename,
-                    'chunkCount': len(chunks),
-                    'fileSize': file_size
+                    'fileSize': file_size,
+                    'status': 'pending'
                 })
                 
-                current_app.logger.info(f'✓✓✓ 文档上传成功: {filename} (ID: {doc_id}), 共 {len(chunks)} 个块')
-                
             except Exception as e:
                 current_app.logger.error(f'✗✗✗ 处理文件 {file.filename} 异常: {str(e)}', exc_info=True)
                 failed_files.append({'name': file.filename, 'reason': str(e)})
         
-        # 更新知识库的更新时间
+        # 登记入库任务
+        job = None
         if uploaded_docs:
-            current_app.logger.info(f'更新知识库时间并提交事务...')
+            current_app.logger.info('登记入库任务并提交事务...')
+            job = ingestion_queue.enqueue(
+                kb_id,
+                [doc['documentId'] for doc in uploaded_docs],
+                user_id=g.user_id
+            )
+            kb.progress = 0
             kb.updated_at = get_beijing_now()
             db.session.commit()
-            current_app.logger.info('✓ 数据库事务提交成功')
+            ingestion_queue.notify()
+            current_app.logger.info(f'✓ 入库任务已登记: {job.id}')
         else:
             current_app.logger.warning('没有成功上传的文档，跳过数据库提交')
         
         # 返回结果
         if uploaded_docs and not failed_files:
-            message = f'成功上传 {len(uploaded_docs)} 个文档'
+            message = f'成功上传 {len(uploaded_docs)} 个文档，正在后台处理'
         elif uploaded_docs and failed_files:
-            message = f'成功上传 {len(uploaded_docs)} 个文档，{len(failed_files)} 个文档失败'
+            message = f'成功上传 {len(uploaded_docs)} 个文档，{len(failed_files)} 个文档失败，正在后台处理'
         else:
             message = '所有文档上传失败'
         
         result = {
+            'jobId': job.id if job else None,
             'uploaded': uploaded_docs,
             'failed': failed_files,
             'successCount': len(uploaded_docs),
@@ -608,6 +619,69 @@ def upload_document():
         return error_response(500, f'上传文档失败: {str(e)}')
 
 
+@knowledge_base_bp.route('/ingestion-job', methods=['POST'])
+@require_auth
+def get_ingestion_job():
+    """
+    查询文档入库任务进度
+    POST /api/knowledge-base/ingestion-job
+    """
+    try:
+        from flask import g
+        from models.ingestion_job import IngestionJob
+        data = request.get_json() or {}
+        
+        job_id = data.get('jobId')
+        if not job_id:
+            return error_response(2001, '任务ID不能为空')
+        
+        job = IngestionJob.query.get(job_id)
+        if not job:
+            return error_response(2002, '入库任务不存在')
+        
+        kb = KnowledgeBase.query.get(job.knowledge_base_id)
+        if not kb:
+            return error_response(2002, '知识库不存在')
+        
+        # 权限检查
+        if not g.current_user.is_admin():
+            if kb.visible != 'all':
+                permission = KnowledgeBasePermission.query.filter_by(
+                    knowledge_base_id=kb.id,
+                    user_id=g.user_id
+                ).first()
+                if not permission:
+                    return error_response(403, '无权限访问该知识库')
+        
+        documents = Document.query.filter(Document.id.in_(job.document_ids or [])).all()
+        
+        # 同步知识库处理进度
+        if job.status in ('pending', 'running') and kb.progress != job.progress:
+            kb.progress = job.progress
+            db.session.commit()
+        
+        result = job.to_dict()
+        result['knowledgeBaseProgress'] = kb.progress
+        result['documents'] = [
+            {
+                'id': doc.id,
+                'name': doc.name,
+                'status': doc.status,
+                'chunkCount': doc.chunk_count,
+                'errorMessage': doc.error_message,
+                'processedAt': doc.processed_at.isoformat() if doc.processed_at else None
+            }
+            for doc in documents
+        ]
+        
+        return success_response(result)
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'查询入库任务异常: {str(e)}', exc_info=True)
+        return error_response(500, '查询入库任务失败')
+
+
 @knowledge_base_bp.route('/delete-document', methods=['POST'])
 @require_auth
 def delete_document():
@@ -643,21 +717,10 @@ def delete_document():
             if not permission:
                 return error_response(403, '无权限管理该知识库')
         
-        # 删除 ChromaDB 中的向量数据
+        # 删除 ChromaDB 中的向量数据（按 document_id 元数据精确删除）
         try:
             from utils.rag_service import rag_service
-            collection = rag_service.get_or_create_collection(document.knowledge_base_id)
-            
-            # 删除该文档的所有块
-            chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(document.chunk_count or 100)]
-            
-            # ChromaDB 的 delete 会忽略不存在的 ID，所以直接删除即可
-            try:
-                collection.delete(ids=chunk_ids)
-                current_app.logger.info(f'删除文档向量: {doc_id}')
-            except Exception as e:
-                current_app.logger.warning(f'删除向量数据失败（可能已不存在）: {str(e)}')
-        
+            rag_service.delete_document_chunks(document.knowledge_base_id, doc_id)
         except Exception as e:
             current_app.logger.error(f'删除向量数据异常: {str(e)}', exc_info=True)
             # 继续删除数据库记录
@@ -691,6 +754,98 @@ def delete_document():
         return error_response(500, '删除文档失败')
 
 
+@knowledge_base_bp.route('/replace-document', methods=['POST'])
+@require_auth
+def replace_document():
+    """
+    替换文档（增量重建索引）
+    POST /api/knowledge-base/replace-document
+    
+    保存新文件并登记入库任务，入库时按内容哈希比对新旧文本块，
+    只为新增或变化的块计算向量，删除消失的块，其余块只更新元数据。
+    入库成功后文档记录才切换到新文件并删除旧文件，失败时保留原文档
+    """
+    try:
+        from flask import g
+        from werkzeug.utils import secure_filename
+        from utils.ingestion_queue import ingestion_queue
+        
+        doc_id = request.form.get('documentId')
+        if not doc_id:
+            return error_response(2001, '文档ID不能为空')
+        
+        document = Document.query.get(doc_id)
+        if not document:
+            return error_response(2002, '文档不存在')
+        
+        # 权限检查
+        kb = KnowledgeBase.query.get(document.knowledge_base_id)
+        if not kb:
+            return error_response(2002, '知识库不存在')
+        
+        if not g.current_user.is_admin():
+            permission = KnowledgeBasePermission.query.filter_by(
+                knowledge_base_id=document.knowledge_base_id,
+                user_id=g.user_id,
+                permission='manage'
+            ).first()
+            if not permission:
+                return error_response(403, '无权限管理该知识库')
+        
+        if document.status in ('pending', 'processing'):
+            return error_response(2003, '文档正在处理中，请稍后再替换')
+        
+        file = request.files.get('file')
+        if not file or file.filename == '':
+            return error_response(2001, '未上传文件')
+        
+        filename = secure_filename(file.filename)
+        file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS', {'pdf', 'doc', 'docx', 'txt'})
+        if file_ext not in allowed_extensions:
+            return error_response(2001, f'不支持的文件类型: {file_ext}')
+        
+        # 新文件另存，入库成功后才替换文档记录并删除旧文件；失败时原文档保持可用
+        upload_folder = current_app.config.get('UPLOAD_FOLDER')
+        os.makedirs(upload_folder, exist_ok=True)
+        saved_filename = f"{doc_id}_{generate_id()[:8]}_{filename}"
+        file.save(os.path.join(upload_folder, saved_filename))
+        file_size = os.path.getsize(os.path.join(upload_folder, saved_filename))
+        
+        replacement = {
+            'document_id': doc_id,
+            'name': filename,
+            'file_name': filename,
+            'file_path': saved_filename,
+            'file_type': file_ext,
+            'file_size': file_size,
+            'uploaded_by': g.user_id,
+            'previous_status': document.status
+        }
+        document.status = 'pending'
+        document.error_message = None
+        
+        job = ingestion_queue.enqueue(kb.id, [doc_id], user_id=g.user_id, replacement=replacement)
+        kb.updated_at = get_beijing_now()
+        db.session.commit()
+        ingestion_queue.notify()
+        
+        current_app.logger.info(f'替换文档: {document.name} -> {filename} (ID: {doc_id}), 入库任务: {job.id}')
+        
+        return success_response({
+            'jobId': job.id,
+            'documentId': doc_id,
+            'documentName': filename,
+            'fileSize': file_size,
+            'status': 'pending'
+        }, '文档已替换，正在后台重建索引')
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'替换文档异常: {str(e)}', exc_info=True)
+        return error_response(500, '替换文档失败')
+
+
 @knowledge_base_bp.route('/document-preview', methods=['POST'])
 @require_auth
 def document_preview():
@@ -741,6 +896,93 @@ def get_vector_models():
         return error_response(500, '获取向量模型列表失败')
 
 
+@knowledge_base_bp.route('/rebuild-index', methods=['POST'])
+@require_admin
+def rebuild_index():
+    """
+    修改向量索引参数并重建知识库的向量集合（后台执行）
+    POST /api/knowledge-base/rebuild-index
+    """
+    try:
+        from utils.rag_service import rag_service
+        from utils.kb_settings import kb_settings_cache
+        data = request.get_json() or {}
+        
+        kb_id = data.get('id')
+        if not kb_id:
+            return error_response(2001, '知识库ID不能为空')
+        
+        kb = KnowledgeBase.query.get(kb_id)
+        if not kb:
+            return error_response(2002, '知识库不存在')
+        
+        index_config, error_message = parse_index_config(data.get('indexConfig') or {})
+        if error_message:
+            return error_response(2001, error_message)
+        
+        if rag_service.is_rebuilding(kb_id):
+            return error_response(2003, '向量集合正在重建，请稍后再试')
+        
+        # 保存参数；未指定的项沿用知识库原有设置
+        merged = dict(kb.index_config or {})
+        merged.update(index_config)
+        kb.index_config = merged
+        kb.updated_at = get_beijing_now()
+        db.session.commit()
+        kb_settings_cache.invalidate(kb_id)
+        
+        # 集合尚未创建时，参数在首次入库时生效
+        rebuilding = False
+        if rag_service.get_index_config(kb_id) is not None:
+            rebuilding = rag_service.start_rebuild(current_app._get_current_object(), kb_id, merged)
+            if not rebuilding:
+                return error_response(2003, '向量集合正在重建，请稍后再试')
+        
+        current_app.logger.info(f'修改向量索引参数: {kb.name} (ID: {kb_id}), {merged}')
+        
+        return success_response({
+            'id': kb_id,
+            'indexConfig': merged,
+            'rebuilding': rebuilding
+        }, '向量索引开始重建' if rebuilding else '向量索引参数已保存')
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'重建向量索引异常: {str(e)}', exc_info=True)
+        return error_response(500, '重建向量索引失败')
+
+
+@knowledge_base_bp.route('/index-status', methods=['POST'])
+@require_admin
+def get_index_status():
+    """
+    获取知识库向量集合当前的索引参数和重建状态
+    POST /api/knowledge-base/index-status
+    """
+    try:
+        from utils.rag_service import rag_service
+        data = request.get_json() or {}
+        
+        kb_id = data.get('id')
+        if not kb_id:
+            return error_response(2001, '知识库ID不能为空')
+        
+        kb = KnowledgeBase.query.get(kb_id)
+        if not kb:
+            return error_response(2002, '知识库不存在')
+        
+        return success_response({
+            'id': kb_id,
+            'indexConfig': kb.index_config or {},
+            'current': rag_service.get_index_config(kb_id),
+            'rebuilding': rag_service.is_rebuilding(kb_id)
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f'获取向量索引状态异常: {str(e)}', exc_info=True)
+        return error_response(500, '获取向量索引状态失败')
+
+
 @knowledge_base_bp.route('/uploaded-files', methods=['POST'])
 @require_admin
 def get_uploaded_files():
@@ -755,8 +997,10 @@ def get_uploaded_files():
         page_size = int(data.get('pageSize', 20))
         keyword = data.get('keyword', '').strip()
         
-        # 构建查询 - 查询所有文档
-        query = Document.query
+        # 构建查询 - 查询所有文档，连接知识库表一并取出知识库名称
+        query = db.session.query(Document, KnowledgeBase.name).outerjoin(
+            KnowledgeBase, KnowledgeBase.id == Document.knowledge_base_id
+        )
         
         # 关键词搜索
         if keyword:
@@ -769,12 +1013,12 @@ def get_uploaded_files():
         result = paginate(query, page, page_size)
         
         # 添加知识库信息
-        for item in result['list']:
-            kb = KnowledgeBase.query.get(item['knowledgeBaseId'])
-            if kb:
-                item['knowledgeBaseName'] = kb.name
-            else:
-                item['knowledgeBaseName'] = '未知知识库'
+        items = []
+        for document, kb_name in result['list']:
+            item = document.to_dict()
+            item['knowledgeBaseName'] = kb_name or '未知知识库'
+            items.append(item)
+        result['list'] = items
         
         return success_response(result)
         
@@ -793,7 +1037,6 @@ def create_full():
     try:
         from flask import g
         from werkzeug.utils import secure_filename
-        from utils.document_processor import document_processor
         from utils.rag_service import rag_service
         
         data = request.get_json()
@@ -808,13 +1051,39 @@ def create_full():
         # 索引配置参数
         chunk_method = data.get('chunkMethod', 'smart')
         max_chunk_length = int(data.get('maxChunkLength', 500))
-        vector_model_id = data.get('vectorModelId', '')
+        if 'chunkOverlap' in data:
+            chunk_overlap = int(data['chunkOverlap'])
+        else:
+            chunk_overlap = min(current_app.config.get('CHUNK_OVERLAP', 50), max(0, max_chunk_length - 1))
+        vector_model_id = data.get('vectorModelId') or None
         similarity_threshold = float(data.get('similarityThreshold', 0.7))
         max_recall = int(data.get('maxRecall', 5))
         
         # 参数验证
         if not name:
             return error_response(2001, '知识库名称不能为空')
+        if max_recall < 1:
+            return error_response(2001, '召回数量必须大于0')
+        if max_chunk_length < 1:
+            return error_response(2001, '分块大小必须大于0')
+        if not 0 <= chunk_overlap < max_chunk_length:
+            return error_response(2001, '分块重叠必须小于分块大小')
+        if vector_model_id:
+            vector_model = Model.query.get(vector_model_id)
+            if not vector_model or vector_model.type != 'embedding':
+                return error_response(2002, '向量模型不存在')
+        
+        # 复制已有文件时直接复用向量，来源知识库必须使用同一个向量模型
+        source_docs = []
+        if data_source == 'existing' and file_ids:
+            source_docs = db.session.query(Document, KnowledgeBase.vector_model_id).join(
+                KnowledgeBase, KnowledgeBase.id == Document.knowledge_base_id
+            ).filter(Document.id.in_(file_ids)).all()
+            mismatched = [doc.name for doc, source_model_id in source_docs if source_model_id != vector_model_id]
+            if mismatched:
+                return error_response(
+                    2005, f'以下文件所在知识库的向量模型与新知识库不一致，不能直接复制: {"、".join(mismatched)}'
+                )
         
         # 生成编码（基于名称）
         import re
@@ -836,6 +1105,10 @@ def create_full():
             visible='all',
             status='active',
             similarity_threshold=similarity_threshold,
+            top_k=max_recall,
+            chunk_size=max_chunk_length,
+            chunk_overlap=chunk_overlap,
+            vector_model_id=vector_model_id,
             created_by=g.user_id,
             created_at=get_beijing_now()
         )
@@ -846,58 +1119,39 @@ def create_full():
         current_app.logger.info(f'创建知识库: {name} (ID: {kb.id})')
         
         # 处理文件
-        if data_source == 'existing' and file_ids:
-            # 使用已有文件
-            for file_id in file_ids:
-                doc = Document.query.get(file_id)
-                if doc:
-                    # 复制文档到新知识库
-                    try:
-                        # 获取原文档的向量数据
-                        old_kb_id = doc.knowledge_base_id
-                        collection = rag_service.get_or_create_collection(old_kb_id)
-                        
-                        # 查询该文档的所有向量块
-                        chunk_ids = [f"{file_id}_chunk_{i}" for i in range(doc.chunk_count or 100)]
-                        results = collection.get(ids=chunk_ids, include=['documents', 'metadatas', 'embeddings'])
-                        
-                        if results and results['ids']:
-                            # 将向量数据复制到新知识库
-                            new_collection = rag_service.get_or_create_collection(kb.id)
-                            
-                            # 更新元数据中的知识库ID
-                            new_metadatas = []
-                            for metadata in results['metadatas']:
-                                new_metadata = metadata.copy()
-                                new_metadata['knowledge_base_id'] = kb.id
-                                new_metadatas.append(new_metadata)
-                            
-                            new_collection.add(
-                                ids=results['ids'],
-                                documents=results['documents'],
-                                metadatas=new_metadatas,
-                                embeddings=results['embeddings']
-                            )
-                        
-                        # 创建新文档记录
-                        new_doc = Document(
-                            id=generate_id('doc'),
-                            knowledge_base_id=kb.id,
-                            name=doc.name,
-                            file_name=doc.file_name,
-                            file_path=doc.file_path,
-                            file_type=doc.file_type,
-                            file_size=doc.file_size,
-                            status='completed',
-                            chunk_count=doc.chunk_count,
-                            uploaded_by=g.user_id,
-                            uploaded_at=get_beijing_now()
-                        )
-                        db.session.add(new_doc)
-                        
-                    except Exception as e:
-                        current_app.logger.error(f'复制文档失败: {str(e)}', exc_info=True)
-                        continue
+        # 使用已有文件
+        for doc, _ in source_docs:
+            # 复制文档到新知识库
+            try:
+                new_doc_id = generate_id('doc')
+                
+                # 按 document_id 元数据复制该文档的全部向量块
+                chunk_count = rag_service.copy_document_chunks(
+                    doc.knowledge_base_id,
+                    doc.id,
+                    kb.id,
+                    new_doc_id
+                )
+                
+                # 创建新文档记录
+                new_doc = Document(
+                    id=new_doc_id,
+                    knowledge_base_id=kb.id,
+                    name=doc.name,
+                    file_name=doc.file_name,
+                    file_path=doc.file_path,
+                    file_type=doc.file_type,
+                    file_size=doc.file_size,
+                    status='completed',
+                    chunk_count=chunk_count,
+                    uploaded_by=g.user_id,
+                    uploaded_at=get_beijing_now()
+                )
+                db.session.add(new_doc)
+                
+            except Exception as e:
+                current_app.logger.error(f'复制文档失败: {str(e)}', exc_info=True)
+                continue
         
         # 提交事务
         db.session.commit()
@@ -913,9 +1167,61 @@ def create_full():
 
 
 # 辅助函数
-def format_storage_size(kb):
-    """格式化存储大小"""
-    total_size = sum([doc.file_size or 0 for doc in kb.documents])
+def parse_index_config(data):
+    """
+    校验向量索引参数
+    
+    Args:
+        data: {space, M, efConstruction, efSearch}，均可省略
+        
+    Returns:
+        (索引参数, 错误信息)
+    """
+    if not isinstance(data, dict):
+        return None, '索引参数格式错误'
+    
+    index_config = {}
+    if data.get('space') is not None:
+        if data['space'] not in ('cosine', 'l2', 'ip'):
+            return None, '距离度量必须是 cosine、l2 或 ip'
+        index_config['space'] = data['space']
+    
+    # 参数名: (最小值, 最大值)
+    limits = {'M': (2, 128), 'efConstruction': (10, 2000), 'efSearch': (10, 2000)}
+    for key, (low, high) in limits.items():
+        if data.get(key) is None:
+            continue
+        try:
+            value = int(data[key])
+        except (TypeError, ValueError):
+            return None, f'{key} 必须是整数'
+        if not low <= value <= high:
+            return None, f'{key} 必须在 {low} 到 {high} 之间'
+        index_config[key] = value
+    
+    return index_config, None
+
+
+def document_stats_subquery():
+    """按知识库分组统计文档数和文件总大小的子查询"""
+    return db.session.query(
+        Document.knowledge_base_id.label('knowledge_base_id'),
+        db.func.count(Document.id).label('document_count'),
+        db.func.sum(Document.file_size).label('total_size')
+    ).group_by(Document.knowledge_base_id).subquery()
+
+
+def permission_stats_subquery():
+    """按知识库分组统计授权用户数的子查询"""
+    return db.session.query(
+        KnowledgeBasePermission.knowledge_base_id.label('knowledge_base_id'),
+        db.func.count(KnowledgeBasePermission.id).label('permission_count')
+    ).group_by(KnowledgeBasePermission.knowledge_base_id).subquery()
+
+
+def format_storage_size(total_size):
+    """格式化存储大小（字节数）"""
+    total_size = int(total_size or 0)
     if total_size == 0:
         return '0 B'
     
@@ -214,6 +214,10 @@ def update_model():
         
         db.session.commit()
         
+        # 模型名称可能变化，使知识库配置缓存失效
+        from utils.kb_settings import kb_settings_cache
+        kb_settings_cache.invalidate_model(model_id)
+        
         current_app.logger.info(f'更新模型: {model.name}')
         
         # 自动执行健康检查
@@ -256,6 +260,9 @@ def delete_model():
         db.session.delete(model)
         db.session.commit()
         
+        from utils.kb_settings import kb_settings_cache
+        kb_settings_cache.invalidate_model(model_id)
+        
         current_app.logger.info(f'删除模型: {model_name}')
         
         return success_response(message='模型删除成功')
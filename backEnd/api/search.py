@@ -2,8 +2,11 @@
 搜索模块API
 包含文档搜索、热门关键词等接口
 """
+import html
+import re
+from datetime import datetime
 from flask import Blueprint, request, current_app
-from models.knowledge_base import KnowledgeBase, Document, KnowledgeBasePermission
+from models.knowledge_base import KnowledgeBase, Document, KnowledgeBasePermission, format_file_size
 from utils.auth import require_auth
 from utils.response import success_response, error_response
 from extensions import db
@@ -11,6 +14,14 @@ from extensions import db
 search_bp = Blueprint('search', __name__)
 
 
+# 前端文档类型 -> 文件扩展名
+DOC_TYPE_FILE_TYPES = {
+    'pdf': ['pdf'],
+    'doc': ['doc', 'docx'],
+    'txt': ['txt']
+}
+
+
 @search_bp.route('/documents', methods=['POST'])
 @require_auth
 def search_documents():
@@ -20,6 +31,9 @@ def search_documents():
     """
     try:
         from flask import g
+        from utils.rag_service import rag_service
+        from utils.kb_settings import kb_settings_cache
+        from utils.helpers import format_datetime
         data = request.get_json()
         
         # 获取参数
@@ -27,27 +41,98 @@ def search_documents():
         kb_id = data.get('knowledgeBaseId', 'all')
         doc_type = data.get('docType', 'all')
         sort_by = data.get('sortBy', 'relevance')
-        page = int(data.get('page', 1))
-        page_size = int(data.get('pageSize', 10))
+        page = max(1, int(data.get('page', 1)))
+        page_size = min(max(1, int(data.get('pageSize', 10))), 100)
         
         # 参数验证
         if not keyword:
             return error_response(4001, '搜索关键词不能为空')
         
-        # TODO: 实现向量搜索
-        # 1. 对关键词进行向量化
-        # 2. 在向量数据库中搜索
-        # 3. 返回相关文档片段
+        # 可访问的知识库（只检索启用的知识库）
+        kb_query = KnowledgeBase.query.filter(KnowledgeBase.status == 'active')
+        if not g.current_user.is_admin():
+            kb_query = kb_query.filter(
+                (KnowledgeBase.visible == 'all') |
+                (KnowledgeBase.id.in_(
+                    db.session.query(KnowledgeBasePermission.knowledge_base_id)
+                    .filter_by(user_id=g.user_id)
+                ))
+            )
+        if kb_id and kb_id != 'all':
+            kb_query = kb_query.filter(KnowledgeBase.id == kb_id)
+        kb_rows = kb_query.with_entities(KnowledgeBase.id, KnowledgeBase.name, KnowledgeBase.vector_model_id).all()
+        kb_names = {row.id: row.name for row in kb_rows}
+        
+        # 各知识库的嵌入模型（模型名称来自进程内缓存）
+        embedding_models = {
+            row.id: kb_settings_cache.get_model_name(row.vector_model_id)
+            for row in kb_rows if row.vector_model_id
+        }
+        
+        # 文档类型过滤（写入 ChromaDB 元数据的 file_type）
+        where = None
+        if doc_type and doc_type != 'all':
+            file_types = DOC_TYPE_FILE_TYPES.get(doc_type, [doc_type])
+            where = {'file_type': {'$in': file_types}}
+        
+        # 取出最多 SEARCH_MAX_RESULTS 条候选，分页从中截取，total 为候选总数
+        max_results = current_app.config.get('SEARCH_MAX_RESULTS', 200)
+        
+        hits = rag_service.search_collections(
+            kb_ids=list(kb_names.keys()),
+            query=keyword,
+            top_k=max_results,
+            similarity_threshold=0.0,
+            where=where,
+            embedding_models=embedding_models
+        ) if kb_names else []
+        
+        # 一次查询取出命中文档，避免逐条查库
+        doc_ids = {hit['metadata'].get('document_id') for hit in hits}
+        documents = {
+            doc.id: doc for doc in Document.query.filter(Document.id.in_(doc_ids)).all()
+        } if doc_ids else {}
         
-        # 暂时返回模拟数据
+        items = []
+        for hit in hits:
+            metadata = hit['metadata'] or {}
+            document = documents.get(metadata.get('document_id'))
+            if document is None:
+                # 向量库中残留的已删除文档
+                continue
+            updated_at = document.processed_at or document.uploaded_at
+            items.append({
+                'id': hit['id'],
+                'documentId': document.id,
+                'knowledgeBaseId': hit['kb_id'],
+                'title': document.name,
+                'knowledgeBase': kb_names.get(hit['kb_id'], ''),
+                'docType': (document.file_type or '').upper(),
+                'excerpt': _build_excerpt(hit['content'], keyword),
+                'score': hit['similarity'],
+                'pageNumber': metadata.get('page_number') or metadata.get('chunk_index', 0) + 1,
+                'updateTime': format_datetime(updated_at),
+                'size': format_file_size(document.file_size) if document.file_size else '0 B',
+                '_updated_at': updated_at
+            })
+        
+        if sort_by == 'time':
+            items.sort(key=lambda item: item['_updated_at'] or datetime.min, reverse=True)
+        elif sort_by == 'title':
+            items.sort(key=lambda item: item['title'])
+        
+        for item in items:
+            item.pop('_updated_at')
+        
+        start = (page - 1) * page_size
         result = {
-            'list': [],
-            'total': 0,
+            'list': items[start:start + page_size],
+            'total': len(items),
             'page': page,
             'pageSize': page_size
         }
         
-        current_app.logger.info(f'搜索文档: keyword={keyword}')
+        current_app.logger.info(f'搜索文档: keyword={keyword}, 知识库数: {len(kb_names)}, 结果数: {len(items)}')
         
         return success_response(result)
         
@@ -117,3 +202,34 @@ def export_search():
         current_app.logger.error(f'导出搜索结果异常: {str(e)}', exc_info=True)
         return error_response(500, '导出失败')
 
+
+def _build_excerpt(content, keyword, max_length=200):
+    """
+    生成搜索结果摘要：截取关键词附近的文本并用 <em> 高亮（先转义 HTML）
+    
+    Args:
+        content: 文本块内容
+        keyword: 搜索关键词
+        max_length: 摘要最大长度
+        
+    Returns:
+        HTML 摘要
+    """
+    content = content or ''
+    position = content.lower().find(keyword.lower())
+    start = max(0, position - max_length // 4) if position >= 0 else 0
+    excerpt = content[start:start + max_length]
+    
+    escaped = html.escape(excerpt)
+    escaped_keyword = html.escape(keyword)
+    if escaped_keyword:
+        escaped = re.sub(
+            re.escape(escaped_keyword),
+            lambda match: f'<em>{match.group(0)}</em>',
+            escaped,
+            flags=re.IGNORECASE
+        )
+    
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if start + max_length < len(content) else ''
+    return f'{prefix}{escaped}{suffix}'
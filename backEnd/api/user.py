@@ -6,6 +6,7 @@ from flask import Blueprint, request, current_app
 from models.user import User
 from models.login_record import LoginRecord
 from utils.auth import require_auth
+from utils.user_cache import auth_cache
 from utils.response import success_response, error_response
 from utils.helpers import hash_password, verify_password, get_beijing_now
 from utils.validators import validate_email, validate_phone, validate_password
@@ -87,6 +88,7 @@ def update_profile():
         user.updated_at = get_beijing_now()
         
         db.session.commit()
+        auth_cache.invalidate_user(user.id)
         
         current_app.logger.info(f'用户更新个人信息: {user.username}')
         
@@ -3,17 +3,21 @@ RAG知识问答系统 - 主应用入口
 """
 import os
 import logging
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 
 from config import get_config
 from extensions import db, migrate
 
 
-def create_app(config_name=None):
+def create_app(config_name=None, config_overrides=None):
     """
     应用工厂函数
     创建并配置Flask应用实例
+    
+    Args:
+        config_name: 配置名称，默认读取 FLASK_ENV
+        config_overrides: 覆盖的配置项（在初始化服务之前生效）
     """
     app = Flask(__name__)
     
@@ -23,6 +27,8 @@ def create_app(config_name=None):
     
     config_class = get_config(config_name)
     app.config.from_object(config_class)
+    if config_overrides:
+        app.config.update(config_overrides)
     config_class.init_app(app)
     
     # 初始化扩展
@@ -45,6 +51,12 @@ def create_app(config_name=None):
     # 初始化 RAG 服务
     initialize_rag_service(app)
     
+    # 初始化文档入库队列
+    initialize_ingestion_queue(app)
+    
+    # 初始化运行指标（所有接口的请求耗时）
+    initialize_metrics(app)
+    
     # 注册蓝图
     register_blueprints(app)
     
@@ -61,12 +73,34 @@ def create_app(config_name=None):
             'version': '1.0.0'
         })
     
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """运行指标接口（Prometheus 文本格式）"""
+        from utils.metrics import metrics
+        
+        if not metrics.enabled:
+            return jsonify({'error': 404, 'message': '资源不存在', 'body': {}}), 404
+        
+        # 配置了 METRICS_TOKEN 时要求抓取端携带 Bearer 令牌
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return jsonify({'error': 401, 'message': '未授权，请先登录', 'body': {}}), 401
+        
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+    
     return app
 
 
 def initialize_rag_service(app):
     """初始化 RAG 服务"""
     from utils.rag_service import rag_service
+    from utils.kb_settings import kb_settings_cache
+    from utils.user_cache import auth_cache
+    from utils.http_client import http_client
+    
+    kb_settings_cache.initialize(app)
+    auth_cache.initialize(app)
+    http_client.initialize(app)
     
     try:
         rag_service.initialize(app)
@@ -77,6 +111,23 @@ def initialize_rag_service(app):
         app.logger.warning('应用将在没有 RAG 服务的情况下继续运行')
 
 
+def initialize_metrics(app):
+    """初始化运行指标"""
+    from utils.metrics import metrics
+    
+    metrics.initialize(app)
+
+
+def initialize_ingestion_queue(app):
+    """初始化文档入库队列"""
+    from utils.ingestion_queue import ingestion_queue
+    
+    try:
+        ingestion_queue.initialize(app)
+    except Exception as e:
+        app.logger.error(f'文档入库队列初始化失败: {str(e)}', exc_info=True)
+
+
 def setup_logging(app):
     """配置日志系统"""
     # 创建日志目录
@@ -0,0 +1,239 @@
+"""
+RAG知识问答系统 - ASGI 异步问答入口
+
+只提供问答接口（与 Flask 接口路径、参数、返回格式一致），其余接口仍由 Flask 提供。
+检索和生成在事件循环上以协程执行，一个进程即可同时保持大量进行中的问答；
+会话校验和消息保存等数据库操作在线程中执行。
+
+启动：uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 8001
+由反向代理把 /api/chat/message/stream 和 /api/chat/message/send 转发到该端口。
+"""
+import asyncio
+import json
+
+from api.chat import (
+    FALLBACK_ANSWER, ChatRequestError, _begin_stream_message, _failed_stream_answer,
+    _save_stream_answer, _sse_event
+)
+from app import create_app
+from utils.async_rag_service import async_rag_service
+from utils.auth import authenticate
+
+
+
+class ChatASGIApp:
+    """异步问答 ASGI 应用"""
+
+    def __init__(self, flask_app, rag=None):
+        """
+        Args:
+            flask_app: Flask 应用实例（提供配置、数据库和日志）
+            rag: AsyncRAGService 实例，不指定则使用全局 async_rag_service
+        """
+        self.flask_app = flask_app
+        self.rag = rag or async_rag_service
+        self.logger = flask_app.logger
+        self.routes = {
+            ('POST', '/api/chat/message/stream'): self.stream_message,
+            ('POST', '/api/chat/message/send'): self.send_message
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self._send_json(send, 404, '接口不存在')
+            return
+
+        headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        try:
+            data = json.loads(await self._read_body(receive) or b'{}')
+        except ValueError:
+            await self._send_json(send, 3001, '请求体不是有效的 JSON')
+            return
+
+        await handler(headers.get('authorization'), data, send)
+
+    async def _lifespan(self, receive, send):
+        """处理启动和关闭事件（关闭时释放 aiohttp 连接池）"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.rag.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _run_sync(self, func, *args):
+        """在线程中以应用上下文执行同步函数（数据库操作）"""
+        def call():
+            with self.flask_app.app_context():
+                return func(*args)
+        return await asyncio.to_thread(call)
+
+    def _begin(self, auth_header, data):
+        """校验登录和会话，保存用户消息（在线程中执行）"""
+        user, _, error = authenticate(auth_header)
+        if error:
+            raise ChatRequestError(*error)
+        return _begin_stream_message(user, data)
+
+    async def _prepare(self, auth_header, data, send):
+        """
+        问答准备阶段，失败时直接返回错误响应
+
+        Returns:
+            (session_id, question, rag_options)，失败时返回 None
+        """
+        try:
+            return await self._run_sync(self._begin, auth_header, data)
+        except ChatRequestError as e:
+            await self._send_json(send, e.code, e.message)
+        except Exception as e:
+            self.logger.error(f'发送消息异常: {str(e)}', exc_info=True)
+            await self._send_json(send, 500, '发送消息失败')
+        return None
+
+    async def stream_message(self, auth_header, data, send):
+        """
+        发送消息（流式返回）
+        POST /api/chat/message/stream
+
+        事件顺序同 Flask 接口：references、token...、done，生成失败时在 done 之前发送 error
+        """
+        prepared = await self._prepare(auth_header, data, send)
+        if prepared is None:
+            return
+        session_id, question, rag_options = prepared
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')
+            ]
+        })
+
+        async def emit(event, payload):
+            await send({
+                'type': 'http.response.body',
+                'body': _sse_event(event, payload).encode('utf-8'),
+                'more_body': True
+            })
+
+        answer_parts = []
+        references = []
+        failed = False
+
+        try:
+            async for event in self.rag.chat_stream(question=question, **rag_options):
+                if event['type'] == 'references':
+                    references = event['references']
+                    await emit('references', {'references': references})
+                else:
+                    answer_parts.append(event['content'])
+                    await emit('token', {'content': event['content']})
+        except Exception as e:
+            self.logger.error(f'RAG 流式回答失败: {str(e)}', exc_info=True)
+            failed = True
+
+        answer = ''.join(answer_parts)
+        truncated = failed and bool(answer_parts)
+        if failed:
+            answer, error_message = _failed_stream_answer(answer_parts)
+            await emit('error', {'message': error_message, 'truncated': truncated})
+
+        # 生成结束后保存助手消息
+        try:
+            message_id = await self._run_sync(_save_stream_answer, session_id, answer, references)
+            await emit('done', {'messageId': message_id, 'truncated': truncated})
+        except Exception as e:
+            self.logger.error(f'保存助手消息异常: {str(e)}', exc_info=True)
+            await emit('error', {'message': '保存回答失败'})
+
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def send_message(self, auth_header, data, send):
+        """
+        发送消息（完整返回）
+        POST /api/chat/message/send
+        """
+        prepared = await self._prepare(auth_header, data, send)
+        if prepared is None:
+            return
+        session_id, question, rag_options = prepared
+
+        try:
+            result = await self.rag.chat(question, **rag_options)
+            answer, references = result['answer'], result['references']
+        except Exception as e:
+            self.logger.error(f'RAG 回答失败: {str(e)}', exc_info=True)
+            answer, references = FALLBACK_ANSWER, []
+
+        try:
+            await self._run_sync(_save_stream_answer, session_id, answer, references)
+        except Exception as e:
+            self.logger.error(f'发送消息异常: {str(e)}', exc_info=True)
+            await self._send_json(send, 500, '发送消息失败')
+            return
+
+        await self._send_json(send, 0, '操作成功', {'answer': answer, 'references': references})
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        """读取完整请求体"""
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+
+    @staticmethod
+    async def _send_json(send, error_code, message, data=None):
+        """以统一响应格式返回 JSON（HTTP 状态码规则同 error_response）"""
+        if error_code == 0:
+            status = 200
+        elif error_code in (401, 403, 404, 500):
+            status = error_code
+        else:
+            status = 400
+
+        body = json.dumps({
+            'error': error_code,
+            'message': message,
+            'body': data if data is not None else {}
+        }, ensure_ascii=False).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json; charset=utf-8')]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(config_name=None):
+    """
+    ASGI 应用工厂函数
+
+    Args:
+        config_name: 配置名称，默认读取 FLASK_ENV
+
+    Returns:
+        ChatASGIApp 实例
+    """
+    # 问答进程不处理入库任务，入库由 Flask 进程或独立 worker 进程执行
+    flask_app = create_app(config_name, config_overrides={'INGESTION_EMBEDDED_WORKERS': 0})
+    async_rag_service.initialize(flask_app)
+    return ChatASGIApp(flask_app)
@@ -0,0 +1,463 @@
+"""
+文档入库基准测试
+在进程内启动模拟 Ollama 服务和 SQLite 数据库，用生成的 PDF/DOCX/TXT 文档走完整入库流程：
+upload_document 接口 → 入库队列解析分块 → rag_service.add_documents 向量化并写入 ChromaDB，
+按文档大小逐级统计吞吐量（文档/秒、块/秒）、峰值内存和各阶段耗时
+
+用法:
+    python benchmarks/bench_ingestion.py [--sizes 16,64,256] [--docs-per-type 2] [--types pdf,docx,txt]
+        [--dimension 768] [--latency-ms 20] [--per-item-ms 0.5] [--batch-mode batch]
+        [--save result.json] [--baseline baseline.json] [--tolerance 0.2]
+
+阶段说明:
+    upload  上传接口保存文件并登记任务
+    parse   文本提取和分块（入库时按需读取文本块，耗时计入读取过程）
+    embed   请求 /api/embed 获取向量（含向量复用查询）
+    store   写入 ChromaDB 和全文索引
+    other   数据库状态更新、内容哈希等其余开销
+
+指定 --baseline 时与基线结果比较各级别的块/秒，下降超过 --tolerance 时以退出码 1 结束，可用于 CI。
+"""
+import sys
+import os
+import argparse
+import io
+import json
+import logging
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fake_ollama import FakeOllama
+
+
+STAGES = ('upload', 'parse', 'embed', 'store', 'other')
+
+ZH_SENTENCES = [
+    '井下作业前必须检查通风设备和瓦斯浓度，确认安全后方可进入工作面。',
+    '采煤工作面应当每班检查支架状态，发现损坏及时更换。',
+    '瓦斯检查员必须持证上岗，按规定路线和次数进行检查。',
+    '主要通风机必须安装两套同等能力的装置，其中一套备用。',
+    '爆破作业必须执行一炮三检和三人连锁放炮制度。',
+    '矿井必须建立防治水制度，雨季前对排水系统进行全面检查。'
+]
+
+EN_SENTENCES = [
+    'Ventilation equipment and gas concentration must be checked before underground work.',
+    'Hydraulic supports at the working face are inspected every shift.',
+    'Gas inspectors must be certified and follow the prescribed inspection route.',
+    'The main fan has two sets of equal capacity, one of which is kept on standby.',
+    'Blasting follows the three checks and three person interlock procedure.',
+    'Drainage systems are fully inspected before the rainy season begins.'
+]
+
+
+class PeakRSS:
+    """后台采样当前进程的常驻内存，记录采样期间的峰值"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        """当前常驻内存（字节）；非 Linux 系统返回进程历史峰值"""
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+class StageTimer:
+    """累计各阶段耗时（线程安全）"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.seconds.clear()
+
+    def add(self, stage, elapsed):
+        with self._lock:
+            self.seconds[stage] += elapsed
+
+    def wrap(self, stage, func):
+        """返回统计耗时的包装函数"""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+    def wrap_iter(self, stage, iterable):
+        """统计读取迭代器的耗时（解析分块按需进行）"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+
+def make_paragraphs(size_kb, sentences, seed, prefix):
+    """生成约 size_kb KB 的段落列表，每句带编号保证各文本块内容不同"""
+    rng = random.Random(seed)
+    target = size_kb * 1024
+    paragraphs = []
+    length = 0
+    number = 0
+    while length < target:
+        parts = []
+        for _ in range(rng.randint(3, 8)):
+            number += 1
+            parts.append(f'{prefix}-{number} {rng.choice(sentences)}')
+        paragraph = ' '.join(parts)
+        paragraphs.append(paragraph)
+        length += len(paragraph.encode('utf-8'))
+    return paragraphs
+
+
+def make_txt(paragraphs):
+    return '\n\n'.join(paragraphs).encode('utf-8')
+
+
+def make_docx(paragraphs):
+    from docx import Document as DocxDocument
+    docx = DocxDocument()
+    for paragraph in paragraphs:
+        docx.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    docx.save(buffer)
+    return buffer.getvalue()
+
+
+def make_pdf(paragraphs, line_chars=90, lines_per_page=60):
+    """
+    生成只含 ASCII 文本的最小 PDF（Helvetica 字体，不依赖第三方库）
+
+    Args:
+        paragraphs: 段落列表（ASCII）
+        line_chars: 每行字符数
+        lines_per_page: 每页行数
+
+    Returns:
+        PDF 文件内容
+    """
+    lines = []
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        current = ''
+        for word in words:
+            if current and len(current) + len(word) + 1 > line_chars:
+                lines.append(current)
+                current = word
+            else:
+                current = f'{current} {word}' if current else word
+        lines.append(current)
+        lines.append('')
+
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    # 对象编号：1 目录，2 页树，3 字体，之后每页占用页面和内容两个对象
+    objects = {3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'}
+    page_ids = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 4 + index * 2, 5 + index * 2
+        page_ids.append(page_id)
+        text = ''.join(f'({escape(line)}) Tj T*\n' for line in page_lines)
+        stream = f'BT /F1 10 Tf 12 TL 40 800 Td\n{text}ET'.encode('latin-1')
+        objects[content_id] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+        objects[page_id] = (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % content_id
+        )
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids).encode()
+    objects[2] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_ids))
+    objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n')
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = output.tell()
+        output.write(b'%d 0 obj\n%s\nendobj\n' % (object_id, objects[object_id]))
+    xref = output.tell()
+    count = max(objects) + 1
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % count)
+    for object_id in range(1, count):
+        output.write(b'%010d 00000 n \n' % offsets[object_id])
+    output.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, xref))
+    return output.getvalue()
+
+
+def make_corpus(size_kb, docs_per_type, types):
+    """生成一组文档 [(文件名, 内容)]"""
+    corpus = []
+    for file_type in types:
+        for i in range(docs_per_type):
+            prefix = f'{file_type}{size_kb}k{i}'
+            seed = zlib.crc32(prefix.encode())
+            if file_type == 'pdf':
+                content = make_pdf(make_paragraphs(size_kb, EN_SENTENCES, seed, prefix))
+            elif file_type == 'docx':
+                content = make_docx(make_paragraphs(size_kb, ZH_SENTENCES, seed, prefix))
+            else:
+                content = make_txt(make_paragraphs(size_kb, ZH_SENTENCES, seed, prefix))
+            corpus.append((f'{prefix}.{file_type}', content))
+    return corpus
+
+
+def setup_environment(workdir, ollama_url, embedding_model, llm_model='fake-llm'):
+    """应用配置通过环境变量指向临时目录和（模拟）Ollama 服务（需在导入 config 之前调用）"""
+    os.environ.update({
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'CHROMA_PERSIST_DIRECTORY': os.path.join(workdir, 'chroma_db'),
+        'LEXICAL_INDEX_DIRECTORY': os.path.join(workdir, 'lexical_index'),
+        'LOG_FILE': os.path.join(workdir, 'logs', 'app.log'),
+        'LOG_LEVEL': 'WARNING',
+        'OLLAMA_BASE_URL': ollama_url,
+        'EMBEDDING_MODEL_NAME': embedding_model,
+        'LLM_DEFAULT_MODEL': llm_model,
+        'QUERY_EMBEDDING_CACHE_DIR': ''
+    })
+
+
+def create_admin(db):
+    """创建管理员并返回请求头"""
+    from models.user import User
+    from utils.auth import generate_token
+    from utils.helpers import generate_id, hash_password
+
+    user = User(
+        id=generate_id('user'), username='bench_admin', password_hash=hash_password('Bench123!'),
+        name='基准测试', role='admin', status='active'
+    )
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {generate_token(user.id)}'}
+
+
+def instrument(timer):
+    """包装入库流程中各阶段的入口，统计耗时"""
+    from utils.ingestion_queue import ingestion_queue
+    from utils.rag_service import rag_service
+
+    parse_documents = ingestion_queue.parse_documents
+
+    def timed_parse_documents(documents, kb, replacements=None):
+        for document, chunks, error in timer.wrap_iter('parse', parse_documents(documents, kb, replacements)):
+            if chunks is not None:
+                chunks = timer.wrap_iter('parse', chunks)
+            yield document, chunks, error
+
+    ingestion_queue.parse_documents = timed_parse_documents
+    rag_service.get_document_embeddings = timer.wrap('embed', rag_service.get_document_embeddings)
+    rag_service.add_documents = timer.wrap('add_documents', rag_service.add_documents)
+
+
+def run_level(client, headers, timer, size_kb, args):
+    """
+    入库一组指定大小的文档
+
+    Returns:
+        本级别的统计结果
+    """
+    from extensions import db
+    from models.knowledge_base import Document, KnowledgeBase
+    from utils.helpers import generate_id
+    from utils.ingestion_queue import ingestion_queue
+
+    corpus = make_corpus(size_kb, args.docs_per_type, args.types)
+    timer.reset()
+
+    kb = KnowledgeBase(
+        id=generate_id('kb'), name=f'基准测试 {size_kb}KB', code=f'bench_{size_kb}_{generate_id("c")}',
+        status='active', created_by='bench'
+    )
+    db.session.add(kb)
+    db.session.commit()
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        response = client.post(
+            '/api/knowledge-base/upload-document',
+            data={
+                'knowledgeBaseId': kb.id,
+                'files': [(io.BytesIO(content), name) for name, content in corpus]
+            },
+            headers=headers,
+            content_type='multipart/form-data'
+        )
+        timer.add('upload', time.perf_counter() - start)
+        body = response.get_json()
+        if body['error'] != 0:
+            raise RuntimeError(f'上传失败: {body["message"]}')
+
+        ingest_start = time.perf_counter()
+        ingestion_queue.run_pending()
+        ingest_elapsed = time.perf_counter() - ingest_start
+        total = time.perf_counter() - start
+
+    documents = Document.query.filter_by(knowledge_base_id=kb.id).all()
+    failed = [d.name for d in documents if d.status != 'completed']
+    if failed:
+        raise RuntimeError(f'文档入库失败: {failed}')
+    chunks = sum(d.chunk_count or 0 for d in documents)
+
+    stages = {
+        'upload': timer.seconds['upload'],
+        'parse': timer.seconds['parse'],
+        'embed': timer.seconds['embed'],
+        'store': timer.seconds['add_documents'] - timer.seconds['embed']
+    }
+    stages['other'] = max(0.0, ingest_elapsed - stages['parse'] - timer.seconds['add_documents'])
+
+    return {
+        'sizeKb': size_kb,
+        'documents': len(documents),
+        'bytes': sum(len(content) for _, content in corpus),
+        'chunks': chunks,
+        'seconds': round(total, 4),
+        'docsPerSecond': round(len(documents) / total, 3),
+        'chunksPerSecond': round(chunks / total, 2),
+        'peakRssMb': round(rss.peak / 1024 / 1024, 1),
+        'stages': {stage: round(stages[stage], 4) for stage in STAGES}
+    }
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """
+    与基线比较块/秒
+
+    Returns:
+        是否存在超出容忍度的性能下降
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {level['sizeKb']: level for level in json.load(f)['levels']}
+
+    regressed = False
+    print(f'\n与基线比较（容忍下降 {tolerance:.0%}）:')
+    for level in results:
+        base = baseline.get(level['sizeKb'])
+        if base is None:
+            continue
+        ratio = level['chunksPerSecond'] / base['chunksPerSecond'] if base['chunksPerSecond'] else 1.0
+        flag = '下降' if ratio < 1 - tolerance else '正常'
+        regressed = regressed or ratio < 1 - tolerance
+        print(f'  {level["sizeKb"]:>6}KB  块/秒 {base["chunksPerSecond"]:.1f} → {level["chunksPerSecond"]:.1f} ({ratio:.2f}x) {flag}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文档入库基准测试')
+    parser.add_argument('--sizes', default='16,64,256', help='每个文档的文本大小列表（KB），逗号分隔')
+    parser.add_argument('--docs-per-type', type=int, default=2, help='每个级别每种类型的文档数')
+    parser.add_argument('--types', default='pdf,docx,txt', help='文档类型，逗号分隔')
+    parser.add_argument('--dimension', type=int, default=768, help='模拟向量维度')
+    parser.add_argument('--latency-ms', type=float, default=20, help='模拟嵌入请求的固定延迟（毫秒）')
+    parser.add_argument('--per-item-ms', type=float, default=0.5, help='模拟嵌入每条文本的延迟（毫秒）')
+    parser.add_argument('--batch-mode', choices=['batch', 'serial'], default='batch', help='模拟服务的批处理方式')
+    parser.add_argument('--max-batch', type=int, default=0, help='模拟服务单次请求最大文本数，0 表示不限制')
+    parser.add_argument('--save', help='保存结果到 JSON 文件')
+    parser.add_argument('--baseline', help='基线结果 JSON 文件')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='块/秒允许下降的比例')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录（上传文件和向量库）')
+    args = parser.parse_args()
+    args.types = [t.strip() for t in args.types.split(',') if t.strip()]
+
+    workdir = tempfile.mkdtemp(prefix='bench_ingestion_')
+    fake = FakeOllama(
+        dimension=args.dimension, latency_ms=args.latency_ms, per_item_ms=args.per_item_ms,
+        batch_mode=args.batch_mode, max_batch=args.max_batch
+    ).start()
+    setup_environment(workdir, fake.url, fake.embedding_model, fake.llm_model)
+
+    # 环境变量设置后再导入应用
+    from app import create_app
+    from extensions import db
+
+    app = create_app('testing')
+    logging.disable(logging.INFO)
+
+    results = []
+    try:
+        with app.app_context():
+            db.create_all()
+            headers = create_admin(db)
+            client = app.test_client()
+            timer = StageTimer()
+            instrument(timer)
+
+            print(f'模拟 Ollama: {fake.url} dimension={args.dimension} latency={args.latency_ms}ms '
+                  f'per_item={args.per_item_ms}ms batch_mode={args.batch_mode}')
+            print(f"{'大小(KB)':>9} {'文档':>5} {'块数':>7} {'耗时(s)':>9} {'文档/s':>8} {'块/s':>8} {'峰值RSS(MB)':>12}  "
+                  + ' '.join(f'{stage:>7}' for stage in STAGES))
+
+            for size_kb in [int(size) for size in args.sizes.split(',')]:
+                fake.reset_stats()
+                level = run_level(client, headers, timer, size_kb, args)
+                level['embedRequests'] = fake.requests['embed']
+                results.append(level)
+
+                shares = ' '.join(
+                    f'{level["stages"][stage] / level["seconds"]:>7.0%}' for stage in STAGES
+                )
+                print(f'{size_kb:>9} {level["documents"]:>5} {level["chunks"]:>7} {level["seconds"]:>9.2f} '
+                      f'{level["docsPerSecond"]:>8.2f} {level["chunksPerSecond"]:>8.1f} {level["peakRssMb"]:>12.1f}  {shares}')
+    finally:
+        fake.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'options': {key: value for key, value in vars(args).items() if key not in ('save', 'baseline')},
+                'levels': results
+            }, f, ensure_ascii=False, indent=2)
+        print(f'\n结果已保存: {args.save}')
+
+    if args.baseline and compare_with_baseline(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+文本分块基准测试
+对比旧版逐段拼接/切片字符串的分块实现与当前基于偏移的实现，验证分块耗时随文本长度线性增长
+
+用法:
+    python benchmarks/bench_split_text.py [--sizes 1,2,4,8] [--legacy-max 2] [--paragraph-kb 4096] [--chunk-size 500] [--chunk-overlap 50]
+"""
+import sys
+import os
+import argparse
+import logging
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.document_processor import DEFAULT_SEPARATORS, DocumentProcessor
+
+
+SENTENCE = '井下作业前必须检查通风设备和瓦斯浓度，确认安全后方可进入工作面。'
+
+
+def legacy_split_text(text, chunk_size=500, chunk_overlap=50, separators=None):
+    """旧版分块实现（每次切分都复制剩余文本），仅用于对比"""
+    if not separators:
+        separators = DEFAULT_SEPARATORS
+
+    chunks = []
+    current_chunk = ""
+
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        if len(current_chunk) + len(paragraph) <= chunk_size:
+            current_chunk = current_chunk + "\n" + paragraph if current_chunk else paragraph
+        else:
+            if current_chunk:
+                chunks.append(current_chunk)
+                if chunk_overlap > 0:
+                    current_chunk = current_chunk[-chunk_overlap:] + "\n" + paragraph
+                else:
+                    current_chunk = paragraph
+            else:
+                current_chunk = paragraph
+
+            while len(current_chunk) > chunk_size:
+                split_point = chunk_size
+                for sep in separators:
+                    pos = current_chunk.rfind(sep, 0, chunk_size)
+                    if pos > chunk_size // 2:
+                        split_point = pos + len(sep)
+                        break
+
+                chunks.append(current_chunk[:split_point].strip())
+                if chunk_overlap > 0:
+                    current_chunk = current_chunk[max(0, split_point - chunk_overlap):]
+                else:
+                    current_chunk = current_chunk[split_point:]
+
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+
+    return chunks
+
+
+def make_text(size_mb, paragraph_kb):
+    """生成指定大小（MB，按字符计）的文本：大部分是无换行的超长段落，夹杂少量短段落"""
+    target = int(size_mb * 1024 * 1024)
+    long_paragraph = SENTENCE * (paragraph_kb * 1024 // len(SENTENCE))
+    parts = []
+    length = 0
+    while length < target:
+        parts.append(long_paragraph)
+        parts.append('第 %d 节' % len(parts))
+        length += len(long_paragraph) + 8
+    return '\n'.join(parts)[:target]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文本分块基准测试')
+    parser.add_argument('--sizes', default='1,2,4,8', help='文本大小列表（MB），逗号分隔')
+    parser.add_argument('--legacy-max', type=float, default=2, help='旧版实现参与对比的最大文本大小（MB）')
+    parser.add_argument('--paragraph-kb', type=int, default=4096, help='超长段落大小（KB），旧版实现的耗时与其平方成正比')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--chunk-overlap', type=int, default=50)
+    args = parser.parse_args()
+
+    # 基准测试不需要逐次分块的日志
+    logging.disable(logging.INFO)
+
+    sizes = [float(size) for size in args.sizes.split(',')]
+    print(f'chunk_size={args.chunk_size} chunk_overlap={args.chunk_overlap}')
+    print(f"{'大小(MB)':>10} {'块数':>8} {'当前(s)':>10} {'MB/s':>8} {'旧版(s)':>10} {'一致':>6}")
+
+    baseline = None
+    for size in sizes:
+        text = make_text(size, args.paragraph_kb)
+        elapsed, chunks = timed(DocumentProcessor.split_text, text, args.chunk_size, args.chunk_overlap)
+
+        legacy_cell, same_cell = '-', '-'
+        if size <= args.legacy_max:
+            legacy_elapsed, legacy_chunks = timed(legacy_split_text, text, args.chunk_size, args.chunk_overlap)
+            legacy_cell = f'{legacy_elapsed:.3f}'
+            same_cell = '是' if legacy_chunks == chunks else '否'
+
+        print(f'{size:>10g} {len(chunks):>8} {elapsed:>10.3f} {size / elapsed:>8.1f} {legacy_cell:>10} {same_cell:>6}')
+
+        # 线性扩展时，单位大小耗时应基本不变
+        per_mb = elapsed / size
+        if baseline is None:
+            baseline = per_mb
+        else:
+            print(f'{"":>10} 单位耗时相对 {sizes[0]:g}MB: {per_mb / baseline:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
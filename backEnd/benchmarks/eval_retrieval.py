@@ -0,0 +1,294 @@
+"""
+检索质量与延迟评估
+用标注好的「问题 → 相关文档」数据集评估 rag_service.search_documents：
+按分块参数把数据集文档写入临时 ChromaDB 集合，遍历 top_k、相似度阈值、分块大小、是否混合检索的组合，
+输出每个组合的 recall@k、MRR、nDCG@k 和检索延迟 p50/p95/p99，并选出满足召回目标的最低成本配置
+（成本按送入 LLM 的最大上下文长度 top_k × chunk_size 计算）。
+
+默认使用进程内模拟 Ollama（向量由字词散列生成，结果只反映检索流程本身）；
+指定 --ollama-url 和 --embedding-model 时使用真实嵌入模型。
+
+用法:
+    python benchmarks/eval_retrieval.py [--dataset benchmarks/data/retrieval_sample.json]
+        [--top-k 3,5,10] [--threshold 0,0.3,0.5] [--chunk-size 200,500] [--chunk-overlap 50] [--hybrid on,off]
+        [--repeat 3] [--target-recall 0.9] [--save result.json]
+
+数据集格式（JSON）:
+    {
+        "documents": [{"id": "doc_1", "name": "规程.txt", "content": "全文..."}],
+        "questions": [{"question": "...", "relevant": ["doc_1"]}]
+    }
+检索结果按文本块的 document_id 去重后与 relevant 比较（文档级相关性）。
+"""
+import sys
+import os
+import argparse
+import itertools
+import json
+import logging
+import math
+import shutil
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_ingestion import setup_environment
+from benchmarks.fake_ollama import FakeOllama
+
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(__file__), 'data', 'retrieval_sample.json')
+
+
+def recall_at_k(ranked, relevant, k):
+    """前 k 个结果覆盖的相关文档比例"""
+    if not relevant:
+        return 0.0
+    return len(set(ranked[:k]) & relevant) / len(relevant)
+
+
+def reciprocal_rank(ranked, relevant):
+    """第一个相关文档排名的倒数，没有相关文档时为 0"""
+    for rank, doc_id in enumerate(ranked, start=1):
+        if doc_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked, relevant, k):
+    """二值相关性的 nDCG@k"""
+    dcg = sum(
+        1.0 / math.log2(rank + 1)
+        for rank, doc_id in enumerate(ranked[:k], start=1)
+        if doc_id in relevant
+    )
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def percentile(values, p):
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def ranked_documents(results):
+    """检索结果按文本块顺序转换为去重的文档ID列表"""
+    ranked = []
+    for item in results:
+        doc_id = item['metadata'].get('document_id')
+        if doc_id and doc_id not in ranked:
+            ranked.append(doc_id)
+    return ranked
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def load_dataset(path):
+    """读取并校验评估数据集"""
+    with open(path, encoding='utf-8') as f:
+        dataset = json.load(f)
+
+    doc_ids = {doc['id'] for doc in dataset['documents']}
+    for item in dataset['questions']:
+        unknown = set(item['relevant']) - doc_ids
+        if unknown:
+            raise ValueError(f'问题「{item["question"]}」的相关文档不存在: {sorted(unknown)}')
+    return dataset
+
+
+def build_collection(kb_id, dataset, chunk_size, chunk_overlap, embedding_model):
+    """
+    按分块参数把数据集文档写入知识库集合
+
+    Returns:
+        文本块数量
+    """
+    from utils.document_processor import DocumentProcessor
+    from utils.rag_service import rag_service
+
+    chunks = []
+    for doc in dataset['documents']:
+        chunks.extend(DocumentProcessor.create_chunks_with_metadata(
+            doc['content'], doc['id'], doc.get('name') or doc['id'], kb_id,
+            chunk_size, chunk_overlap, os.path.splitext(doc.get('name') or '')[1].lstrip('.')
+        ))
+    rag_service.add_documents(kb_id, chunks, embedding_model)
+    return len(chunks)
+
+
+def evaluate(kb_id, questions, top_k, threshold, repeat, embedding_model):
+    """
+    评估一个参数组合
+
+    Returns:
+        指标字典
+    """
+    from utils.rag_service import rag_service
+
+    recalls, mrrs, ndcgs, latencies, counts = [], [], [], [], []
+    for item in questions:
+        relevant = set(item['relevant'])
+        results = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = rag_service.search_documents(
+                kb_id, item['question'], top_k, threshold, embedding_model=embedding_model
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        ranked = ranked_documents(results)
+        recalls.append(recall_at_k(ranked, relevant, top_k))
+        mrrs.append(reciprocal_rank(ranked, relevant))
+        ndcgs.append(ndcg_at_k(ranked, relevant, top_k))
+        counts.append(len(results))
+
+    n = len(questions)
+    return {
+        'recall': round(sum(recalls) / n, 4),
+        'mrr': round(sum(mrrs) / n, 4),
+        'ndcg': round(sum(ndcgs) / n, 4),
+        'avgResults': round(sum(counts) / n, 2),
+        'p50Ms': round(percentile(latencies, 50), 2),
+        'p95Ms': round(percentile(latencies, 95), 2),
+        'p99Ms': round(percentile(latencies, 99), 2)
+    }
+
+
+def pick_cheapest(rows, target_recall):
+    """满足召回目标的配置中，上下文成本最低者（成本相同时取 p95 延迟较低者）"""
+    candidates = [row for row in rows if row['recall'] >= target_recall]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: (row['topK'] * row['chunkSize'], row['p95Ms']))
+
+
+def format_row(row):
+    return (f'{row["chunkSize"]:>6} {row["chunkOverlap"]:>6} {row["hybrid"]:>6} {row["topK"]:>5} '
+            f'{row["threshold"]:>6g} {row["recall"]:>8.3f} {row["mrr"]:>7.3f} {row["ndcg"]:>7.3f} '
+            f'{row["avgResults"]:>6.1f} {row["p50Ms"]:>8.1f} {row["p95Ms"]:>8.1f} {row["p99Ms"]:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检索质量与延迟评估')
+    parser.add_argument('--dataset', default=DEFAULT_DATASET, help='评估数据集 JSON 文件')
+    parser.add_argument('--top-k', default='3,5,10', help='top_k 列表，逗号分隔')
+    parser.add_argument('--threshold', default='0,0.3,0.5', help='相似度阈值列表，逗号分隔')
+    parser.add_argument('--chunk-size', default='200,500', help='分块大小列表，逗号分隔')
+    parser.add_argument('--chunk-overlap', default='50', help='分块重叠列表，逗号分隔（需小于分块大小）')
+    parser.add_argument('--hybrid', default='on', help='是否启用 BM25 混合检索：on、off 或 on,off')
+    parser.add_argument('--repeat', type=int, default=3, help='每个问题计时的检索次数')
+    parser.add_argument('--target-recall', type=float, default=0.9, help='召回目标（recall@k）')
+    parser.add_argument('--ollama-url', help='真实 Ollama 地址，不指定则使用模拟服务')
+    parser.add_argument('--embedding-model', help='嵌入模型名称（使用真实 Ollama 时必填）')
+    parser.add_argument('--dimension', type=int, default=768, help='模拟向量维度')
+    parser.add_argument('--latency-ms', type=float, default=0, help='模拟嵌入请求的固定延迟（毫秒）')
+    parser.add_argument('--save', help='保存结果到 JSON 文件')
+    args = parser.parse_args()
+
+    if args.ollama_url and not args.embedding_model:
+        parser.error('使用真实 Ollama 时必须指定 --embedding-model')
+
+    dataset = load_dataset(args.dataset)
+    questions = dataset['questions']
+
+    workdir = tempfile.mkdtemp(prefix='eval_retrieval_')
+    fake = None
+    if args.ollama_url:
+        setup_environment(workdir, args.ollama_url, args.embedding_model)
+    else:
+        fake = FakeOllama(dimension=args.dimension, latency_ms=args.latency_ms).start()
+        setup_environment(workdir, fake.url, fake.embedding_model)
+
+    # 环境变量设置后再导入应用
+    from app import create_app
+    from extensions import db
+    from utils.rag_service import rag_service
+
+    app = create_app('testing')
+    # 小数据集上 ChromaDB 会对每次查询提示候选数超过集合大小
+    logging.disable(logging.WARNING)
+    embedding_model = rag_service.embedding_model
+    lexical_index = rag_service.lexical_index
+
+    rows = []
+    try:
+        with app.app_context():
+            db.create_all()
+
+            print(f'数据集: {args.dataset}（{len(dataset["documents"])} 个文档，{len(questions)} 个问题）')
+            print(f'嵌入: {os.environ["OLLAMA_BASE_URL"]} {embedding_model}')
+            print(f"{'chunk':>6} {'overlap':>6} {'hybrid':>6} {'top_k':>5} {'阈值':>6} {'recall@k':>8} "
+                  f"{'MRR':>7} {'nDCG@k':>7} {'结果数':>6} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8}")
+
+            chunk_configs = [
+                (size, overlap)
+                for size, overlap in itertools.product(
+                    parse_list(args.chunk_size, int), parse_list(args.chunk_overlap, int)
+                )
+                if overlap < size
+            ]
+            for chunk_size, chunk_overlap in chunk_configs:
+                kb_id = f'eval_{chunk_size}_{chunk_overlap}'
+                chunk_count = build_collection(kb_id, dataset, chunk_size, chunk_overlap, embedding_model)
+
+                # 预热查询向量缓存，延迟只统计检索本身
+                for item in questions:
+                    rag_service.get_query_embedding(item['question'], embedding_model)
+
+                for hybrid, top_k, threshold in itertools.product(
+                    parse_list(args.hybrid, str.strip),
+                    parse_list(args.top_k, int),
+                    parse_list(args.threshold, float)
+                ):
+                    if hybrid == 'on' and lexical_index is None:
+                        continue
+                    rag_service.lexical_index = lexical_index if hybrid == 'on' else None
+                    try:
+                        metrics = evaluate(kb_id, questions, top_k, threshold, args.repeat, embedding_model)
+                    finally:
+                        rag_service.lexical_index = lexical_index
+
+                    row = {
+                        'chunkSize': chunk_size,
+                        'chunkOverlap': chunk_overlap,
+                        'chunks': chunk_count,
+                        'hybrid': hybrid,
+                        'topK': top_k,
+                        'threshold': threshold,
+                        **metrics
+                    }
+                    rows.append(row)
+                    print(format_row(row))
+    finally:
+        if fake is not None:
+            fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    best = pick_cheapest(rows, args.target_recall)
+    if best is None:
+        print(f'\n没有配置达到召回目标 {args.target_recall:g}')
+    else:
+        print(f'\n达到召回目标 {args.target_recall:g} 的最低成本配置（top_k × chunk_size = '
+              f'{best["topK"] * best["chunkSize"]}）:')
+        print(format_row(best))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dataset': args.dataset,
+                'targetRecall': args.target_recall,
+                'best': best,
+                'results': rows
+            }, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存: {args.save}')
+
+
+if __name__ == '__main__':
+    main()
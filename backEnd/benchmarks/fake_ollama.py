@@ -0,0 +1,275 @@
+"""
+进程内模拟 Ollama 服务
+供基准测试和检索评估使用，不需要真实的 Ollama：
+
+- POST /api/embed：按文本内容生成确定性的单位向量（同一文本总是得到同一向量，
+  共享词语越多的文本向量越接近），可配置维度、每次请求延迟、每条文本延迟和批处理方式
+- POST /v1/chat/completions：返回固定答案，支持流式（SSE）和非流式
+- GET /api/tags：返回模型列表
+- 可配置前 N 个请求返回 503，用于测试重试
+
+用法:
+    python benchmarks/fake_ollama.py [--port 11434] [--dimension 768] [--latency-ms 20] [--per-item-ms 1] [--batch-mode batch]
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FAKE_ANSWER = '根据参考资料，井下作业前必须检查通风设备和瓦斯浓度。'
+
+# 中文按单字、英文和数字按单词切分
+TOKEN_PATTERN = re.compile(r'[一-鿿]|[A-Za-z0-9]+')
+
+
+def fake_embedding(text, dimension):
+    """
+    文本的确定性向量：每个词语（及相邻两字）散列到若干维度上累加后归一化
+
+    Args:
+        text: 文本
+        dimension: 向量维度
+
+    Returns:
+        单位向量
+    """
+    vector = [0.0] * dimension
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    features = tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+    for feature in features or [text]:
+        digest = hashlib.md5(feature.encode('utf-8')).digest()
+        for i in range(0, 8, 2):
+            index = int.from_bytes(digest[i:i + 2], 'little') % dimension
+            vector[index] += 1.0 if digest[i + 8] & 1 else -1.0
+
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """模拟 Ollama 的请求处理（配置保存在所属 FakeOllama 实例上）"""
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def do_GET(self):
+        if self.fake.take_failure():
+            self._reply(503, {'error': 'busy'})
+            return
+
+        if self.path == '/api/tags':
+            self.fake.record('tags', 1)
+            self._reply(200, {'models': [
+                {'name': self.fake.embedding_model},
+                {'name': self.fake.llm_model}
+            ]})
+            return
+        self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self.fake.take_failure():
+            self._reply(503, {'error': 'busy'})
+            return
+
+        if self.path == '/api/embed':
+            self._embed(payload)
+        elif self.path == '/v1/chat/completions':
+            self._chat(payload)
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def _embed(self, payload):
+        texts = payload.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+
+        fake = self.fake
+        if fake.max_batch and len(texts) > fake.max_batch:
+            self._reply(400, {'error': f'batch size {len(texts)} exceeds {fake.max_batch}'})
+            return
+
+        # batch: 一次请求内并行计算所有文本；serial: 逐条计算（每条都要付出请求延迟）
+        if fake.batch_mode == 'serial':
+            delay = len(texts) * (fake.latency + fake.per_item_latency)
+        else:
+            delay = fake.latency + len(texts) * fake.per_item_latency
+        if delay:
+            time.sleep(delay)
+
+        fake.record('embed', len(texts))
+        self._reply(200, {
+            'model': payload.get('model'),
+            'embeddings': [fake_embedding(text, fake.dimension) for text in texts]
+        })
+
+    def _chat(self, payload):
+        fake = self.fake
+        fake.record('chat', 1)
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        if not payload.get('stream'):
+            self._reply(200, {'choices': [{'message': {'role': 'assistant', 'content': FAKE_ANSWER}}]})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for i in range(0, len(FAKE_ANSWER), 4):
+            if fake.token_latency:
+                time.sleep(fake.token_latency)
+            chunk = {'choices': [{'delta': {'content': FAKE_ANSWER[i:i + 4]}}]}
+            self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.close_connection = True
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeOllama:
+    """
+    在后台线程中运行的模拟 Ollama 服务
+
+    用法:
+        with FakeOllama(dimension=256, latency_ms=10) as fake:
+            os.environ['OLLAMA_BASE_URL'] = fake.url
+    """
+
+    def __init__(
+        self,
+        host='127.0.0.1',
+        port=0,
+        dimension=768,
+        latency_ms=0.0,
+        per_item_ms=0.0,
+        token_ms=0.0,
+        batch_mode='batch',
+        max_batch=0,
+        fail_first=0,
+        embedding_model='fake-embedding',
+        llm_model='fake-llm'
+    ):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0 表示随机端口
+            dimension: 向量维度
+            latency_ms: 每次请求的固定延迟（毫秒）
+            per_item_ms: 每条文本的额外延迟（毫秒）
+            token_ms: 流式回答每个片段的延迟（毫秒）
+            batch_mode: batch（整批一次计算）或 serial（逐条计算，每条都付出请求延迟）
+            max_batch: 单次请求允许的最大文本数，超过时返回 400；0 表示不限制
+            fail_first: 前多少个请求返回 503（模拟服务繁忙）
+            embedding_model: /api/tags 返回的嵌入模型名称
+            llm_model: /api/tags 返回的问答模型名称
+        """
+        if batch_mode not in ('batch', 'serial'):
+            raise ValueError('batch_mode 必须是 batch 或 serial')
+
+        self.dimension = dimension
+        self.latency = latency_ms / 1000
+        self.per_item_latency = per_item_ms / 1000
+        self.token_latency = token_ms / 1000
+        self.batch_mode = batch_mode
+        self.max_batch = max_batch
+        self.fail_first = fail_first
+        self.embedding_model = embedding_model
+        self.llm_model = llm_model
+        self._lock = threading.Lock()
+        self.requests = {'embed': 0, 'chat': 0, 'tags': 0}
+        self.items = {'embed': 0, 'chat': 0, 'tags': 0}
+        self.failures = 0
+
+        self.server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self, kind, items):
+        with self._lock:
+            self.requests[kind] += 1
+            self.items[kind] += items
+
+    def take_failure(self):
+        """当前请求是否应返回 503（前 fail_first 个请求）"""
+        with self._lock:
+            if self.failures < self.fail_first:
+                self.failures += 1
+                return True
+            return False
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = {'embed': 0, 'chat': 0, 'tags': 0}
+            self.items = {'embed': 0, 'chat': 0, 'tags': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟 Ollama 服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--latency-ms', type=float, default=0, help='每次请求的固定延迟（毫秒）')
+    parser.add_argument('--per-item-ms', type=float, default=0, help='每条文本的额外延迟（毫秒）')
+    parser.add_argument('--token-ms', type=float, default=0, help='流式回答每个片段的延迟（毫秒）')
+    parser.add_argument('--batch-mode', choices=['batch', 'serial'], default='batch')
+    parser.add_argument('--max-batch', type=int, default=0, help='单次请求最大文本数，0 表示不限制')
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        host=args.host, port=args.port, dimension=args.dimension, latency_ms=args.latency_ms,
+        per_item_ms=args.per_item_ms, token_ms=args.token_ms, batch_mode=args.batch_mode,
+        max_batch=args.max_batch
+    )
+    print(f'模拟 Ollama 服务已启动: {fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -42,6 +42,9 @@ class Config:
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)
     JWT_EXPIRATION_HOURS = int(os.getenv('JWT_EXPIRATION_HOURS', 24))
     JWT_ALGORITHM = 'HS256'
+    AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 1024))  # 登录用户快照缓存容量
+    AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 30))  # 用户快照过期时间（秒），兜底其他进程的修改，0 表示不缓存
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 4096))  # 已解码 token 载荷缓存容量（按 token 的 exp 过期）
     
     # 文件上传配置
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(basedir, 'uploads'))
@@ -58,10 +61,44 @@ class Config:
     OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
     OLLAMA_API_BASE = f"{OLLAMA_BASE_URL}/v1"  # OpenAI 兼容接口
     
+    # 模型服务 HTTP 连接池配置（嵌入、问答、健康检查共用长连接）
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4))  # 缓存的主机连接池数量
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 16))  # 每个主机的最大连接数，用尽时请求排队
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))  # 建立连接超时时间（秒）
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60))  # 未单独配置时的读取超时时间（秒）
+    HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))  # 连接失败，以及 GET 请求 502/503/504 的重试次数
+    HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.5))  # 重试退避基数（秒）
+    ASYNC_HTTP_LIMIT = int(os.getenv('ASYNC_HTTP_LIMIT', 256))  # 异步问答（asgi.py）的最大连接数
+    ASYNC_HTTP_LIMIT_PER_HOST = int(os.getenv('ASYNC_HTTP_LIMIT_PER_HOST', 64))  # 异步问答每个主机的最大连接数
+    
     # 嵌入模型配置（用于向量化文档和查询）
     EMBEDDING_MODEL_TYPE = os.getenv('EMBEDDING_MODEL_TYPE', 'ollama')  # ollama 或 sentence-transformers
     EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL_NAME', 'dengcao/Qwen3-Embedding-4B:Q5_K_M')
     EMBEDDING_DIMENSION = int(os.getenv('EMBEDDING_DIMENSION', 768))
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))  # 每次 /api/embed 请求的文本数
+    EMBEDDING_MAX_WORKERS = int(os.getenv('EMBEDDING_MAX_WORKERS', 4))  # 并发批次数
+    EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', 2))  # 失败批次重试次数
+    EMBEDDING_TIMEOUT = int(os.getenv('EMBEDDING_TIMEOUT', 60))  # 单批次超时时间（秒）
+    
+    # 向量索引配置（新建集合时使用，知识库可单独设置并通过重建接口生效）
+    CHROMA_DISTANCE = os.getenv('CHROMA_DISTANCE', 'cosine')  # cosine、l2 或 ip，Qwen 嵌入模型使用余弦相似度
+    CHROMA_HNSW_M = int(os.getenv('CHROMA_HNSW_M', 16))  # 每个节点的邻居数
+    CHROMA_HNSW_EF_CONSTRUCTION = int(os.getenv('CHROMA_HNSW_EF_CONSTRUCTION', 100))  # 建索引时的候选队列长度
+    CHROMA_HNSW_EF_SEARCH = int(os.getenv('CHROMA_HNSW_EF_SEARCH', 64))  # 查询时的候选队列长度，需不小于 top_k
+    
+    # 查询向量缓存配置
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 2048))
+    QUERY_EMBEDDING_CACHE_TTL = int(os.getenv('QUERY_EMBEDDING_CACHE_TTL', 86400))  # 秒，0 表示不过期
+    QUERY_EMBEDDING_CACHE_DIR = os.getenv('QUERY_EMBEDDING_CACHE_DIR', '')  # 共享磁盘缓存目录，留空则只使用内存
+    QUERY_EMBEDDING_CACHE_DISK_MAX_ENTRIES = int(os.getenv('QUERY_EMBEDDING_CACHE_DISK_MAX_ENTRIES', 100000))  # 磁盘缓存条目上限，0 表示不限制
+    QUERY_EMBEDDING_CACHE_PRUNE_INTERVAL = int(os.getenv('QUERY_EMBEDDING_CACHE_PRUNE_INTERVAL', 600))  # 磁盘缓存清理间隔（秒）
+    
+    # 文本块向量存储：按 SHA-256(模型, 文本) 复用已计算的向量
+    EMBEDDING_STORE_ENABLED = os.getenv('EMBEDDING_STORE_ENABLED', 'true').lower() == 'true'
+    EMBEDDING_STORE_PATH = os.getenv(
+        'EMBEDDING_STORE_PATH',
+        os.path.join(basedir, 'embedding_store', 'embeddings.db')
+    )
     
     # LLM 配置（用于生成回答）
     LLM_API_BASE = os.getenv('LLM_API_BASE', OLLAMA_API_BASE)
@@ -76,6 +113,10 @@ class Config:
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', os.path.join(basedir, 'logs', 'app.log'))
     
+    # 运行指标配置（/metrics，Prometheus 文本格式）
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # 设置后抓取 /metrics 需携带 Authorization: Bearer <令牌>
+    
     # CORS配置
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:5173').split(',')
     
@@ -86,8 +127,42 @@ class Config:
     # RAG配置
     CHUNK_SIZE = 500
     CHUNK_OVERLAP = 50
+    CHUNK_UNIT = os.getenv('CHUNK_UNIT', 'char')  # char 按字符数分块，token 按嵌入模型的词元数分块
+    CHUNK_TOKEN_SIZE = int(os.getenv('CHUNK_TOKEN_SIZE', 512))  # 按词元分块时每块的最大词元数
+    CHUNK_TOKEN_OVERLAP = int(os.getenv('CHUNK_TOKEN_OVERLAP', 64))  # 按词元分块时的重叠词元数
+    TOKENIZER_PATH = os.getenv('TOKENIZER_PATH', os.path.join(basedir, 'tokenizers'))  # 分词器文件，或按模型名存放 tokenizer.json 的目录
     TOP_K = 5
     SIMILARITY_THRESHOLD = 0.7
+    KB_SETTINGS_CACHE_SIZE = int(os.getenv('KB_SETTINGS_CACHE_SIZE', 1024))  # 知识库检索配置缓存容量
+    KB_SETTINGS_CACHE_TTL = int(os.getenv('KB_SETTINGS_CACHE_TTL', 300))  # 缓存过期时间（秒），兜底其他进程的修改
+    SEARCH_MAX_WORKERS = int(os.getenv('SEARCH_MAX_WORKERS', 8))  # 多知识库并发检索线程数
+    SEARCH_COLLECTION_TIMEOUT = float(os.getenv('SEARCH_COLLECTION_TIMEOUT', 5))  # 多知识库检索时单个知识库的截止时间（秒），0 表示不限
+    SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 200))  # 文档搜索最多返回的结果数
+    
+    # 问答结果缓存（相同知识库、相同检索结果的重复问题跳过 LLM 生成）
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', 1024))
+    ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 3600))  # 秒，兜底其他进程对知识库的修改
+    ANSWER_CACHE_SEMANTIC_THRESHOLD = float(os.getenv('ANSWER_CACHE_SEMANTIC_THRESHOLD', 0.95))  # 问题向量余弦相似度阈值，0 表示只做精确命中
+    
+    # 混合检索配置（BM25 全文检索 + 向量检索，倒数排名融合）
+    HYBRID_SEARCH_ENABLED = os.getenv('HYBRID_SEARCH_ENABLED', 'true').lower() == 'true'
+    LEXICAL_INDEX_DIRECTORY = os.getenv(
+        'LEXICAL_INDEX_DIRECTORY',
+        os.path.join(basedir, 'lexical_index')
+    )
+    HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', 20))  # 每路检索的候选数
+    RRF_K = int(os.getenv('RRF_K', 60))  # RRF 平滑常数
+    
+    # 文档入库队列配置
+    INGESTION_EMBEDDED_WORKERS = int(os.getenv('INGESTION_EMBEDDED_WORKERS', 1))  # Web 进程内 worker 线程数，0 表示只使用独立 worker 进程
+    INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 2))  # 独立 worker 进程的线程数
+    INGESTION_POLL_INTERVAL = int(os.getenv('INGESTION_POLL_INTERVAL', 2))  # 空闲轮询间隔（秒）
+    INGESTION_HEARTBEAT_INTERVAL = int(os.getenv('INGESTION_HEARTBEAT_INTERVAL', 30))  # 运行中任务的心跳间隔，也是超时任务检查间隔（秒），0 表示不发送心跳
+    INGESTION_HEARTBEAT_TIMEOUT = int(os.getenv('INGESTION_HEARTBEAT_TIMEOUT', 180))  # 心跳超过该时间未更新的任务重新入队（秒）
+    INGESTION_PARSE_WORKERS = int(os.getenv('INGESTION_PARSE_WORKERS', os.cpu_count() or 1))  # 文档解析进程数，0 表示在 worker 线程中解析
+    PDF_SHARD_PAGES = int(os.getenv('PDF_SHARD_PAGES', 50))  # 超过该页数的 PDF 按页码区间拆分并行解析，0 表示不拆分
+    INGESTION_EMBED_BATCH_SIZE = int(os.getenv('INGESTION_EMBED_BATCH_SIZE', 256))  # 每批写入向量库的文本块数
     
     @staticmethod
     def init_app(app):
@@ -130,6 +205,9 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     SQLALCHEMY_ENGINE_OPTIONS = {}  # SQLite不支持连接池参数
     WTF_CSRF_ENABLED = False
+    INGESTION_EMBEDDED_WORKERS = 0  # 测试中同步调用 run_pending
+    INGESTION_PARSE_WORKERS = 0  # 测试中不启动解析进程池
+    INGESTION_HEARTBEAT_INTERVAL = 0  # 测试中不启动心跳线程
 
 
 # 配置字典
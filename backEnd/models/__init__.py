@@ -6,6 +6,7 @@ from models.knowledge_base import KnowledgeBase, Document, KnowledgeBasePermissi
 from models.chat import ChatSession, ChatMessage
 from models.model import Model
 from models.login_record import LoginRecord
+from models.ingestion_job import IngestionJob
 
 __all__ = [
     'User',
@@ -15,6 +16,7 @@ __all__ = [
     'ChatSession',
     'ChatMessage',
     'Model',
-    'LoginRecord'
+    'LoginRecord',
+    'IngestionJob'
 ]
 
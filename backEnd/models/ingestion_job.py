@@ -0,0 +1,55 @@
+"""
+文档入库任务模型
+"""
+from extensions import db
+from utils.helpers import get_beijing_now
+
+
+class IngestionJob(db.Model):
+    """文档入库任务表"""
+    __tablename__ = 'ingestion_jobs'
+
+    id = db.Column(db.String(50), primary_key=True)
+    knowledge_base_id = db.Column(db.String(50), db.ForeignKey('knowledge_bases.id', ondelete='CASCADE'), nullable=False, index=True)
+    document_ids = db.Column(db.JSON, nullable=False)  # 本任务包含的文档ID列表
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, running, completed, failed
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(100))  # 领取任务的 worker 标识
+    replacement = db.Column(db.JSON)  # 替换文档任务的新文件信息，入库成功后才写入文档记录
+    error_message = db.Column(db.Text)
+    created_by = db.Column(db.String(50), db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=get_beijing_now)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime, index=True)  # worker 最近一次心跳时间，超时未更新视为 worker 已退出
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<IngestionJob {self.id}>'
+
+    @property
+    def progress(self):
+        """任务进度（0-100）"""
+        if not self.total:
+            return 100 if self.status == 'completed' else 0
+        return int((self.processed or 0) * 100 / self.total)
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'knowledgeBaseId': self.knowledge_base_id,
+            'documentIds': self.document_ids or [],
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'failed': self.failed,
+            'progress': self.progress,
+            'errorMessage': self.error_message,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'heartbeatAt': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -24,6 +24,7 @@ class KnowledgeBase(db.Model):
     similarity_threshold = db.Column(db.Float, default=0.7)
     top_k = db.Column(db.Integer, default=5)
     vector_model_id = db.Column(db.String(50))
+    index_config = db.Column(db.JSON)  # 向量索引参数（space、M、efConstruction、efSearch），未设置的项使用全局配置
     created_by = db.Column(db.String(50), db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=get_beijing_now)
     updated_at = db.Column(db.DateTime, default=get_beijing_now, onupdate=get_beijing_now)
@@ -99,6 +100,7 @@ class Document(db.Model):
             'pageCount': self.page_count,
             'chunkCount': self.chunk_count,
             'status': self.status,
+            'errorMessage': self.error_message,
             'tags': self.tags or [],
             'uploadedBy': self.uploaded_by,
             'uploadTime': self.uploaded_at.isoformat() if self.uploaded_at else None,
@@ -45,6 +45,7 @@ CREATE TABLE IF NOT EXISTS knowledge_bases (
     similarity_threshold FLOAT DEFAULT 0.7 COMMENT '相似度阈值',
     top_k INT DEFAULT 5 COMMENT '检索TopK',
     vector_model_id VARCHAR(50) COMMENT '向量模型ID',
+    index_config JSON COMMENT '向量索引参数：space, M, efConstruction, efSearch',
     created_by VARCHAR(50) COMMENT '创建人ID',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
@@ -159,6 +160,31 @@ CREATE TABLE IF NOT EXISTS login_records (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='登录记录表';
 
+-- 文档入库任务表
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id VARCHAR(50) PRIMARY KEY COMMENT '任务ID',
+    knowledge_base_id VARCHAR(50) NOT NULL COMMENT '知识库ID',
+    document_ids JSON NOT NULL COMMENT '文档ID列表',
+    status VARCHAR(20) DEFAULT 'pending' COMMENT '状态：pending, running, completed, failed',
+    total INT DEFAULT 0 COMMENT '文档总数',
+    processed INT DEFAULT 0 COMMENT '已处理文档数',
+    failed INT DEFAULT 0 COMMENT '失败文档数',
+    attempts INT DEFAULT 0 COMMENT '执行次数',
+    worker VARCHAR(100) COMMENT '执行者标识',
+    replacement JSON COMMENT '替换文档的新文件信息',
+    error_message TEXT COMMENT '错误信息',
+    created_by VARCHAR(50) COMMENT '创建人ID',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    started_at DATETIME COMMENT '开始时间',
+    heartbeat_at DATETIME COMMENT '最近心跳时间',
+    finished_at DATETIME COMMENT '完成时间',
+    INDEX idx_kb_id (knowledge_base_id),
+    INDEX idx_status (status),
+    INDEX idx_heartbeat_at (heartbeat_at),
+    FOREIGN KEY (knowledge_base_id) REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+    FOREIGN KEY (created_by) REFERENCES users(id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='文档入库任务表';
+
 -- 插入初始管理员账号
 -- 密码: admin123 (bcrypt加密后的哈希值)
 INSERT INTO users (id, username, password_hash, name, role, email, phone, status) 
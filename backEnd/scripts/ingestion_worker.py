@@ -0,0 +1,48 @@
+"""
+文档入库 worker 进程
+独立于 Web 进程消费 ingestion_jobs 队列，完成文档解析、分块和向量化
+
+用法:
+    python scripts/ingestion_worker.py [线程数]
+"""
+import sys
+import os
+import signal
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 独立 worker 进程中不再启动 Web 进程内的 worker 线程
+os.environ['INGESTION_EMBEDDED_WORKERS'] = '0'
+
+from app import create_app
+from utils.ingestion_queue import ingestion_queue
+
+
+def run_worker(num_workers=None):
+    """启动 worker 线程池并阻塞运行"""
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+
+    if num_workers is None:
+        num_workers = app.config.get('INGESTION_WORKERS', 2)
+
+    def handle_signal(signum, frame):
+        print('\n正在停止入库 worker...')
+        ingestion_queue.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    print('=' * 60)
+    print(f' 文档入库 worker 已启动，线程数: {num_workers}')
+    print('=' * 60)
+
+    ingestion_queue.start_workers(app, num_workers)
+    ingestion_queue.join()
+
+    print('入库 worker 已退出')
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    run_worker(workers)
@@ -0,0 +1,35 @@
+-- RAG知识问答系统数据库升级脚本
+-- MySQL 5.7+ / MariaDB 10.2+
+-- 适用于按旧版 create_db.sql 建立的数据库（新建数据库直接执行 create_db.sql 即可）
+-- 可重复执行：建表语句在前，最后的 ALTER TABLE 在 index_config 列已存在时报 Duplicate column 错误，可忽略
+
+USE rag_knowledge_base;
+
+-- 文档入库任务表
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id VARCHAR(50) PRIMARY KEY COMMENT '任务ID',
+    knowledge_base_id VARCHAR(50) NOT NULL COMMENT '知识库ID',
+    document_ids JSON NOT NULL COMMENT '文档ID列表',
+    status VARCHAR(20) DEFAULT 'pending' COMMENT '状态：pending, running, completed, failed',
+    total INT DEFAULT 0 COMMENT '文档总数',
+    processed INT DEFAULT 0 COMMENT '已处理文档数',
+    failed INT DEFAULT 0 COMMENT '失败文档数',
+    attempts INT DEFAULT 0 COMMENT '执行次数',
+    worker VARCHAR(100) COMMENT '执行者标识',
+    replacement JSON COMMENT '替换文档的新文件信息',
+    error_message TEXT COMMENT '错误信息',
+    created_by VARCHAR(50) COMMENT '创建人ID',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    started_at DATETIME COMMENT '开始时间',
+    heartbeat_at DATETIME COMMENT '最近心跳时间',
+    finished_at DATETIME COMMENT '完成时间',
+    INDEX idx_kb_id (knowledge_base_id),
+    INDEX idx_status (status),
+    INDEX idx_heartbeat_at (heartbeat_at),
+    FOREIGN KEY (knowledge_base_id) REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+    FOREIGN KEY (created_by) REFERENCES users(id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='文档入库任务表';
+
+-- 知识库向量索引参数
+ALTER TABLE knowledge_bases
+    ADD COLUMN index_config JSON COMMENT '向量索引参数：space, M, efConstruction, efSearch' AFTER vector_model_id;
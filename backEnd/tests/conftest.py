@@ -201,6 +201,28 @@ def chat_session(db_session, normal_user, knowledge_base, llm_model):
     return session
 
 
+@pytest.fixture
+def chroma_client():
+    """内存 ChromaDB 客户端"""
+    import chromadb
+    return chromadb.EphemeralClient()
+
+
+@pytest.fixture
+def rag(app, chroma_client, tmp_path):
+    """使用内存 ChromaDB 的独立 RAG 服务实例"""
+    from utils.rag_service import RAGService
+    from utils.embedding_store import EmbeddingStore
+    
+    service = RAGService()
+    service.ollama_base_url = 'http://ollama.test:11434'
+    service.embedding_model = f'embed-{generate_id()[:8]}'
+    service.default_llm_model = 'test-llm'
+    service.chroma_client = chroma_client
+    service.embedding_store = EmbeddingStore(str(tmp_path / 'embeddings.db'))
+    return service
+
+
 @pytest.fixture(autouse=True)
 def reset_db(db_session):
     """每个测试后自动清理数据库"""
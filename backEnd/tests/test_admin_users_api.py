@@ -3,6 +3,7 @@
 测试用户CRUD、状态管理等功能
 """
 import pytest
+from sqlalchemy import event
 from models.user import User
 
 
@@ -211,6 +212,59 @@ class TestAdminUsersAPI:
         user = User.query.get(normal_user.id)
         assert user.status == 'disabled'
     
+    def test_disabled_user_rejected_immediately(self, client, db_session, auth_headers_admin, auth_headers_user, normal_user):
+        """测试禁用用户后已缓存的登录信息立即失效"""
+        # Arrange
+        client.post('/api/user/profile', headers=auth_headers_user)
+        
+        # Act
+        client.post('/api/admin/users/toggle-status', 
+                    json={'userId': normal_user.id, 'status': 'disabled'}, 
+                    headers=auth_headers_admin)
+        response = client.post('/api/user/profile', headers=auth_headers_user)
+        
+        # Assert
+        assert response.status_code == 403
+        assert response.get_json()['message'] == '账号已被禁用'
+    
+    def test_role_change_applies_immediately(self, client, db_session, auth_headers_admin, auth_headers_user, normal_user):
+        """测试修改角色后已缓存的登录信息立即失效"""
+        # Arrange
+        before = client.post('/api/admin/users/stats', headers=auth_headers_user)
+        
+        # Act
+        client.post('/api/admin/users/update', 
+                    json={'id': normal_user.id, 'role': 'admin'}, 
+                    headers=auth_headers_admin)
+        after = client.post('/api/admin/users/stats', headers=auth_headers_user)
+        
+        # Assert
+        assert before.status_code == 403
+        assert after.status_code == 200
+    
+    def test_repeated_requests_skip_user_query(self, client, db_session, auth_headers_user, mocker):
+        """测试同一用户重复请求时不再解码 token 和查询用户表"""
+        # Arrange
+        statements = []
+        
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        
+        client.post('/api/user/departments', headers=auth_headers_user)
+        verify = mocker.patch('utils.auth.verify_token')
+        event.listen(db_session.engine, 'before_cursor_execute', record)
+        
+        # Act
+        try:
+            response = client.post('/api/user/departments', headers=auth_headers_user)
+        finally:
+            event.remove(db_session.engine, 'before_cursor_execute', record)
+        
+        # Assert
+        assert response.status_code == 200
+        verify.assert_not_called()
+        assert statements == []
+    
     def test_reset_password(self, client, db_session, auth_headers_admin, normal_user):
         """测试重置密码"""
         # Arrange
@@ -0,0 +1,190 @@
+"""
+异步问答接口测试
+测试 ASGI 流式问答、认证失败响应和异步 RAG 服务的并发生成
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from asgi import ChatASGIApp, create_asgi_app
+from api.chat import TRUNCATED_NOTICE
+from benchmarks.fake_ollama import FAKE_ANSWER, FakeOllama, fake_embedding
+from models.chat import ChatMessage
+from utils.async_rag_service import AsyncRAGService
+
+
+@pytest.fixture
+def fake_ollama():
+    """启动本地模拟 Ollama，返回服务对象"""
+    with FakeOllama(dimension=3) as fake:
+        yield fake
+
+
+@pytest.fixture
+def async_rag(app, rag, fake_ollama):
+    """指向模拟 Ollama 的异步 RAG 服务"""
+    service = AsyncRAGService(rag)
+    service.initialize(app)
+    service.ollama_base_url = fake_ollama.url
+    service.default_llm_model = 'test-llm'
+    return service
+
+
+async def call_asgi(asgi_app, path, payload, headers=None):
+    """以 ASGI 协议调用应用，返回 (状态码, 响应体)"""
+    raw_headers = [(b'content-type', b'application/json')]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': raw_headers}
+    body = json.dumps(payload).encode()
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+    status = messages[0]['status']
+    content = b''.join(m.get('body', b'') for m in messages[1:]).decode('utf-8')
+    return status, content
+
+
+def parse_sse(content):
+    """解析 SSE 文本为 [(事件名, 数据)]"""
+    events = []
+    for block in content.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@pytest.mark.api
+class TestAsgiChat:
+    """异步问答接口测试类"""
+
+    def test_stream_message(self, app, db_session, async_rag, chat_session, knowledge_base,
+                            auth_headers_user, mocker):
+        """测试流式问答返回引用和答案并保存消息"""
+        # Arrange
+        mocker.patch.object(
+            async_rag.rag, 'get_embeddings',
+            side_effect=lambda texts, model=None: [fake_embedding(text, 3) for text in texts]
+        )
+        with app.app_context():
+            async_rag.rag.add_documents(knowledge_base.id, [{
+                'id': 'doc_vent_chunk_0',
+                'content': '通风设施检查周期',
+                'metadata': {'document_id': 'doc_vent', 'document_name': '通风规程.pdf', 'chunk_index': 0}
+            }])
+        knowledge_base.similarity_threshold = 0.1
+        db_session.session.commit()
+        asgi_app = ChatASGIApp(app, rag=async_rag)
+
+        # Act
+        async def run():
+            try:
+                return await call_asgi(
+                    asgi_app, '/api/chat/message/stream',
+                    {'sessionId': chat_session.id, 'question': '通风设施检查周期'},
+                    auth_headers_user
+                )
+            finally:
+                await async_rag.close()
+
+        status, content = asyncio.run(run())
+
+        # Assert
+        assert status == 200
+        events = parse_sse(content)
+        names = [name for name, _ in events]
+        assert names[0] == 'references' and names[-1] == 'done'
+        assert set(names[1:-1]) == {'token'}
+        assert events[0][1]['references'][0]['documentName'] == '通风规程.pdf'
+        messages = ChatMessage.query.filter_by(session_id=chat_session.id).order_by(ChatMessage.created_at).all()
+        assert [m.role for m in messages] == ['user', 'assistant']
+        assert messages[1].content == FAKE_ANSWER
+        assert messages[1].id == events[-1][1]['messageId']
+
+    def test_stream_message_fails_midway(self, app, db_session, async_rag, chat_session,
+                                         auth_headers_user, mocker):
+        """测试生成中途失败时发送 error 事件，保存的回答带有中断说明"""
+        # Arrange
+        async def broken_stream(question, **kwargs):
+            yield {'type': 'references', 'references': []}
+            yield {'type': 'token', 'content': '每班'}
+            raise RuntimeError('连接中断')
+
+        mocker.patch.object(async_rag, 'chat_stream', side_effect=broken_stream)
+        asgi_app = ChatASGIApp(app, rag=async_rag)
+
+        # Act
+        status, content = asyncio.run(call_asgi(
+            asgi_app, '/api/chat/message/stream',
+            {'sessionId': chat_session.id, 'question': '检查周期'},
+            auth_headers_user
+        ))
+
+        # Assert
+        assert status == 200
+        events = parse_sse(content)
+        assert [name for name, _ in events] == ['references', 'token', 'error', 'done']
+        assert events[2][1]['truncated'] is True
+        assert events[3][1]['truncated'] is True
+        answer = ChatMessage.query.filter_by(session_id=chat_session.id, role='assistant').first()
+        assert answer.content == '每班' + TRUNCATED_NOTICE
+
+    def test_create_asgi_app_disables_embedded_workers(self, mocker):
+        """测试 ASGI 问答进程不启动进程内入库 worker"""
+        # Arrange
+        mocker.patch('config.TestingConfig.INGESTION_EMBEDDED_WORKERS', 2)
+        start_workers = mocker.patch('utils.ingestion_queue.ingestion_queue.start_workers')
+        # 不重新初始化全局 RAG 服务，避免影响其他测试
+        mocker.patch('app.initialize_rag_service')
+        mocker.patch('utils.async_rag_service.async_rag_service.initialize')
+
+        # Act
+        asgi_app = create_asgi_app('testing')
+
+        # Assert
+        assert asgi_app.flask_app.config['INGESTION_EMBEDDED_WORKERS'] == 0
+        start_workers.assert_not_called()
+
+    def test_stream_message_unauthorized(self, app, db_session, async_rag, chat_session):
+        """测试未登录时返回统一格式的错误"""
+        # Arrange
+        asgi_app = ChatASGIApp(app, rag=async_rag)
+
+        # Act
+        status, content = asyncio.run(call_asgi(
+            asgi_app, '/api/chat/message/stream',
+            {'sessionId': chat_session.id, 'question': '测试问题'}
+        ))
+
+        # Assert
+        assert status == 401
+        assert json.loads(content)['error'] == 401
+
+    def test_concurrent_chats_share_event_loop(self, app, async_rag, fake_ollama):
+        """测试多个问答在同一个事件循环中并发生成，不按线程串行"""
+        # Arrange
+        fake_ollama.token_latency = 0.1
+
+        # Act
+        async def run():
+            try:
+                return await asyncio.gather(*(async_rag.chat(f'问题{i}') for i in range(30)))
+            finally:
+                await async_rag.close()
+
+        start = time.monotonic()
+        results = asyncio.run(run())
+        elapsed = time.monotonic() - start
+
+        # Assert
+        assert all(result['answer'] == FAKE_ANSWER for result in results)
+        # 每个回答分 7 段流式返回，串行需要 30 * 0.7 秒
+        assert elapsed < 3
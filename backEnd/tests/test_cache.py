@@ -0,0 +1,255 @@
+"""
+缓存工具测试
+测试 LRU 淘汰、过期时间、查询向量缓存和知识库配置缓存
+"""
+import os
+import time
+
+import pytest
+from utils.answer_cache import AnswerCache
+from utils.cache import LRUCache
+from utils.embedding_cache import QueryEmbeddingCache
+from utils.kb_settings import KnowledgeBaseSettingsCache
+from utils.user_cache import AuthCache
+
+
+@pytest.mark.unit
+class TestLRUCache:
+    """LRU 缓存测试类"""
+
+    def test_evicts_least_recently_used(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert cache.stats()['evictions'] == 1
+
+    def test_ttl_expiry(self, mocker):
+        """测试条目过期"""
+        clock = mocker.patch('utils.cache.time.monotonic', return_value=100.0)
+        cache = LRUCache(max_size=10, ttl=5)
+        cache.set('a', 1)
+
+        clock.return_value = 104.0
+        assert cache.get('a') == 1
+
+        clock.return_value = 106.0
+        assert cache.get('a') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+
+@pytest.mark.unit
+class TestQueryEmbeddingCache:
+    """查询向量缓存测试类"""
+
+    def test_normalized_key(self):
+        """测试空白、大小写和全角差异命中同一条目"""
+        cache = QueryEmbeddingCache(max_size=10)
+        cache.set('embed', '  What is  C30 ？', [0.1, 0.2])
+
+        assert cache.get('embed', 'what is c30 ?') == [0.1, 0.2]
+        assert cache.get('other-model', 'what is c30 ?') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_disk_persistence(self, tmp_path):
+        """测试共享磁盘缓存在进程间复用"""
+        writer = QueryEmbeddingCache(max_size=10, persist_dir=str(tmp_path))
+        writer.set('embed', '混凝土强度', [1.0, 2.0])
+
+        reader = QueryEmbeddingCache(max_size=10, persist_dir=str(tmp_path))
+        assert reader.get('embed', '混凝土强度') == [1.0, 2.0]
+        assert reader.stats()['diskHits'] == 1
+
+    def test_disk_entry_expired(self, tmp_path, mocker):
+        """测试磁盘缓存过期"""
+        clock = mocker.patch('utils.embedding_cache.time.time', return_value=1000.0)
+        writer = QueryEmbeddingCache(max_size=10, ttl=60, persist_dir=str(tmp_path))
+        writer.set('embed', '混凝土强度', [1.0])
+
+        clock.return_value = 1100.0
+        reader = QueryEmbeddingCache(max_size=10, ttl=60, persist_dir=str(tmp_path))
+        assert reader.get('embed', '混凝土强度') is None
+
+    def test_prune_removes_expired_entries_at_startup(self, tmp_path):
+        """测试启动时删除过期的磁盘条目和遗留的临时文件"""
+        writer = QueryEmbeddingCache(max_size=10, ttl=60, persist_dir=str(tmp_path))
+        writer.set('embed', '过期问题', [1.0])
+        writer.set('embed', '有效问题', [2.0])
+        stale = writer._disk_path(writer.make_key('embed', '过期问题'))
+        leftover = tmp_path / 'ab' / 'leftover.tmp'
+        leftover.parent.mkdir(exist_ok=True)
+        leftover.write_text('{')
+        old = time.time() - 7200
+        os.utime(stale, (old, old))
+        os.utime(leftover, (old, old))
+
+        reader = QueryEmbeddingCache(max_size=10, ttl=60, persist_dir=str(tmp_path))
+
+        assert not os.path.exists(stale)
+        assert not leftover.exists()
+        assert reader.get('embed', '有效问题') == [2.0]
+
+    def test_prune_keeps_newest_entries_within_limit(self, tmp_path, mocker):
+        """测试条目数超过上限时删除最旧的条目"""
+        cache = QueryEmbeddingCache(max_size=10, ttl=0, persist_dir=str(tmp_path), max_disk_entries=10)
+        mocker.patch.object(cache, '_maybe_prune')
+        now = time.time()
+        for i in range(15):
+            cache.set('embed', f'问题{i}', [float(i)])
+            path = cache._disk_path(cache.make_key('embed', f'问题{i}'))
+            os.utime(path, (now - 100 + i, now - 100 + i))
+
+        removed = cache.prune()
+
+        reader = QueryEmbeddingCache(max_size=10, ttl=0, persist_dir=str(tmp_path), max_disk_entries=0)
+        assert removed == 6
+        assert reader.get('embed', '问题5') is None
+        assert reader.get('embed', '问题6') == [6.0]
+        assert reader.get('embed', '问题14') == [14.0]
+
+    def test_write_triggers_background_prune(self, tmp_path, mocker):
+        """测试写入达到间隔后在后台线程中清理磁盘缓存"""
+        cache = QueryEmbeddingCache(max_size=10, persist_dir=str(tmp_path), prune_interval=0)
+        prune = mocker.patch.object(cache, 'prune', return_value=0)
+        thread = mocker.patch('utils.embedding_cache.threading.Thread')
+        thread.return_value.start.side_effect = lambda: cache._prune_in_background()
+
+        cache.set('embed', '混凝土强度', [1.0])
+
+        assert prune.call_count == 1
+        assert thread.call_args.kwargs['daemon'] is True
+        assert cache._pruning is False
+
+    def test_rag_service_skips_embedding_on_hit(self, app, mocker):
+        """测试查询命中缓存时不再请求嵌入接口"""
+        from utils.rag_service import rag_service
+        mocker.patch.object(rag_service, 'query_embedding_cache', QueryEmbeddingCache(max_size=10))
+        mock_embed = mocker.patch.object(rag_service, 'get_embeddings', return_value=[[0.5, 0.5]])
+
+        with app.app_context():
+            first = rag_service.get_query_embedding('C30 混凝土')
+            second = rag_service.get_query_embedding('c30  混凝土')
+
+        assert first == second == [0.5, 0.5]
+        assert mock_embed.call_count == 1
+
+
+@pytest.mark.unit
+class TestKnowledgeBaseSettingsCache:
+    """知识库配置缓存测试类"""
+
+    def test_cached_until_invalidated(self, app, db_session, knowledge_base, embedding_model):
+        """测试命中缓存时不查询数据库，失效后重新读取"""
+        # Arrange
+        cache = KnowledgeBaseSettingsCache(max_size=10, ttl=None)
+        knowledge_base.top_k = 4
+        knowledge_base.vector_model_id = embedding_model.id
+        db_session.session.commit()
+
+        # Act
+        first = cache.get(knowledge_base.id)
+        knowledge_base.top_k = 9
+        db_session.session.commit()
+        cached = cache.get(knowledge_base.id)
+        cache.invalidate(knowledge_base.id)
+        refreshed = cache.get(knowledge_base.id)
+
+        # Assert
+        assert first['top_k'] == cached['top_k'] == 4
+        assert first['embedding_model'] == embedding_model.name
+        assert refreshed['top_k'] == 9
+        assert cache.get('kb_missing') is None
+        assert cache.stats()['settings']['hits'] == 1
+
+
+@pytest.mark.unit
+class TestAnswerCache:
+    """问答结果缓存测试类"""
+
+    def test_exact_and_semantic_hits(self):
+        """测试归一化问题精确命中，相近问题在相同上下文下语义命中"""
+        # Arrange
+        cache = AnswerCache(max_size=10, ttl=None, semantic_threshold=0.95)
+        cache.set(['kb_1'], 'llm', ['c1', 'c2'], '通风设施 检查周期？', '每班检查一次',
+                  [{'chunkId': 'c1'}], query_embedding=[1.0, 0.0, 0.1])
+
+        # Act
+        exact = cache.get(['kb_1'], 'llm', ['c2', 'c1'], '  通风设施  检查周期？ ')
+        semantic = cache.get(['kb_1'], 'llm', ['c1', 'c2'], '通风设施多久检查一次',
+                             query_embedding=[0.98, 0.0, 0.12])
+        other_context = cache.get(['kb_1'], 'llm', ['c1', 'c3'], '通风设施多久检查一次',
+                                  query_embedding=[0.98, 0.0, 0.12])
+        other_model = cache.get(['kb_1'], 'llm-2', ['c1', 'c2'], '通风设施 检查周期？')
+
+        # Assert
+        assert exact == {'answer': '每班检查一次', 'references': [{'chunkId': 'c1'}]}
+        assert semantic['answer'] == '每班检查一次'
+        assert other_context is None
+        assert other_model is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['semanticHits'], stats['misses']) == (1, 1, 2)
+
+    def test_invalidated_by_knowledge_base_change(self):
+        """测试知识库变更后本库及包含本库的全部知识库答案失效"""
+        # Arrange
+        cache = AnswerCache(max_size=10, ttl=None)
+        cache.set(['kb_1'], 'llm', ['c1'], '问题', '答案一', [])
+        cache.set(['kb_1', 'kb_2'], 'llm', ['c1'], '问题', '答案二', [])
+        cache.set(['kb_3'], 'llm', ['c1'], '问题', '答案三', [])
+
+        # Act
+        cache.invalidate('kb_1')
+
+        # Assert
+        assert cache.get(['kb_1'], 'llm', ['c1'], '问题') is None
+        assert cache.get(['kb_2', 'kb_1'], 'llm', ['c1'], '问题') is None
+        assert cache.get(['kb_3'], 'llm', ['c1'], '问题')['answer'] == '答案三'
+
+
+@pytest.mark.unit
+class TestAuthCache:
+    """登录用户缓存测试类"""
+
+    def test_user_snapshot_cached_until_invalidated(self, app, db_session, normal_user):
+        """测试命中缓存时不查询用户表，失效后读取新的角色"""
+        # Arrange
+        cache = AuthCache(user_size=10, user_ttl=60)
+
+        # Act
+        first = cache.get_user(normal_user.id)
+        normal_user.role = 'admin'
+        db_session.session.commit()
+        cached = cache.get_user(normal_user.id)
+        cache.invalidate_user(normal_user.id)
+        refreshed = cache.get_user(normal_user.id)
+
+        # Assert
+        assert first is cached
+        assert not cached.is_admin()
+        assert refreshed.is_admin()
+        assert cache.get_user('user_missing') is None
+        assert cache.stats()['users']['hits'] == 1
+
+    def test_payload_not_served_after_exp(self, mocker):
+        """测试 token 载荷命中缓存，超过 exp 后不再返回"""
+        # Arrange
+        cache = AuthCache()
+        clock = mocker.patch('utils.user_cache.time.time', return_value=1000.0)
+        cache.set_payload('token-a', {'user_id': 'user_1', 'exp': 1060})
+
+        # Act
+        hit = cache.get_payload('token-a')
+        clock.return_value = 1060.0
+        expired = cache.get_payload('token-a')
+
+        # Assert
+        assert hit == {'user_id': 'user_1', 'exp': 1060}
+        assert expired is None
+        assert cache.get_payload('token-b') is None
@@ -2,7 +2,9 @@
 聊天对话API测试
 测试会话管理、消息发送等功能
 """
+import json
 import pytest
+from api.chat import TRUNCATED_NOTICE
 
 
 @pytest.mark.api
@@ -108,6 +110,95 @@ class TestChatAPI:
         assert 'answer' in json_data['body']
         assert 'references' in json_data['body']
     
+    def test_send_message_uses_kb_settings(self, client, db_session, auth_headers_user, auth_headers_admin,
+                                           chat_session, knowledge_base, embedding_model, mocker):
+        """测试问答使用知识库的检索配置，/update 后立即生效"""
+        # Arrange
+        knowledge_base.top_k = 3
+        knowledge_base.similarity_threshold = 0.4
+        knowledge_base.vector_model_id = embedding_model.id
+        db_session.session.commit()
+        mock_chat = mocker.patch('utils.rag_service.rag_service.chat',
+                                 return_value={'answer': '答案', 'references': []})
+        data = {'sessionId': chat_session.id, 'question': '通风设施检查周期'}
+        
+        # Act
+        client.post('/api/chat/message/send', json=data, headers=auth_headers_user)
+        client.post('/api/knowledge-base/update',
+                    json={'id': knowledge_base.id, 'topK': 8},
+                    headers=auth_headers_admin)
+        client.post('/api/chat/message/send', json=data, headers=auth_headers_user)
+        
+        # Assert
+        first, second = [call.kwargs for call in mock_chat.call_args_list]
+        assert first['top_k'] == 3
+        assert first['similarity_threshold'] == 0.4
+        assert first['embedding_model'] == embedding_model.name
+        assert second['top_k'] == 8
+    
+    def test_send_message_all_knowledge_bases(self, client, db_session, auth_headers_user, chat_session,
+                                              knowledge_base, admin_user, mocker):
+        """测试全部知识库模式检索用户可访问的所有知识库"""
+        # Arrange
+        from models.knowledge_base import KnowledgeBase
+        from utils.helpers import generate_id
+        private_kb = KnowledgeBase(
+            id=generate_id('kb'), name='私有知识库', code='private_kb',
+            visible='private', status='active', created_by=admin_user.id
+        )
+        db_session.session.add(private_kb)
+        chat_session.knowledge_base_id = None
+        db_session.session.commit()
+        mock_chat = mocker.patch('utils.rag_service.rag_service.chat',
+                                 return_value={'answer': '答案', 'references': []})
+        
+        # Act
+        response = client.post('/api/chat/message/send',
+                               json={'sessionId': chat_session.id, 'question': '通风设施检查周期'},
+                               headers=auth_headers_user)
+        
+        # Assert
+        assert response.status_code == 200
+        kwargs = mock_chat.call_args.kwargs
+        assert kwargs['kb_id'] is None
+        assert kwargs['kb_ids'] == [knowledge_base.id]
+        assert kwargs['embedding_models'] == {knowledge_base.id: None}
+    
+    def test_all_knowledge_bases_resolves_each_model_once(self, client, db_session, auth_headers_user,
+                                                          chat_session, admin_user, embedding_model, mocker):
+        """测试全部知识库模式一次查询取出向量模型，同一模型只解析一次名称"""
+        # Arrange
+        from models.knowledge_base import KnowledgeBase
+        from utils.helpers import generate_id
+        from utils.kb_settings import kb_settings_cache
+        kb_ids = []
+        for i in range(4):
+            kb_id = generate_id('kb')
+            kb_ids.append(kb_id)
+            db_session.session.add(KnowledgeBase(
+                id=kb_id, name=f'公开知识库{i}', code=f'public_{kb_id}', visible='all', status='active',
+                vector_model_id=embedding_model.id, created_by=admin_user.id
+            ))
+        chat_session.knowledge_base_id = None
+        db_session.session.commit()
+        kb_settings_cache.invalidate_model()
+        get_settings = mocker.spy(kb_settings_cache, 'get')
+        get_model_name = mocker.spy(kb_settings_cache, 'get_model_name')
+        mock_chat = mocker.patch('utils.rag_service.rag_service.chat',
+                                 return_value={'answer': '答案', 'references': []})
+        
+        # Act
+        client.post('/api/chat/message/send',
+                    json={'sessionId': chat_session.id, 'question': '通风设施检查周期'},
+                    headers=auth_headers_user)
+        
+        # Assert
+        embedding_models = mock_chat.call_args.kwargs['embedding_models']
+        assert all(embedding_models[kb_id] == embedding_model.name for kb_id in kb_ids)
+        assert [call.args[0] for call in get_settings.call_args_list] == [None]
+        model_lookups = [call.args[0] for call in get_model_name.call_args_list]
+        assert model_lookups.count(embedding_model.id) == 1
+    
     def test_send_message_too_long(self, client, db_session, auth_headers_user, chat_session):
         """测试问题过长"""
         # Arrange
@@ -198,3 +289,127 @@ class TestChatAPI:
         assert json_data['error'] == 0
 
 
+    def test_stream_message(self, client, db_session, auth_headers_user, chat_session, mocker):
+        """测试流式发送消息"""
+        # Arrange
+        from models.chat import ChatMessage
+        mocker.patch('utils.rag_service.rag_service.search_documents', return_value=[{
+            'id': 'doc_1_chunk_0',
+            'content': '混凝土强度等级不应低于C30',
+            'metadata': {'document_id': 'doc_1', 'document_name': '规范.pdf'},
+            'similarity': 0.9
+        }])
+        mocker.patch('utils.rag_service.rag_service.generate_answer_stream',
+                     return_value=iter(['不应', '低于', 'C30']))
+        data = {
+            'sessionId': chat_session.id,
+            'question': '混凝土强度等级要求？'
+        }
+        
+        # Act
+        response = client.post('/api/chat/message/stream',
+                              json=data,
+                              headers=auth_headers_user)
+        body = response.get_data(as_text=True)
+        
+        # Assert
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        events = [block.split('\n')[0] for block in body.strip().split('\n\n')]
+        assert events == [
+            'event: references',
+            'event: token',
+            'event: token',
+            'event: token',
+            'event: done'
+        ]
+        
+        answer = ChatMessage.query.filter_by(session_id=chat_session.id, role='assistant').first()
+        assert answer.content == '不应低于C30'
+        assert answer.references[0]['documentId'] == 'doc_1'
+    
+    def test_stream_message_llm_error(self, client, db_session, auth_headers_user, chat_session, mocker):
+        """测试流式生成失败时返回错误事件并保存兜底回答"""
+        # Arrange
+        from models.chat import ChatMessage
+        mocker.patch('utils.rag_service.rag_service.search_documents', return_value=[])
+        mocker.patch('utils.rag_service.rag_service.generate_answer_stream',
+                     side_effect=RuntimeError('LLM 不可用'))
+        
+        # Act
+        response = client.post('/api/chat/message/stream',
+                              json={'sessionId': chat_session.id, 'question': '测试问题'},
+                              headers=auth_headers_user)
+        body = response.get_data(as_text=True)
+        
+        # Assert
+        assert 'event: error' in body
+        assert 'event: done' in body
+        answer = ChatMessage.query.filter_by(session_id=chat_session.id, role='assistant').first()
+        assert answer.content.startswith('抱歉')
+    
+    def test_stream_message_llm_error_midway(self, client, db_session, auth_headers_user, chat_session, mocker):
+        """测试流式生成中途失败时返回错误事件，保存的回答带有中断说明"""
+        # Arrange
+        from models.chat import ChatMessage
+        
+        def broken_stream(*args, **kwargs):
+            yield '井下作业前'
+            raise RuntimeError('连接中断')
+        
+        mocker.patch('utils.rag_service.rag_service.search_documents', return_value=[])
+        mocker.patch('utils.rag_service.rag_service.generate_answer_stream', side_effect=broken_stream)
+        
+        # Act
+        response = client.post('/api/chat/message/stream',
+                              json={'sessionId': chat_session.id, 'question': '测试问题'},
+                              headers=auth_headers_user)
+        body = response.get_data(as_text=True)
+        
+        # Assert
+        blocks = body.strip().split('\n\n')
+        events = [block.split('\n')[0] for block in blocks]
+        assert events[-3:] == ['event: token', 'event: error', 'event: done']
+        assert json.loads(blocks[-2].split('data: ', 1)[1])['truncated'] is True
+        assert json.loads(blocks[-1].split('data: ', 1)[1])['truncated'] is True
+        answer = ChatMessage.query.filter_by(session_id=chat_session.id, role='assistant').first()
+        assert answer.content.startswith('井下作业前')
+        assert answer.content.endswith(TRUNCATED_NOTICE)
+    
+    def test_stream_message_client_disconnect(self, client, db_session, auth_headers_user, chat_session, mocker):
+        """测试客户端在第一个词元后断开时，保存带中断说明的部分回答"""
+        # Arrange
+        from models.chat import ChatMessage
+        
+        def endless_stream(*args, **kwargs):
+            yield '井下作业前'
+            yield '必须检查通风设备'
+            raise AssertionError('客户端断开后不应继续生成')
+        
+        mocker.patch('utils.rag_service.rag_service.search_documents', return_value=[])
+        mocker.patch('utils.rag_service.rag_service.generate_answer_stream', side_effect=endless_stream)
+        
+        # Act
+        response = client.post('/api/chat/message/stream',
+                              json={'sessionId': chat_session.id, 'question': '测试问题'},
+                              headers=auth_headers_user,
+                              buffered=False)
+        chunks = iter(response.response)
+        received = b''
+        while b'event: token' not in received:
+            received += next(chunks)
+        response.close()
+        
+        # Assert
+        answer = ChatMessage.query.filter_by(session_id=chat_session.id, role='assistant').first()
+        assert answer is not None
+        assert answer.content == '井下作业前' + TRUNCATED_NOTICE
+    
+    def test_stream_message_session_not_found(self, client, db_session, auth_headers_user):
+        """测试流式发送消息时会话不存在"""
+        response = client.post('/api/chat/message/stream',
+                              json={'sessionId': 'nonexistent', 'question': '测试问题'},
+                              headers=auth_headers_user)
+        
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 3003
@@ -58,3 +58,27 @@ class TestDashboardAPI:
         assert json_data['error'] == 0
 
 
+    
+    def test_get_cache_stats(self, client, db_session, auth_headers_admin):
+        """测试获取缓存统计"""
+        # Act
+        response = client.post('/api/dashboard/cache-stats', headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 200
+        json_data = response.get_json()
+        assert json_data['error'] == 0
+        assert 'hits' in json_data['body']['queryEmbedding']
+        assert 'misses' in json_data['body']['queryEmbedding']
+    
+    def test_get_http_pool_stats(self, client, db_session, auth_headers_admin):
+        """测试获取模型服务连接池统计"""
+        # Act
+        response = client.post('/api/dashboard/http-pool-stats', headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 200
+        json_data = response.get_json()
+        assert json_data['error'] == 0
+        assert 'requests' in json_data['body']
+        assert isinstance(json_data['body']['pools'], list)
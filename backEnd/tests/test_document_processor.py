@@ -0,0 +1,251 @@
+"""
+文档处理测试
+测试 PDF 按页提取、流式清理分块和分块元数据
+"""
+import random
+import pytest
+from utils.document_processor import DocumentProcessor, SpooledChunks, extract_and_chunk
+from benchmarks.bench_split_text import legacy_split_text
+
+
+def make_pdf(page_texts):
+    """生成每页一行 ASCII 文本的最小 PDF"""
+    objects = []
+    page_count = len(page_texts)
+    kids = ' '.join(f'{4 + i * 2} 0 R' for i in range(page_count))
+    objects.append(b'<< /Type /Catalog /Pages 2 0 R >>')
+    objects.append(f'<< /Type /Pages /Kids [{kids}] /Count {page_count} >>'.encode())
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    for text in page_texts:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents ' +
+            f'{5 + (len(objects) - 3)} 0 R >>'.encode()
+        )
+        objects.append(
+            f'<< /Length {len(stream)} >>\nstream\n'.encode() + stream + b'\nendstream'
+        )
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        output += f'{offset:010d} 00000 n \n'.encode()
+    output += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(output)
+
+
+@pytest.mark.unit
+class TestPdfPages:
+    """PDF 按页提取测试类"""
+
+    def test_extract_pdf_page_range(self, tmp_path):
+        """测试只提取指定页码区间"""
+        # Arrange
+        pdf_path = tmp_path / 'spec.pdf'
+        pdf_path.write_bytes(make_pdf([f'Page {i} content' for i in range(1, 6)]))
+
+        # Act
+        pages = DocumentProcessor.extract_pdf_pages(str(pdf_path), 1, 3)
+
+        # Assert
+        assert DocumentProcessor.get_pdf_page_count(str(pdf_path)) == 5
+        assert pages == ['Page 2 content', 'Page 3 content']
+
+
+    def test_extract_and_chunk_pdf_sets_page_numbers(self, tmp_path):
+        """测试 PDF 分块元数据包含页码并返回页数"""
+        # Arrange
+        pdf_path = tmp_path / 'spec.pdf'
+        pdf_path.write_bytes(make_pdf([f'Clause {i} ' + 'x' * 40 for i in range(1, 5)]))
+
+        # Act
+        spool_path, chunk_count, page_count = extract_and_chunk(
+            str(pdf_path), 'pdf', 'doc1', 'spec.pdf', 'kb1', chunk_size=60, chunk_overlap=0,
+            spool_dir=str(tmp_path)
+        )
+        chunks = list(SpooledChunks(spool_path))
+
+        # Assert
+        assert page_count == 4
+        assert chunk_count == len(chunks)
+        assert not (tmp_path / spool_path).exists()
+        assert [chunk['metadata']['page_number'] for chunk in chunks] == [1, 2, 3, 4]
+        assert ' '.join(chunk['content'] for chunk in chunks) == \
+            ' '.join(f'Clause {i} ' + 'x' * 40 for i in range(1, 5))
+
+
+def split_pieces(text, rng):
+    """把文本随机切成片段，模拟按页、按段或按块读取"""
+    pieces = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 40)
+        pieces.append((text[position:position + size], None))
+        position += size
+    return pieces
+
+
+@pytest.mark.unit
+class TestStreamingPipeline:
+    """流式清理和分块测试类"""
+
+    SAMPLE = (
+        '  第一章 总则\n\n 1.0.1 为了在煤矿井下   安全生产中贯彻执行国家的技术经济政策，\t\r\n'
+        '制定本规范。©®  \n\n1.0.2 本规范适用于 GB50021-2001 所列工程！ 附录A（资料性）；'
+        '  ★  说明：  \n' * 12
+    )
+
+    def test_iter_clean_text_matches_clean_text(self):
+        """测试任意切分的流式清理结果与整体清理一致"""
+        rng = random.Random(7)
+        for _ in range(50):
+            pieces = split_pieces(self.SAMPLE, rng)
+            streamed = ''.join(piece for piece, _ in DocumentProcessor.iter_clean_text(pieces))
+            assert streamed == DocumentProcessor._clean_text(self.SAMPLE)
+
+    @pytest.mark.parametrize('chunk_size,chunk_overlap', [(500, 50), (120, 30), (80, 0), (60, 20)])
+    def test_iter_split_text_matches_split_text(self, chunk_size, chunk_overlap):
+        """测试流式分块结果与对清理后全文分块一致"""
+        rng = random.Random(chunk_size)
+        cleaned = DocumentProcessor._clean_text(self.SAMPLE)
+        expected = DocumentProcessor.split_text(cleaned, chunk_size, chunk_overlap)
+
+        pieces = DocumentProcessor.iter_clean_text(split_pieces(self.SAMPLE, rng))
+        streamed = [chunk for chunk, _ in DocumentProcessor.iter_split_text(pieces, chunk_size, chunk_overlap)]
+
+        assert streamed == expected
+
+    def test_iter_chunks_rejects_short_text(self):
+        """测试清理后内容过短时报错且不输出文本块"""
+        chunks = DocumentProcessor.iter_chunks_with_metadata([(' ©® 短 ', None)], 'doc1', 'a.txt', 'kb1')
+
+        with pytest.raises(ValueError):
+            next(chunks)
+
+    def test_txt_pieces_detect_gbk(self, tmp_path):
+        """测试流式读取 GBK 编码的 TXT 文件"""
+        txt_path = tmp_path / 'gbk.txt'
+        txt_path.write_bytes('矿井提升机检修规程'.encode('gbk'))
+
+        assert DocumentProcessor.detect_encoding(str(txt_path)) == 'gbk'
+        assert DocumentProcessor.extract_text(str(txt_path)) == '矿井提升机检修规程'
+
+
+@pytest.mark.unit
+class TestSplitText:
+    """基于偏移的分块测试类"""
+
+    @staticmethod
+    def make_text(rng):
+        """生成长短段落混合、含空行和首尾空白的文本"""
+        sentences = ['井下作业前必须检查通风设备。', '瓦斯浓度超限时立即停止作业！', '确认安全后方可进入工作面；', 'GB50021-2001 规范要求。']
+        paragraphs = []
+        for _ in range(40):
+            count = rng.choice([0, 1, 2, 5, 20, 60])
+            paragraphs.append('  ' + ''.join(rng.choice(sentences) for _ in range(count)) + ' ')
+        return '\n'.join(paragraphs)
+
+    @pytest.mark.parametrize('chunk_size,chunk_overlap', [(500, 50), (200, 0), (120, 30), (61, 30)])
+    def test_compat_matches_legacy(self, chunk_size, chunk_overlap):
+        """测试兼容模式下分块边界与旧版实现一致"""
+        # Arrange
+        rng = random.Random(chunk_size + chunk_overlap)
+        texts = [self.make_text(rng) for _ in range(10)]
+
+        # Act & Assert
+        for text in texts:
+            assert DocumentProcessor.split_text(text, chunk_size, chunk_overlap) == \
+                legacy_split_text(text, chunk_size, chunk_overlap)
+
+    def test_non_compat_respects_chunk_size(self):
+        """测试关闭兼容模式后块长度不超过 chunk_size"""
+        # Arrange
+        text = self.make_text(random.Random(3))
+
+        # Act
+        chunks = DocumentProcessor.split_text(text, 100, 20, compat=False)
+
+        # Assert
+        assert chunks
+        assert max(len(chunk) for chunk in chunks) <= 100
+
+    def test_overlap_not_less_than_split_point(self):
+        """测试重叠不小于分割点时仍能正常结束"""
+        # Arrange
+        text = '煤' * 1000
+
+        # Act
+        chunks = DocumentProcessor.split_text(text, 60, 60)
+
+        # Assert
+        assert ''.join(chunks) == text
+
+
+def train_tokenizer(path, texts):
+    """在本地训练一个小型 BPE 分词器并保存为 tokenizer.json"""
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+
+    tokenizer = Tokenizer(models.BPE(unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train_from_iterator(texts, trainers.BpeTrainer(vocab_size=300, special_tokens=['[UNK]']))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tokenizer.save(str(path))
+
+
+@pytest.mark.unit
+class TestTokenChunking:
+    """按词元数分块测试类"""
+
+    SAMPLE = '井下作业前必须检查通风设备和瓦斯浓度。Check the ventilation before entering, 120 m3/min. ' * 60
+
+    def test_chunks_respect_token_budget(self):
+        """测试块的词元数不超过 chunk_size，且 token_count 与重新分词一致"""
+        # Arrange
+        from utils.tokenizer import TokenCounter
+        counter = TokenCounter('unknown-model')
+        pieces = [(self.SAMPLE[i:i + 37], None) for i in range(0, len(self.SAMPLE), 37)]
+
+        # Act
+        chunks = list(DocumentProcessor.iter_chunks_with_metadata(
+            pieces, 'doc1', 'a.txt', 'kb1', chunk_size=100, chunk_overlap=20, token_counter=counter
+        ))
+
+        # Assert
+        token_counts = [chunk['metadata']['token_count'] for chunk in chunks]
+        assert len(chunks) > 1
+        assert max(token_counts) <= 100
+        assert token_counts == [counter.count(chunk['content']) for chunk in chunks]
+        assert chunks[0]['content'].startswith('井下作业前')
+        assert chunks[-1]['content'].endswith('min.')
+
+    def test_loads_model_tokenizer(self, tmp_path):
+        """测试按模型名从目录中加载分词器，序列化后在同一进程内复用"""
+        # Arrange
+        import pickle
+        from utils.tokenizer import get_token_counter
+        train_tokenizer(tmp_path / 'acme__Embed-1B' / 'tokenizer.json', [self.SAMPLE])
+
+        # Act
+        counter = get_token_counter('acme/Embed-1B:Q4_K_M', str(tmp_path))
+        chunks = list(DocumentProcessor.iter_split_tokens([(self.SAMPLE, 1)], counter, 50, 10))
+
+        # Assert
+        assert counter.exact
+        assert pickle.loads(pickle.dumps(counter)) is counter
+        assert all(0 < token_count <= 50 for _, _, token_count in chunks)
+        assert all(page == 1 for _, page, _ in chunks)
+
+    def test_missing_tokenizer_falls_back_to_estimate(self, tmp_path):
+        """测试找不到分词器时按字符类别估算"""
+        from utils.tokenizer import get_token_counter
+
+        counter = get_token_counter('acme/missing', str(tmp_path))
+
+        assert not counter.exact
+        assert counter.count('煤矿 abcdefgh 12345') == 2 + 2 + 2
@@ -0,0 +1,111 @@
+"""
+批量嵌入客户端测试
+测试分批、并发结果顺序、失败批次重试等功能
+"""
+import threading
+import pytest
+import requests
+from utils.embedding_client import OllamaEmbeddingClient, EmbeddingError
+
+
+class FakeResponse:
+    """模拟 requests 响应"""
+
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error')
+
+    def json(self):
+        return self.payload
+
+
+def fake_embed(url, json=None, timeout=None, retry=True):
+    """每个文本返回 [len(text)] 作为向量"""
+    return FakeResponse({'embeddings': [[float(len(text))] for text in json['input']]})
+
+
+@pytest.mark.unit
+class TestOllamaEmbeddingClient:
+    """批量嵌入客户端测试类"""
+
+    def test_embed_batches_and_keeps_order(self, mocker):
+        """测试分批请求且结果保持输入顺序"""
+        # Arrange
+        mock_post = mocker.patch('utils.embedding_client.default_http_client.post', side_effect=fake_embed)
+        client = OllamaEmbeddingClient('http://ollama:11434', 'embed-model', batch_size=3, max_workers=4)
+        texts = ['a' * i for i in range(1, 11)]
+
+        # Act
+        embeddings = client.embed(texts)
+
+        # Assert
+        assert embeddings == [[float(i)] for i in range(1, 11)]
+        assert mock_post.call_count == 4
+        first_call = mock_post.call_args_list[0]
+        assert first_call.args[0] == 'http://ollama:11434/api/embed'
+        assert first_call.kwargs['json']['model'] == 'embed-model'
+        assert first_call.kwargs['retry'] is False
+
+    def test_embed_empty(self, mocker):
+        """测试空输入不发送请求"""
+        mock_post = mocker.patch('utils.embedding_client.default_http_client.post')
+        client = OllamaEmbeddingClient('http://ollama:11434', 'embed-model')
+
+        assert client.embed([]) == []
+        mock_post.assert_not_called()
+
+    def test_retry_only_failed_batches(self, mocker):
+        """测试只重试失败的批次"""
+        # Arrange
+        calls = []
+        lock = threading.Lock()
+        failed_once = set()
+
+        def flaky_embed(url, json=None, timeout=None, retry=True):
+            batch = tuple(json['input'])
+            with lock:
+                calls.append(batch)
+                if batch == ('c', 'd') and batch not in failed_once:
+                    failed_once.add(batch)
+                    return FakeResponse({}, status_code=500)
+            return fake_embed(url, json=json, timeout=timeout)
+
+        mocker.patch('utils.embedding_client.default_http_client.post', side_effect=flaky_embed)
+        mocker.patch('utils.embedding_client.time.sleep')
+        client = OllamaEmbeddingClient('http://ollama:11434', 'embed-model', batch_size=2, max_retries=2)
+
+        # Act
+        embeddings = client.embed(['a', 'b', 'c', 'd', 'e'])
+
+        # Assert
+        assert len(embeddings) == 5
+        assert calls.count(('a', 'b')) == 1
+        assert calls.count(('c', 'd')) == 2
+        assert calls.count(('e',)) == 1
+
+    def test_raise_after_retries_exhausted(self, mocker):
+        """测试重试耗尽后抛出异常"""
+        mocker.patch(
+            'utils.embedding_client.default_http_client.post',
+            return_value=FakeResponse({}, status_code=500)
+        )
+        mocker.patch('utils.embedding_client.time.sleep')
+        client = OllamaEmbeddingClient('http://ollama:11434', 'embed-model', batch_size=2, max_retries=1)
+
+        with pytest.raises(EmbeddingError):
+            client.embed(['a', 'b', 'c'])
+
+    def test_mismatched_embedding_count(self, mocker):
+        """测试返回数量不匹配视为失败"""
+        mocker.patch(
+            'utils.embedding_client.default_http_client.post',
+            return_value=FakeResponse({'embeddings': [[1.0]]})
+        )
+        client = OllamaEmbeddingClient('http://ollama:11434', 'embed-model', batch_size=4, max_retries=0)
+
+        with pytest.raises(EmbeddingError):
+            client.embed(['a', 'b'])
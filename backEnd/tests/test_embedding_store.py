@@ -0,0 +1,89 @@
+"""
+文本块向量存储测试
+测试内容哈希去重和入库时的向量复用
+"""
+import uuid
+import pytest
+from utils.embedding_store import EmbeddingStore
+
+
+@pytest.mark.unit
+class TestEmbeddingStore:
+    """文本块向量存储测试类"""
+
+    def test_round_trip(self, tmp_path):
+        """测试按内容哈希存取向量"""
+        store = EmbeddingStore(str(tmp_path / 'embeddings.db'))
+        model = f'embed-{uuid.uuid4().hex[:8]}'
+        key = EmbeddingStore.content_hash(model, '第一条')
+
+        store.put_many(model, {key: [0.1, 0.2, 0.3]})
+        found = store.get_many(model, [key, EmbeddingStore.content_hash(model, '第二条')])
+
+        assert list(found) == [key]
+        assert found[key] == pytest.approx([0.1, 0.2, 0.3])
+        assert store.stats()['hits'] == 1
+        assert store.stats()['misses'] == 1
+
+    def test_get_many_filters_by_model(self, tmp_path):
+        """测试只返回同一模型的向量"""
+        store = EmbeddingStore(str(tmp_path / 'embeddings.db'))
+        key = EmbeddingStore.content_hash('model-a', '第一条')
+        store.put_many('model-a', {key: [1.0, 2.0]})
+
+        assert store.get_many('model-b', [key]) == {}
+        assert store.delete_many([key]) == 1
+        assert store.count() == 0
+
+    def test_hash_depends_on_model(self):
+        """测试不同模型的同一文本哈希不同"""
+        assert EmbeddingStore.content_hash('a', '文本') != EmbeddingStore.content_hash('b', '文本')
+
+    def test_add_documents_reuses_embeddings(self, app, rag, mocker):
+        """测试重复文本块跨文档、跨知识库只计算一次向量"""
+        mock_embed = mocker.patch.object(
+            rag, 'get_embeddings',
+            side_effect=lambda texts, model=None: [[float(len(text)), 1.0] for text in texts]
+        )
+
+        def chunks(doc_id, kb_id):
+            return [
+                {'id': f'{doc_id}_chunk_{i}', 'content': text, 'metadata': {'document_id': doc_id, 'kb_id': kb_id}}
+                for i, text in enumerate(['桩基础', '钢筋保护层', '桩基础'])
+            ]
+
+        with app.app_context():
+            rag.add_documents(f'kb_a_{uuid.uuid4().hex[:6]}', chunks('doc_a', 'kb_a'))
+            rag.add_documents(f'kb_b_{uuid.uuid4().hex[:6]}', chunks('doc_b', 'kb_b'))
+
+        assert mock_embed.call_count == 1
+        assert sorted(mock_embed.call_args.args[0]) == sorted(['桩基础', '钢筋保护层'])
+
+    def test_delete_releases_unreferenced_embeddings(self, app, rag, mocker):
+        """测试删除文档、知识库后清理不再引用的向量，仍被其他知识库引用的向量保留"""
+        mocker.patch.object(
+            rag, 'get_embeddings',
+            side_effect=lambda texts, model=None: [[float(len(text)), 1.0] for text in texts]
+        )
+        kb_a = f'kb_a_{uuid.uuid4().hex[:6]}'
+        kb_b = f'kb_b_{uuid.uuid4().hex[:6]}'
+        shared = EmbeddingStore.content_hash(rag.embedding_model, '桩基础')
+        only_a = EmbeddingStore.content_hash(rag.embedding_model, '钢筋保护层')
+        only_b = EmbeddingStore.content_hash(rag.embedding_model, '混凝土强度')
+
+        with app.app_context():
+            rag.add_documents(kb_a, [
+                {'id': 'doc_a_chunk_0', 'content': '桩基础', 'metadata': {'document_id': 'doc_a'}},
+                {'id': 'doc_a_chunk_1', 'content': '钢筋保护层', 'metadata': {'document_id': 'doc_a'}}
+            ])
+            rag.add_documents(kb_b, [
+                {'id': 'doc_b_chunk_0', 'content': '桩基础', 'metadata': {'document_id': 'doc_b'}},
+                {'id': 'doc_b_chunk_1', 'content': '混凝土强度', 'metadata': {'document_id': 'doc_b'}}
+            ])
+            assert rag.embedding_store.count() == 3
+
+            rag.delete_document_chunks(kb_a, 'doc_a')
+            assert set(rag.embedding_store.get_many(rag.embedding_model, [shared, only_a, only_b])) == {shared, only_b}
+
+            rag.delete_collection(kb_b)
+            assert rag.embedding_store.count() == 0
@@ -0,0 +1,112 @@
+"""
+模型服务 HTTP 连接池测试
+测试长连接复用、传输层重试和连接池统计
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from benchmarks.fake_ollama import FakeOllama, fake_embedding
+from utils.http_client import PooledHTTPClient
+
+
+@pytest.fixture
+def fake_ollama():
+    """启动本地模拟 Ollama（保持长连接），返回服务对象"""
+    with FakeOllama(dimension=4) as fake:
+        yield fake
+
+
+@pytest.mark.unit
+class TestPooledHTTPClient:
+    """HTTP 连接池测试类"""
+
+    def test_reuses_connections(self, fake_ollama):
+        """测试顺序请求复用同一个长连接"""
+        # Arrange
+        client = PooledHTTPClient(pool_maxsize=4)
+
+        # Act
+        for _ in range(5):
+            response = client.post(f'{fake_ollama.url}/api/embed', json={'input': ['ab']})
+            assert response.json()['embeddings'] == [fake_embedding('ab', 4)]
+
+        # Assert
+        stats = client.stats()
+        assert stats['requests'] == 5
+        assert stats['failures'] == 0
+        assert stats['pools'][0]['connectionsCreated'] == 1
+        assert stats['pools'][0]['requests'] == 5
+        client.close()
+
+    def test_concurrent_requests_respect_pool_limit(self, fake_ollama):
+        """测试并发请求的连接数不超过每主机上限"""
+        # Arrange
+        client = PooledHTTPClient(pool_maxsize=2)
+
+        # Act
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(
+                lambda i: client.post(f'{fake_ollama.url}/api/embed', json={'input': [f'text {i}']}),
+                range(1, 17)
+            ))
+
+        # Assert
+        assert [r.json()['embeddings'][0] for r in responses] == \
+            [fake_embedding(f'text {i}', 4) for i in range(1, 17)]
+        assert client.stats()['pools'][0]['connectionsCreated'] <= 2
+        client.close()
+
+    def test_retries_gateway_errors_for_idempotent_requests(self, fake_ollama):
+        """测试 GET 请求的 503 响应按退避重试后成功"""
+        # Arrange
+        client = PooledHTTPClient(max_retries=2, retry_backoff=0)
+        fake_ollama.fail_first = 2
+
+        # Act
+        response = client.get(f'{fake_ollama.url}/api/tags')
+
+        # Assert
+        assert response.status_code == 200
+        assert fake_ollama.failures == 2
+        assert fake_ollama.requests['tags'] == 1
+        client.close()
+
+    def test_post_gateway_errors_not_retried(self, fake_ollama):
+        """测试 POST 请求的 503 响应不重试（生成请求可能已在服务端执行）"""
+        # Arrange
+        client = PooledHTTPClient(max_retries=2, retry_backoff=0)
+        fake_ollama.fail_first = 2
+
+        # Act
+        response = client.post(f'{fake_ollama.url}/api/embed', json={'input': ['abc']})
+
+        # Assert
+        assert response.status_code == 503
+        assert fake_ollama.failures == 1
+        assert fake_ollama.requests['embed'] == 0
+        client.close()
+
+    def test_connect_errors_retried_unless_disabled(self, mocker):
+        """测试连接失败对 POST 也重试，retry=False 时只尝试一次"""
+        # Arrange
+        connect = mocker.patch(
+            'urllib3.connection.connection.create_connection',
+            side_effect=ConnectionRefusedError('refused')
+        )
+        client = PooledHTTPClient(max_retries=2, retry_backoff=0)
+
+        # Act
+        with pytest.raises(requests.ConnectionError):
+            client.post('http://ollama.test:11434/api/generate', json={})
+        retried_attempts = connect.call_count
+        connect.reset_mock()
+        with pytest.raises(requests.ConnectionError):
+            client.post('http://ollama.test:11434/api/embed', json={}, retry=False)
+
+        # Assert
+        assert retried_attempts == 3
+        assert connect.call_count == 1
+        assert client.stats()['failures'] == 2
+        client.close()
@@ -0,0 +1,370 @@
+"""
+入库队列测试
+测试进程池并行解析文档和分批入库
+"""
+import pytest
+from datetime import datetime
+from models.knowledge_base import Document
+from utils.helpers import generate_id
+
+
+def make_document(db_session, knowledge_base, tmp_path, name, content):
+    """在临时目录写入文件并创建文档记录"""
+    file_path = tmp_path / name
+    file_path.write_bytes(content)
+    document = Document(
+        id=generate_id('doc'),
+        knowledge_base_id=knowledge_base.id,
+        name=name,
+        file_name=name,
+        file_path=str(file_path),
+        file_size=len(content),
+        file_type='txt',
+        status='pending',
+        uploaded_at=datetime.utcnow()
+    )
+    db_session.session.add(document)
+    db_session.session.commit()
+    return document
+
+
+@pytest.mark.unit
+class TestParseDocuments:
+    """并行解析测试类"""
+
+    def test_parse_documents_in_process_pool(self, app, db_session, knowledge_base, tmp_path):
+        """测试进程池解析多个文档，失败的文档单独返回异常"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        queue = IngestionQueue()
+        queue.parse_workers = 2
+        documents = [
+            make_document(db_session, knowledge_base, tmp_path, f'spec_{i}.txt',
+                          f'第{i}章 混凝土结构设计规范。'.encode('utf-8') * 50)
+            for i in range(3)
+        ]
+        documents.append(make_document(db_session, knowledge_base, tmp_path, 'empty.txt', b''))
+
+        # Act
+        try:
+            results = {
+                document.name: (list(chunks) if chunks is not None else None, error)
+                for document, chunks, error in queue.parse_documents(documents, knowledge_base)
+            }
+        finally:
+            queue.stop()
+
+        # Assert
+        assert len(results) == 4
+        for i in range(3):
+            chunks, error = results[f'spec_{i}.txt']
+            assert error is None
+            assert chunks[0]['metadata']['kb_id'] == knowledge_base.id
+            assert chunks[0]['metadata']['file_type'] == 'txt'
+            assert f'第{i}章' in chunks[0]['content']
+        chunks, error = results['empty.txt']
+        assert chunks is None
+        assert isinstance(error, Exception)
+        assert all(document.status == 'processing' for document in documents)
+
+    def test_parse_large_pdf_in_page_shards(self, app, db_session, knowledge_base, tmp_path):
+        """测试大 PDF 按页码区间分片解析后按页序拼接并填写页数"""
+        # Arrange
+        from tests.test_document_processor import make_pdf
+        from utils.ingestion_queue import IngestionQueue
+        queue = IngestionQueue()
+        queue.parse_workers = 2
+        document = make_document(db_session, knowledge_base, tmp_path, 'large.pdf',
+                                 make_pdf([f'Clause {i} ' + 'x' * 40 for i in range(1, 8)]))
+        document.file_type = 'pdf'
+        knowledge_base.chunk_size = 60
+        knowledge_base.chunk_overlap = 0
+        db_session.session.commit()
+        app.config['PDF_SHARD_PAGES'] = 2
+
+        # Act
+        try:
+            results = [
+                (parsed, list(chunks), error)
+                for parsed, chunks, error in queue.parse_documents([document], knowledge_base)
+            ]
+        finally:
+            queue.stop()
+            app.config['PDF_SHARD_PAGES'] = 50
+
+        # Assert
+        (parsed, chunks, error), = results
+        assert error is None
+        assert parsed.page_count == 7
+        assert [chunk['metadata']['page_number'] for chunk in chunks] == list(range(1, 8))
+        assert ' '.join(chunk['content'] for chunk in chunks) == \
+            ' '.join(f'Clause {i} ' + 'x' * 40 for i in range(1, 8))
+
+
+@pytest.mark.unit
+class TestStoreDocument:
+    """分批入库测试类"""
+
+    def test_store_document_in_batches(self, app, db_session, knowledge_base, tmp_path, mocker):
+        """测试文本块分批写入向量库并在最后补写块总数"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        from utils.document_processor import iter_document_chunks
+        document = make_document(db_session, knowledge_base, tmp_path, 'long.txt',
+                                 '井下通风设施检查记录。'.encode('utf-8') * 300)
+        add = mocker.patch('utils.rag_service.rag_service.add_documents')
+        update_total = mocker.patch('utils.rag_service.rag_service.update_chunk_total')
+        app.config['INGESTION_EMBED_BATCH_SIZE'] = 3
+        chunks = iter_document_chunks(document.file_path, 'txt', document.id, document.name,
+                                      knowledge_base.id, chunk_size=500, chunk_overlap=50)
+
+        # Act
+        try:
+            stored = IngestionQueue().store_document(document, knowledge_base, chunks)
+        finally:
+            app.config['INGESTION_EMBED_BATCH_SIZE'] = 256
+
+        # Assert
+        assert stored is True
+        batch_sizes = [len(call.args[1]) for call in add.call_args_list]
+        assert batch_sizes == [3, 3, 2]
+        assert document.chunk_count == 8
+        update_total.assert_called_once_with(knowledge_base.id, document.id, document.chunk_count)
+        last_batch = add.call_args_list[-1].args[1]
+        assert all(chunk['metadata']['chunk_total'] == document.chunk_count for chunk in last_batch)
+
+    def test_store_replaced_document_reuses_unchanged_chunks(self, app, db_session, knowledge_base,
+                                                             tmp_path, rag, mocker):
+        """测试替换文档时只为变化的块计算向量，删除消失的块并更新保留块的元数据"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        document = make_document(db_session, knowledge_base, tmp_path, 'manual.txt', b'')
+        mocker.patch('utils.rag_service.rag_service', rag)
+        embed = mocker.patch.object(
+            rag, 'get_embeddings',
+            side_effect=lambda texts, model=None: [[float(len(text)), 1.0] for text in texts]
+        )
+
+        def make_chunks(contents):
+            return [
+                {
+                    'id': f'{document.id}_chunk_{i}',
+                    'content': content,
+                    'metadata': {'document_id': document.id, 'kb_id': knowledge_base.id, 'chunk_index': i}
+                }
+                for i, content in enumerate(contents)
+            ]
+
+        queue = IngestionQueue()
+        queue.store_document(document, knowledge_base, make_chunks(['第一章 总则', '第二章 术语', '第三章 通风']))
+        embed.reset_mock()
+
+        # Act
+        stored = queue.store_document(
+            document, knowledge_base, make_chunks(['勘误说明', '第一章 总则', '第三章 通风'])
+        )
+
+        # Assert
+        assert stored is True
+        embed.assert_called_once()
+        assert embed.call_args.args[0] == ['勘误说明']
+        results = rag.get_document_chunks(knowledge_base.id, document.id)
+        chunks = sorted(zip(results['metadatas'], results['documents'], results['ids']),
+                        key=lambda item: item[0]['chunk_index'])
+        assert [content for _, content, _ in chunks] == ['勘误说明', '第一章 总则', '第三章 通风']
+        assert all(metadata['chunk_total'] == 3 for metadata, _, _ in chunks)
+        assert len({chunk_id for _, _, chunk_id in chunks}) == 3
+        assert document.chunk_count == 3
+
+
+    def test_failed_replacement_keeps_vanished_chunks(self, app, db_session, knowledge_base, tmp_path,
+                                                      rag, mocker):
+        """测试更新保留块元数据失败时不删除消失的块，文档保留原有文本块"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        document = make_document(db_session, knowledge_base, tmp_path, 'manual.txt', b'')
+        mocker.patch('utils.rag_service.rag_service', rag)
+        mocker.patch.object(
+            rag, 'get_embeddings',
+            side_effect=lambda texts, model=None: [[float(len(text)), 1.0] for text in texts]
+        )
+
+        def make_chunks(contents):
+            return [
+                {
+                    'id': f'{document.id}_chunk_{i}',
+                    'content': content,
+                    'metadata': {'document_id': document.id, 'kb_id': knowledge_base.id, 'chunk_index': i}
+                }
+                for i, content in enumerate(contents)
+            ]
+
+        queue = IngestionQueue()
+        queue.store_document(document, knowledge_base, make_chunks(['第一章 总则', '第二章 术语']))
+        mocker.patch.object(rag, 'update_chunk_metadata', side_effect=RuntimeError('写入失败'))
+
+        # Act
+        stored = queue.store_document(document, knowledge_base, make_chunks(['勘误说明', '第一章 总则']))
+
+        # Assert
+        assert stored is False
+        results = rag.get_document_chunks(knowledge_base.id, document.id)
+        assert sorted(results['documents']) == sorted(['第一章 总则', '第二章 术语'])
+
+
+@pytest.mark.unit
+class TestStaleJobRecovery:
+    """心跳超时任务恢复测试类"""
+
+    def test_requeue_uses_heartbeat_not_start_time(self, app, db_session, knowledge_base, tmp_path):
+        """测试长时间运行但持续发送心跳的任务不被重新入队，心跳超时的任务重新入队"""
+        # Arrange
+        from datetime import timedelta
+        from models.ingestion_job import IngestionJob
+        from utils.helpers import get_beijing_now
+        from utils.ingestion_queue import IngestionQueue
+        queue = IngestionQueue()
+        alive_doc = make_document(db_session, knowledge_base, tmp_path, 'alive.txt', b'alive')
+        dead_doc = make_document(db_session, knowledge_base, tmp_path, 'dead.txt', b'dead')
+        alive = queue.enqueue(knowledge_base.id, [alive_doc.id])
+        dead = queue.enqueue(knowledge_base.id, [dead_doc.id])
+        db_session.session.commit()
+        queue.claim_next_job('host:1-0')
+        queue.claim_next_job('host:2-0')
+        long_ago = get_beijing_now() - timedelta(hours=2)
+        alive.started_at = dead.started_at = long_ago
+        dead.heartbeat_at = long_ago
+        dead_doc.status = 'processing'
+        db_session.session.commit()
+
+        # Act
+        beat = queue.heartbeat(alive.id, alive.worker)
+        requeued = queue.requeue_stale_jobs(180)
+        lost = queue.heartbeat(dead.id, 'host:2-0')
+
+        # Assert
+        assert beat is True
+        assert requeued == 1
+        assert lost is False
+        assert IngestionJob.query.get(alive.id).status == 'running'
+        recovered = IngestionJob.query.get(dead.id)
+        assert recovered.status == 'pending'
+        assert recovered.worker is None
+        assert Document.query.get(dead_doc.id).status == 'pending'
+
+    def test_requeued_job_not_overwritten_by_original_worker(self, app, db_session, knowledge_base,
+                                                              tmp_path, mocker):
+        """测试任务中途被重新入队并由其他 worker 领取后，原 worker 放弃剩余文档且不覆盖任务状态"""
+        # Arrange
+        from models.ingestion_job import IngestionJob
+        from utils.ingestion_queue import IngestionQueue
+        queue = IngestionQueue()
+        first = make_document(db_session, knowledge_base, tmp_path, 'first.txt', b'first')
+        second = make_document(db_session, knowledge_base, tmp_path, 'second.txt', b'second')
+        job = queue.enqueue(knowledge_base.id, [first.id, second.id])
+        db_session.session.commit()
+        job = queue.claim_next_job('host:1-0')
+
+        def requeue_and_reclaim(*args):
+            queue.requeue_stale_jobs(-1)
+            queue.claim_next_job('host:2-0')
+            return True
+
+        store = mocker.patch.object(queue, 'store_document', side_effect=requeue_and_reclaim)
+
+        # Act
+        queue.process_job(job)
+
+        # Assert
+        assert store.call_count == 1
+        current = IngestionJob.query.get(job.id)
+        assert current.status == 'running'
+        assert current.worker == 'host:2-0'
+        assert current.processed == 0
+        assert current.finished_at is None
+
+    def test_lost_lease_stops_between_documents(self, app, db_session, knowledge_base, tmp_path, mocker):
+        """测试心跳发现租约丢失后不再处理剩余文档，也不写入完成状态"""
+        # Arrange
+        import threading
+        from models.ingestion_job import IngestionJob
+        from utils.ingestion_queue import IngestionQueue
+        queue = IngestionQueue()
+        first = make_document(db_session, knowledge_base, tmp_path, 'first.txt', b'first')
+        second = make_document(db_session, knowledge_base, tmp_path, 'second.txt', b'second')
+        job = queue.enqueue(knowledge_base.id, [first.id, second.id])
+        db_session.session.commit()
+        job = queue.claim_next_job('host:1-0')
+        lost = threading.Event()
+
+        def store_and_lose_lease(*args):
+            lost.set()
+            return True
+
+        store = mocker.patch.object(queue, 'store_document', side_effect=store_and_lose_lease)
+
+        # Act
+        queue.process_job(job, lost)
+
+        # Assert
+        assert store.call_count == 1
+        assert IngestionJob.query.get(job.id).status == 'running'
+
+    def test_worker_loop_checks_stale_jobs_periodically(self, app, mocker):
+        """测试 worker 循环按心跳间隔检查超时任务，多个线程在同一间隔内只检查一次"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        queue = IngestionQueue()
+        requeue = mocker.patch.object(queue, 'requeue_stale_jobs', return_value=0)
+        clock = mocker.patch('utils.ingestion_queue.time.monotonic', return_value=1000.0)
+        app.config['INGESTION_HEARTBEAT_INTERVAL'] = 30
+
+        # Act
+        try:
+            with app.app_context():
+                queue._requeue_stale_jobs_periodically(app)
+                queue._requeue_stale_jobs_periodically(app)
+                clock.return_value = 1031.0
+                queue._requeue_stale_jobs_periodically(app)
+        finally:
+            app.config['INGESTION_HEARTBEAT_INTERVAL'] = 0
+
+        # Assert
+        assert requeue.call_count == 2
+        requeue.assert_called_with(app.config['INGESTION_HEARTBEAT_TIMEOUT'])
+
+
+@pytest.mark.unit
+class TestTokenizerCheck:
+    """按词元分块的分词器检查测试类"""
+
+    def test_warns_at_startup_when_tokenizer_missing(self, app, tmp_path, mocker):
+        """测试按词元分块但找不到分词器时，初始化队列记录警告"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        mocker.patch.dict(app.config, {
+            'CHUNK_UNIT': 'token',
+            'TOKENIZER_PATH': str(tmp_path),
+            'EMBEDDING_MODEL_NAME': f'acme/missing-{generate_id()[:8]}'
+        })
+        warning = mocker.patch.object(app.logger, 'warning')
+
+        # Act
+        IngestionQueue().initialize(app)
+
+        # Assert
+        assert warning.call_count == 1
+        assert 'CHUNK_UNIT=token' in warning.call_args.args[0]
+
+    def test_no_check_in_char_mode(self, app, mocker):
+        """测试按字符分块时不加载分词器"""
+        # Arrange
+        from utils.ingestion_queue import IngestionQueue
+        mocker.patch.dict(app.config, {'CHUNK_UNIT': 'char'})
+        counter = mocker.patch('utils.tokenizer.get_token_counter')
+
+        # Act
+        IngestionQueue().initialize(app)
+
+        # Assert
+        counter.assert_not_called()
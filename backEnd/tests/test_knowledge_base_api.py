@@ -2,8 +2,46 @@
 知识库管理API测试
 测试知识库CRUD、文档管理等功能
 """
+import os
 import pytest
-from models.knowledge_base import KnowledgeBase
+from sqlalchemy import event
+from models.knowledge_base import KnowledgeBase, Document, KnowledgeBasePermission
+from utils.helpers import generate_id
+
+
+def add_authorized_knowledge_bases(db_session, owner, viewer, count):
+    """创建授权可见的知识库，每个包含两个文档（共 1536 字节）和一条授权记录"""
+    for i in range(count):
+        kb_id = generate_id('kb')
+        db_session.session.add(KnowledgeBase(
+            id=kb_id, name=f'授权知识库{i}', code=f'authorized_{kb_id}', visible='authorized',
+            status='active', created_by=owner.id
+        ))
+        for size in (512, 1024):
+            db_session.session.add(Document(
+                id=generate_id('doc'), knowledge_base_id=kb_id, name=f'{size}.txt', file_name=f'{size}.txt',
+                file_path=f'{size}.txt', file_type='txt', file_size=size, status='completed',
+                uploaded_by=owner.id
+            ))
+        db_session.session.add(KnowledgeBasePermission(
+            knowledge_base_id=kb_id, user_id=viewer.id, permission='view', granted_by=owner.id
+        ))
+    db_session.session.commit()
+
+
+def count_queries(db_session, send):
+    """统计一次请求执行的 SQL 语句数"""
+    statements = []
+    
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    
+    event.listen(db_session.engine, 'before_cursor_execute', record)
+    try:
+        response = send()
+    finally:
+        event.remove(db_session.engine, 'before_cursor_execute', record)
+    return response, len(statements)
 
 
 @pytest.mark.api
@@ -64,6 +102,54 @@ class TestKnowledgeBaseAPI:
         assert json_data['error'] == 0
         assert 'list' in json_data['body']
     
+    def test_get_list_query_count_independent_of_page_size(self, client, db_session, auth_headers_user,
+                                                          admin_user, normal_user, knowledge_base):
+        """测试知识库列表的查询次数不随每页条数增长"""
+        # Arrange
+        add_authorized_knowledge_bases(db_session, admin_user, normal_user, 2)
+        send = lambda: client.post('/api/knowledge-base/list', json={'page': 1, 'pageSize': 20},
+                                   headers=auth_headers_user)
+        send()
+        
+        # Act
+        _, small_page_queries = count_queries(db_session, send)
+        add_authorized_knowledge_bases(db_session, admin_user, normal_user, 6)
+        response, large_page_queries = count_queries(db_session, send)
+        
+        # Assert
+        body = response.get_json()['body']
+        assert body['total'] == 9
+        assert large_page_queries == small_page_queries
+        authorized = [item for item in body['list'] if item['visible'] == 'authorized']
+        assert len(authorized) == 8
+        assert all(item['documentCount'] == 2 for item in authorized)
+        assert all(item['storageSize'] == '1.5 KB' for item in authorized)
+        assert all(item['viewers'] == 1 for item in authorized)
+        public = next(item for item in body['list'] if item['id'] == knowledge_base.id)
+        assert public['documentCount'] == 0
+        assert public['storageSize'] == '0 B'
+        assert public['viewers'] == 0
+    
+    def test_uploaded_files_query_count_independent_of_page_size(self, client, db_session, auth_headers_admin,
+                                                                admin_user, normal_user):
+        """测试已上传文件列表的查询次数不随每页条数增长"""
+        # Arrange
+        add_authorized_knowledge_bases(db_session, admin_user, normal_user, 1)
+        send = lambda: client.post('/api/knowledge-base/uploaded-files', json={'page': 1, 'pageSize': 50},
+                                   headers=auth_headers_admin)
+        send()
+        
+        # Act
+        _, small_page_queries = count_queries(db_session, send)
+        add_authorized_knowledge_bases(db_session, admin_user, normal_user, 5)
+        response, large_page_queries = count_queries(db_session, send)
+        
+        # Assert
+        body = response.get_json()['body']
+        assert body['total'] == 12
+        assert large_page_queries == small_page_queries
+        assert all(item['knowledgeBaseName'].startswith('授权知识库') for item in body['list'])
+    
     def test_get_detail(self, client, db_session, auth_headers_user, knowledge_base):
         """测试获取知识库详情"""
         # Arrange
@@ -196,6 +282,123 @@ class TestKnowledgeBaseAPI:
         assert json_data['error'] == 0
         assert json_data['body']['name'] == '更新的名称'
     
+    def test_create_full_rejects_invalid_chunk_config(self, client, db_session, auth_headers_admin):
+        """测试完整创建时校验分块大小和分块重叠"""
+        # Act
+        zero_size = client.post('/api/knowledge-base/create-full',
+                                json={'name': '分块校验', 'maxChunkLength': 0},
+                                headers=auth_headers_admin)
+        overlap_too_large = client.post('/api/knowledge-base/create-full',
+                                        json={'name': '分块校验', 'maxChunkLength': 100, 'chunkOverlap': 100},
+                                        headers=auth_headers_admin)
+        
+        # Assert
+        assert zero_size.status_code == 400
+        assert zero_size.get_json()['error'] == 2001
+        assert overlap_too_large.status_code == 400
+        assert overlap_too_large.get_json()['error'] == 2001
+        assert KnowledgeBase.query.filter_by(name='分块校验').count() == 0
+    
+    def test_create_full_rejects_copy_across_vector_models(self, client, db_session, auth_headers_admin,
+                                                           knowledge_base, embedding_model, mocker):
+        """测试复制文件时来源知识库的向量模型与新知识库不一致则拒绝"""
+        # Arrange
+        doc_id = generate_id('doc')
+        db_session.session.add(Document(
+            id=doc_id, knowledge_base_id=knowledge_base.id, name='a.txt', file_name='a.txt',
+            file_path='a.txt', file_type='txt', status='completed'
+        ))
+        db_session.session.commit()
+        copy = mocker.patch('utils.rag_service.rag_service.copy_document_chunks', return_value=2)
+        
+        # Act
+        response = client.post('/api/knowledge-base/create-full',
+                              json={'name': '跨模型复制', 'dataSource': 'existing', 'fileIds': [doc_id],
+                                    'vectorModelId': embedding_model.id},
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 2005
+        copy.assert_not_called()
+        assert KnowledgeBase.query.filter_by(name='跨模型复制').count() == 0
+    
+    def test_create_full_copies_same_vector_model(self, client, db_session, auth_headers_admin,
+                                                  knowledge_base, mocker):
+        """测试来源知识库使用同一向量模型时复制文档向量"""
+        # Arrange
+        doc_id = generate_id('doc')
+        db_session.session.add(Document(
+            id=doc_id, knowledge_base_id=knowledge_base.id, name='a.txt', file_name='a.txt',
+            file_path='a.txt', file_type='txt', status='completed'
+        ))
+        db_session.session.commit()
+        copy = mocker.patch('utils.rag_service.rag_service.copy_document_chunks', return_value=2)
+        
+        # Act
+        response = client.post('/api/knowledge-base/create-full',
+                              json={'name': '同模型复制', 'dataSource': 'existing', 'fileIds': [doc_id],
+                                    'maxChunkLength': 300, 'chunkOverlap': 30},
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 200
+        kb = KnowledgeBase.query.get(response.get_json()['body']['id'])
+        assert (kb.chunk_size, kb.chunk_overlap) == (300, 30)
+        assert copy.call_args.args[:2] == (knowledge_base.id, doc_id)
+        assert kb.documents.first().chunk_count == 2
+    
+    def test_update_vector_model_with_documents(self, client, db_session, auth_headers_admin,
+                                                knowledge_base, embedding_model):
+        """测试已有文档的知识库不能更换向量模型"""
+        # Arrange
+        from models.knowledge_base import Document
+        db_session.session.add(Document(
+            id=generate_id('doc'), knowledge_base_id=knowledge_base.id, name='a.txt', file_name='a.txt',
+            file_path='a.txt', file_type='txt', status='completed'
+        ))
+        db_session.session.commit()
+        
+        # Act
+        response = client.post('/api/knowledge-base/update',
+                              json={'id': knowledge_base.id, 'vectorModelId': embedding_model.id},
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 2005
+    
+    def test_rebuild_index(self, client, db_session, auth_headers_admin, knowledge_base, mocker):
+        """测试保存索引参数并提交后台重建"""
+        # Arrange
+        from utils.rag_service import rag_service
+        mocker.patch.object(rag_service, 'get_index_config', return_value={'space': 'l2', 'count': 10})
+        mock_start = mocker.patch.object(rag_service, 'start_rebuild', return_value=True)
+        
+        # Act
+        response = client.post('/api/knowledge-base/rebuild-index',
+                              json={'id': knowledge_base.id, 'indexConfig': {'space': 'cosine', 'M': 32}},
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 200
+        body = response.get_json()['body']
+        assert body['rebuilding'] is True
+        assert body['indexConfig'] == {'space': 'cosine', 'M': 32}
+        assert KnowledgeBase.query.get(knowledge_base.id).index_config == {'space': 'cosine', 'M': 32}
+        assert mock_start.call_args[0][1:] == (knowledge_base.id, {'space': 'cosine', 'M': 32})
+    
+    def test_rebuild_index_invalid_params(self, client, db_session, auth_headers_admin, knowledge_base):
+        """测试无效的索引参数"""
+        # Act
+        response = client.post('/api/knowledge-base/rebuild-index',
+                              json={'id': knowledge_base.id, 'indexConfig': {'space': 'hamming'}},
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 2001
+    
     def test_delete_knowledge_base(self, client, db_session, auth_headers_admin, knowledge_base):
         """测试删除知识库"""
         # Arrange
@@ -250,3 +453,192 @@ class TestKnowledgeBaseAPI:
         assert isinstance(json_data['body'], list)
 
 
+    def test_upload_document_enqueues_job(self, client, db_session, auth_headers_admin, knowledge_base):
+        """测试上传文档后立即返回入库任务"""
+        # Arrange
+        import io
+        from models.knowledge_base import Document
+        data = {
+            'knowledgeBaseId': knowledge_base.id,
+            'files': [(io.BytesIO('混凝土结构设计规范。'.encode('utf-8') * 20), 'spec.txt')]
+        }
+        
+        # Act
+        response = client.post('/api/knowledge-base/upload-document',
+                              data=data,
+                              content_type='multipart/form-data',
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 200
+        json_data = response.get_json()
+        assert json_data['error'] == 0
+        assert json_data['body']['jobId']
+        assert json_data['body']['successCount'] == 1
+        
+        doc_id = json_data['body']['uploaded'][0]['documentId']
+        assert Document.query.get(doc_id).status == 'pending'
+    
+    def test_ingestion_job_progress(self, client, db_session, auth_headers_admin, knowledge_base, mocker):
+        """测试后台处理入库任务并查询进度"""
+        # Arrange
+        import io
+        from models.knowledge_base import Document
+        from utils.ingestion_queue import ingestion_queue
+        mock_add = mocker.patch('utils.rag_service.rag_service.add_documents')
+        data = {
+            'knowledgeBaseId': knowledge_base.id,
+            'files': [
+                (io.BytesIO('混凝土结构设计规范。'.encode('utf-8') * 20), 'spec.txt'),
+                (io.BytesIO(b''), 'empty.txt')
+            ]
+        }
+        upload = client.post('/api/knowledge-base/upload-document',
+                            data=data,
+                            content_type='multipart/form-data',
+                            headers=auth_headers_admin).get_json()
+        job_id = upload['body']['jobId']
+        
+        # Act
+        processed = ingestion_queue.run_pending()
+        response = client.post('/api/knowledge-base/ingestion-job',
+                              json={'jobId': job_id},
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert processed == 1
+        assert mock_add.call_count == 1
+        json_data = response.get_json()
+        assert json_data['error'] == 0
+        assert json_data['body']['status'] == 'completed'
+        assert json_data['body']['progress'] == 100
+        assert json_data['body']['failed'] == 1
+        assert json_data['body']['knowledgeBaseProgress'] == 100
+        
+        statuses = {doc['name']: doc for doc in json_data['body']['documents']}
+        assert statuses['spec.txt']['status'] == 'completed'
+        assert statuses['spec.txt']['chunkCount'] >= 1
+        assert statuses['empty.txt']['status'] == 'failed'
+        assert statuses['empty.txt']['errorMessage']
+    
+    def test_replace_document_enqueues_job(self, client, db_session, auth_headers_admin, knowledge_base, app, mocker):
+        """测试替换文档保留文档ID，入库成功后才切换到新文件并删除旧文件"""
+        # Arrange
+        import io
+        from models.knowledge_base import Document
+        from models.ingestion_job import IngestionJob
+        from utils.ingestion_queue import ingestion_queue
+        mocker.patch('utils.rag_service.rag_service.add_documents')
+        upload_folder = app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        doc_id = generate_id('doc')
+        old_file = f'{doc_id}_old.txt'
+        with open(os.path.join(upload_folder, old_file), 'w', encoding='utf-8') as f:
+            f.write('旧版本')
+        db_session.session.add(Document(
+            id=doc_id, knowledge_base_id=knowledge_base.id, name='old.txt', file_name='old.txt',
+            file_path=old_file, file_type='txt', file_size=9, status='completed', chunk_count=3
+        ))
+        db_session.session.commit()
+        
+        # Act
+        response = client.post('/api/knowledge-base/replace-document',
+                              data={
+                                  'documentId': doc_id,
+                                  'file': (io.BytesIO('勘误后的规范条文。'.encode('utf-8') * 20), 'new.txt')
+                              },
+                              content_type='multipart/form-data',
+                              headers=auth_headers_admin)
+        json_data = response.get_json()
+        job = IngestionJob.query.get(json_data['body']['jobId'])
+        new_file = job.replacement['file_path']
+        pending = Document.query.get(doc_id)
+        pending_state = (pending.status, pending.name, pending.file_path)
+        old_kept_while_pending = os.path.exists(os.path.join(upload_folder, old_file))
+        ingestion_queue.run_pending()
+        
+        # Assert
+        assert json_data['error'] == 0
+        assert job.document_ids == [doc_id]
+        assert pending_state == ('pending', 'old.txt', old_file)
+        assert old_kept_while_pending
+        document = Document.query.get(doc_id)
+        assert document.status == 'completed'
+        assert document.name == 'new.txt'
+        assert document.file_path == new_file
+        assert not os.path.exists(os.path.join(upload_folder, old_file))
+        os.remove(os.path.join(upload_folder, new_file))
+    
+    def test_replace_document_failure_keeps_original(self, client, db_session, auth_headers_admin,
+                                                     knowledge_base, app, mocker):
+        """测试替换文档入库失败时保留原文件和文档信息，删除新文件"""
+        # Arrange
+        import io
+        from models.knowledge_base import Document
+        from models.ingestion_job import IngestionJob
+        from utils.ingestion_queue import ingestion_queue
+        mocker.patch('utils.rag_service.rag_service.add_documents', side_effect=RuntimeError('嵌入服务不可用'))
+        upload_folder = app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        doc_id = generate_id('doc')
+        old_file = f'{doc_id}_old.txt'
+        with open(os.path.join(upload_folder, old_file), 'w', encoding='utf-8') as f:
+            f.write('旧版本')
+        db_session.session.add(Document(
+            id=doc_id, knowledge_base_id=knowledge_base.id, name='old.txt', file_name='old.txt',
+            file_path=old_file, file_type='txt', file_size=9, status='completed', chunk_count=3
+        ))
+        db_session.session.commit()
+        
+        # Act
+        response = client.post('/api/knowledge-base/replace-document',
+                              data={
+                                  'documentId': doc_id,
+                                  'file': (io.BytesIO('勘误后的规范条文。'.encode('utf-8') * 20), 'new.txt')
+                              },
+                              content_type='multipart/form-data',
+                              headers=auth_headers_admin)
+        new_file = IngestionJob.query.get(response.get_json()['body']['jobId']).replacement['file_path']
+        ingestion_queue.run_pending()
+        
+        # Assert
+        document = Document.query.get(doc_id)
+        assert document.status == 'completed'
+        assert document.name == 'old.txt'
+        assert document.file_path == old_file
+        assert document.file_size == 9
+        assert '嵌入服务不可用' in document.error_message
+        assert os.path.exists(os.path.join(upload_folder, old_file))
+        assert not os.path.exists(os.path.join(upload_folder, new_file))
+        os.remove(os.path.join(upload_folder, old_file))
+    
+    def test_replace_document_while_processing(self, client, db_session, auth_headers_admin, knowledge_base):
+        """测试文档处理中不能替换"""
+        # Arrange
+        import io
+        from models.knowledge_base import Document
+        doc_id = generate_id('doc')
+        db_session.session.add(Document(
+            id=doc_id, knowledge_base_id=knowledge_base.id, name='a.txt', file_name='a.txt',
+            file_path='a.txt', file_type='txt', status='processing'
+        ))
+        db_session.session.commit()
+        
+        # Act
+        response = client.post('/api/knowledge-base/replace-document',
+                              data={'documentId': doc_id, 'file': (io.BytesIO(b'abc'), 'a.txt')},
+                              content_type='multipart/form-data',
+                              headers=auth_headers_admin)
+        
+        # Assert
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 2003
+    
+    def test_ingestion_job_not_found(self, client, db_session, auth_headers_user):
+        """测试查询不存在的入库任务"""
+        response = client.post('/api/knowledge-base/ingestion-job',
+                              json={'jobId': 'nonexistent'},
+                              headers=auth_headers_user)
+        
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 2002
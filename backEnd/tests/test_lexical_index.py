@@ -0,0 +1,111 @@
+"""
+全文倒排索引测试
+测试分词、BM25 检索和增量更新
+"""
+import pytest
+from utils.lexical_index import LexicalIndex, tokenize
+
+
+def make_chunk(chunk_id, document_id, content):
+    """构造文本块"""
+    return {'id': chunk_id, 'content': content, 'metadata': {'document_id': document_id}}
+
+
+@pytest.fixture
+def index(tmp_path):
+    """临时目录中的倒排索引"""
+    return LexicalIndex(str(tmp_path / 'lexical'))
+
+
+@pytest.mark.unit
+class TestTokenize:
+    """分词测试类"""
+
+    def test_tokenize_keeps_part_numbers(self):
+        """测试编号类词元保留完整形式并拆出组成部分"""
+        tokens = tokenize('执行 GB50021-2001 第 3.2.1 条')
+
+        assert 'gb50021-2001' in tokens
+        assert 'gb50021' in tokens
+        assert '3.2.1' in tokens
+
+    def test_tokenize_normalizes_full_width(self):
+        """测试全角字符归一化"""
+        assert tokenize('ＧＢ５００２１') == tokenize('gb50021')
+
+    def test_tokenize_chinese_without_jieba(self):
+        """测试未使用 jieba 时中文按二元切分"""
+        assert tokenize('煤矿安全', use_jieba=False) == ['煤矿', '矿安', '安全']
+
+
+@pytest.mark.unit
+class TestLexicalIndex:
+    """倒排索引测试类"""
+
+    def test_search_ranks_exact_match_first(self, index):
+        """测试精确编号命中排在最前"""
+        # Arrange
+        index.add('kb1', [
+            make_chunk('c1', 'd1', '通风系统设计应符合相关规范要求'),
+            make_chunk('c2', 'd1', '液压支架型号 ZY6800/17/35 的检修周期为三个月'),
+            make_chunk('c3', 'd2', '支架检修应记录检修周期')
+        ])
+
+        # Act
+        results = index.search('kb1', 'ZY6800/17/35 检修')
+
+        # Assert
+        assert results[0][0] == 'c2'
+        assert 'c1' not in [chunk_id for chunk_id, _ in results]
+
+    def test_search_unknown_kb_returns_empty(self, index):
+        """测试未建立索引的知识库返回空结果"""
+        assert index.search('missing', '任意查询') == []
+
+    def test_delete_document_updates_postings(self, index):
+        """测试删除文档后不再命中且统计同步更新"""
+        # Arrange
+        index.add('kb1', [
+            make_chunk('c1', 'd1', 'GB50021 岩土工程勘察规范'),
+            make_chunk('c2', 'd2', 'GB50021 条文说明')
+        ])
+
+        # Act
+        deleted = index.delete_document('kb1', 'd1')
+        results = index.search('kb1', 'GB50021')
+
+        # Assert
+        assert deleted == 1
+        assert [chunk_id for chunk_id, _ in results] == ['c2']
+        assert index.search('kb1', '岩土工程') == []
+
+    def test_add_existing_chunk_replaces_it(self, index):
+        """测试重复添加同ID文本块时覆盖旧内容"""
+        # Arrange
+        index.add('kb1', [make_chunk('c1', 'd1', '旧内容 A100')])
+
+        # Act
+        index.add('kb1', [make_chunk('c1', 'd1', '新内容 B200')])
+
+        # Assert
+        assert index.search('kb1', 'A100') == []
+        assert index.search('kb1', 'B200')[0][0] == 'c1'
+
+    def test_index_persists_across_instances(self, index, tmp_path):
+        """测试索引持久化到磁盘"""
+        # Arrange
+        index.add('kb1', [make_chunk('c1', 'd1', '主斜井 MT/T1100 标准')])
+
+        # Act
+        reopened = LexicalIndex(str(tmp_path / 'lexical'))
+
+        # Assert
+        assert reopened.search('kb1', 'MT/T1100')[0][0] == 'c1'
+
+    def test_drop_removes_index(self, index):
+        """测试删除知识库索引"""
+        index.add('kb1', [make_chunk('c1', 'd1', 'A100 设备')])
+
+        index.drop('kb1')
+
+        assert index.search('kb1', 'A100') == []
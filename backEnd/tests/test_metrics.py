@@ -0,0 +1,105 @@
+"""
+运行指标测试
+测试 Prometheus 文本格式输出、接口请求耗时、问答阶段耗时和词元统计
+"""
+import json
+
+import pytest
+
+from utils.metrics import MetricsRegistry, metrics
+
+
+@pytest.mark.unit
+class TestMetricsRegistry:
+    """指标注册表测试类"""
+
+    def test_render_histogram_and_counter(self):
+        """测试直方图按桶累积输出，计数器按标签输出"""
+        # Arrange
+        registry = MetricsRegistry()
+        latency = registry.histogram('demo_seconds', '示例耗时', ('stage',), buckets=(0.1, 1))
+        tokens = registry.counter('demo_tokens_total', '示例词元', ('type',))
+
+        # Act
+        latency.observe(0.05, stage='llm')
+        latency.observe(0.5, stage='llm')
+        latency.observe(3, stage='llm')
+        tokens.inc(12, type='prompt')
+        output = registry.render()
+
+        # Assert
+        assert '# TYPE demo_seconds histogram' in output
+        assert 'demo_seconds_bucket{stage="llm",le="0.1"} 1' in output
+        assert 'demo_seconds_bucket{stage="llm",le="1.0"} 2' in output
+        assert 'demo_seconds_bucket{stage="llm",le="+Inf"} 3' in output
+        assert 'demo_seconds_sum{stage="llm"} 3.55' in output
+        assert 'demo_seconds_count{stage="llm"} 3' in output
+        assert 'demo_tokens_total{type="prompt"} 12' in output
+
+    def test_stream_answer_records_tokens(self, app, rag, mocker):
+        """测试流式回答按服务返回的用量统计词元数"""
+        # Arrange
+        lines = [
+            'data: ' + json.dumps({'choices': [{'delta': {'content': '每班'}}]}),
+            'data: ' + json.dumps({'choices': [{'delta': {'content': '检查'}}]}),
+            'data: ' + json.dumps({'choices': [], 'usage': {'prompt_tokens': 40, 'completion_tokens': 3}}),
+            'data: [DONE]'
+        ]
+        response = mocker.Mock()
+        response.iter_lines.return_value = lines
+        mocker.patch('utils.rag_service.http_client.post', return_value=response)
+        prompt_before = metrics.llm_tokens.get(type='prompt')
+        completion_before = metrics.llm_tokens.get(type='completion')
+
+        # Act
+        with app.app_context():
+            answer = ''.join(rag.generate_answer_stream('检查周期', []))
+
+        # Assert
+        assert answer == '每班检查'
+        assert metrics.llm_tokens.get(type='prompt') - prompt_before == 40
+        assert metrics.llm_tokens.get(type='completion') - completion_before == 3
+
+
+@pytest.mark.api
+class TestMetricsEndpoint:
+    """/metrics 接口测试类"""
+
+    def test_chat_request_and_stage_metrics(self, client, db_session, auth_headers_user, chat_session, mocker):
+        """测试发送消息后输出接口耗时和问答阶段耗时"""
+        # Arrange
+        mocker.patch('utils.rag_service.rag_service.chat', return_value={'answer': '答案', 'references': []})
+        labels = {'blueprint': 'chat', 'endpoint': 'chat.send_message', 'method': 'POST', 'status': '200'}
+        requests_before = metrics.http_request_duration.get(**labels)['count']
+        writes_before = metrics.stage_duration.get(pipeline='chat', stage='db_write')['count']
+
+        # Act
+        client.post('/api/chat/message/send',
+                    json={'sessionId': chat_session.id, 'question': '测试问题'},
+                    headers=auth_headers_user)
+        response = client.get('/metrics')
+
+        # Assert
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        body = response.get_data(as_text=True)
+        assert ('http_request_duration_seconds_count{blueprint="chat",endpoint="chat.send_message",'
+                'method="POST",status="200"}') in body
+        assert metrics.http_request_duration.get(**labels)['count'] == requests_before + 1
+        assert metrics.stage_duration.get(pipeline='chat', stage='db_write')['count'] == writes_before + 1
+
+    def test_metrics_token_required(self, app, client):
+        """测试配置令牌后未携带令牌的抓取被拒绝"""
+        # Arrange
+        app.config['METRICS_TOKEN'] = 'scrape-secret'
+
+        try:
+            # Act
+            rejected = client.get('/metrics')
+            accepted = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+        finally:
+            app.config['METRICS_TOKEN'] = ''
+
+        # Assert
+        assert rejected.status_code == 401
+        assert accepted.status_code == 200
@@ -0,0 +1,244 @@
+"""
+RAG 服务测试
+测试文档向量块的精确删除与复制
+"""
+import time
+
+import pytest
+from utils.helpers import generate_id
+
+
+def make_chunks(doc_id, kb_id, count):
+    """构造文档块"""
+    return [
+        {
+            'id': f'{doc_id}_chunk_{i}',
+            'content': f'{doc_id} 第{i}段',
+            'metadata': {'document_id': doc_id, 'kb_id': kb_id, 'chunk_index': i, 'chunk_total': count}
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def fake_embeddings(rag, mocker):
+    """以文本长度构造确定性向量"""
+    return mocker.patch.object(
+        rag, 'get_embeddings',
+        side_effect=lambda texts, model=None: [[float(len(text)), 1.0, 0.5] for text in texts]
+    )
+
+
+@pytest.mark.unit
+class TestDocumentChunks:
+    """文档向量块测试类"""
+
+    def test_delete_document_chunks_beyond_100(self, app, rag, fake_embeddings):
+        """测试删除超过 100 个块的文档且不影响其他文档"""
+        kb_id = generate_id('kb')
+        with app.app_context():
+            rag.add_documents(kb_id, make_chunks('doc_big', kb_id, 150))
+            rag.add_documents(kb_id, make_chunks('doc_other', kb_id, 3))
+
+            rag.delete_document_chunks(kb_id, 'doc_big')
+
+            assert rag.get_document_chunks(kb_id, 'doc_big')['ids'] == []
+            assert len(rag.get_document_chunks(kb_id, 'doc_other')['ids']) == 3
+
+    def test_update_chunk_total(self, app, rag, fake_embeddings):
+        """测试分批入库后补写全部块的 chunk_total"""
+        kb_id = generate_id('kb')
+        chunks = make_chunks('doc_stream', kb_id, 7)
+        for chunk in chunks:
+            del chunk['metadata']['chunk_total']
+        with app.app_context():
+            rag.add_documents(kb_id, chunks)
+
+            rag.update_chunk_total(kb_id, 'doc_stream', 7, batch_size=3)
+            result = rag.get_document_chunks(kb_id, 'doc_stream')
+
+        assert len(result['ids']) == 7
+        assert all(metadata['chunk_total'] == 7 for metadata in result['metadatas'])
+        assert all(metadata['document_id'] == 'doc_stream' for metadata in result['metadatas'])
+
+    def test_copy_document_chunks(self, app, rag, fake_embeddings):
+        """测试复制文档块到新知识库并改写文档ID"""
+        source_kb = generate_id('kb')
+        target_kb = generate_id('kb')
+        with app.app_context():
+            rag.add_documents(source_kb, make_chunks('doc_src', source_kb, 120))
+
+            copied = rag.copy_document_chunks(source_kb, 'doc_src', target_kb, 'doc_dst')
+            result = rag.get_document_chunks(target_kb, 'doc_dst')
+
+        assert copied == 120
+        assert len(result['ids']) == 120
+        assert all(chunk_id.startswith('doc_dst_chunk_') for chunk_id in result['ids'])
+        assert all(metadata['kb_id'] == target_kb for metadata in result['metadatas'])
+        assert fake_embeddings.call_count == 1
+
+
+@pytest.mark.unit
+class TestSearchCollections:
+    """多知识库检索测试类"""
+
+    def test_search_collections_merges_by_similarity(self, app, rag, fake_embeddings, mocker):
+        """测试跨知识库合并结果并按相似度取全局前 top_k 个"""
+        # Arrange
+        kb_a = generate_id('kb')
+        kb_b = generate_id('kb')
+        missing_kb = generate_id('kb')
+        mocker.patch.object(rag, 'get_query_embedding', return_value=[10.0, 1.0, 0.5])
+        with app.app_context():
+            rag.add_documents(kb_a, make_chunks('doc_a', kb_a, 3))
+            rag.add_documents(kb_b, make_chunks('doc_bb', kb_b, 3))
+
+            # Act
+            results = rag.search_collections([kb_a, kb_b, missing_kb], '查询', top_k=4)
+
+        # Assert
+        assert len(results) == 4
+        similarities = [doc['similarity'] for doc in results]
+        assert similarities == sorted(similarities, reverse=True)
+        # 'doc_bb 第N段' 长度为 10，与查询向量完全一致
+        assert results[0]['kb_id'] == kb_b
+        assert results[0]['similarity'] == 1.0
+
+    def test_search_collections_skips_slow_collection(self, app, rag, fake_embeddings, mocker):
+        """测试超过截止时间的知识库被跳过，不拖慢整体结果"""
+        # Arrange
+        kb_fast = generate_id('kb')
+        kb_slow = generate_id('kb')
+        mocker.patch.object(rag, 'get_query_embedding', return_value=[10.0, 1.0, 0.5])
+        retrieve = rag._retrieve
+
+        def slow_retrieve(kb_id, *args):
+            if kb_id == kb_slow:
+                time.sleep(1.5)
+            return retrieve(kb_id, *args)
+
+        mocker.patch.object(rag, '_retrieve', side_effect=slow_retrieve)
+        with app.app_context():
+            rag.add_documents(kb_fast, make_chunks('doc_a', kb_fast, 3))
+            rag.add_documents(kb_slow, make_chunks('doc_bb', kb_slow, 3))
+
+            # Act
+            start = time.monotonic()
+            results = rag.search_collections(
+                [kb_fast, kb_slow], '查询', top_k=4, timeout=0.5, merge_key='similarity'
+            )
+            elapsed = time.monotonic() - start
+
+        # Assert
+        assert elapsed < 1.5
+        assert len(results) == 3
+        assert all(doc['kb_id'] == kb_fast for doc in results)
+
+    def test_search_collections_with_where_filter(self, app, rag, fake_embeddings, mocker):
+        """测试按元数据过滤检索结果"""
+        # Arrange
+        kb_id = generate_id('kb')
+        mocker.patch.object(rag, 'get_query_embedding', return_value=[10.0, 1.0, 0.5])
+        chunks = make_chunks('doc_pdf', kb_id, 2) + make_chunks('doc_txt', kb_id, 2)
+        for chunk in chunks:
+            chunk['metadata']['file_type'] = chunk['metadata']['document_id'][4:]
+        with app.app_context():
+            rag.add_documents(kb_id, chunks)
+
+            # Act
+            results = rag.search_collections(
+                [kb_id], '查询', top_k=10, where={'file_type': {'$in': ['pdf']}}
+            )
+
+        # Assert
+        assert len(results) == 2
+        assert all(doc['metadata']['document_id'] == 'doc_pdf' for doc in results)
+
+
+@pytest.mark.unit
+class TestHybridSearch:
+    """混合检索测试类"""
+
+    def test_exact_term_found_beyond_vector_top_k(self, app, rag, fake_embeddings, mocker, tmp_path):
+        """测试向量检索未召回的精确编号经全文检索融合后返回"""
+        # Arrange
+        from utils.lexical_index import LexicalIndex
+        rag.lexical_index = LexicalIndex(str(tmp_path / 'lexical'))
+        rag.hybrid_candidates = 2
+        kb_id = generate_id('kb')
+        chunks = make_chunks('doc_h', kb_id, 5)
+        chunks.append({
+            'id': 'doc_h_chunk_part',
+            'content': '液压支架 ZY6800/17/35 检修周期说明，内容较长',
+            'metadata': {'document_id': 'doc_h', 'kb_id': kb_id, 'chunk_index': 5}
+        })
+        # 查询向量与短文本块最接近，长文本块排在向量结果末尾
+        mocker.patch.object(rag, 'get_query_embedding', return_value=[9.0, 1.0, 0.5])
+        with app.app_context():
+            rag.add_documents(kb_id, chunks)
+
+            # Act
+            results = rag.search_documents(kb_id, 'ZY6800/17/35', top_k=2, similarity_threshold=0.0)
+            rag.delete_document_chunks(kb_id, 'doc_h')
+            after_delete = rag.lexical_index.search(kb_id, 'ZY6800/17/35')
+
+        # Assert
+        ids = [doc['id'] for doc in results]
+        assert 'doc_h_chunk_part' in ids
+        assert all('score' in doc and 'similarity' in doc for doc in results)
+        assert after_delete == []
+
+
+@pytest.mark.unit
+class TestAnswerCache:
+    """问答结果缓存测试类"""
+
+    def test_chat_reuses_answer_until_documents_change(self, app, rag, fake_embeddings, mocker):
+        """测试重复问题不再调用 LLM，知识库新增文档后重新生成"""
+        # Arrange
+        kb_id = generate_id('kb')
+        mock_generate = mocker.patch.object(
+            rag, 'generate_answer', return_value=('每班检查一次', [{'chunkId': 'doc_a_chunk_0'}])
+        )
+        with app.app_context():
+            rag.add_documents(kb_id, make_chunks('doc_a', kb_id, 3))
+
+            # Act
+            first = rag.chat('通风设施检查周期', kb_id=kb_id, similarity_threshold=0.0)
+            second = rag.chat(' 通风设施检查周期 ', kb_id=kb_id, similarity_threshold=0.0)
+            rag.add_documents(kb_id, make_chunks('doc_b', kb_id, 1))
+            third = rag.chat('通风设施检查周期', kb_id=kb_id, similarity_threshold=0.0)
+
+        # Assert
+        assert first['answer'] == second['answer'] == third['answer'] == '每班检查一次'
+        assert second['references'] == first['references']
+        assert mock_generate.call_count == 2
+        assert rag.answer_cache.stats()['hits'] == 1
+
+
+@pytest.mark.unit
+class TestIndexConfig:
+    """向量索引参数测试类"""
+
+    def test_rebuild_collection_with_new_params(self, app, rag, fake_embeddings):
+        """测试新建集合使用余弦距离，重建后保留全部块并应用新参数"""
+        # Arrange
+        kb_id = generate_id('kb')
+        with app.app_context():
+            rag.add_documents(kb_id, make_chunks('doc_a', kb_id, 25))
+            before = rag.get_index_config(kb_id)
+
+            # Act
+            copied = rag.rebuild_collection(kb_id, {'space': 'l2', 'M': 32, 'efSearch': 128}, batch_size=10)
+            after = rag.get_index_config(kb_id)
+            result = rag.get_document_chunks(kb_id, 'doc_a')
+
+        # Assert
+        assert before['space'] == 'cosine'
+        assert before['efSearch'] == 64
+        assert copied == 25
+        assert after == {
+            'space': 'l2', 'M': 32, 'efConstruction': 100, 'efSearch': 128, 'dimension': 3, 'count': 25
+        }
+        assert len(result['ids']) == 25
+        assert [c.name for c in rag.chroma_client.list_collections()].count(f'kb_{kb_id}') == 1
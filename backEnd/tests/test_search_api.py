@@ -3,6 +3,9 @@
 测试文档搜索、热门关键词等功能
 """
 import pytest
+from datetime import datetime
+from models.knowledge_base import KnowledgeBase, Document
+from utils.helpers import generate_id
 
 
 @pytest.mark.api
@@ -50,6 +53,128 @@ class TestSearchAPI:
         json_data = response.get_json()
         assert json_data['error'] == 4001
     
+    def test_search_documents_with_results(self, client, db_session, auth_headers_user,
+                                           knowledge_base, admin_user, mocker):
+        """测试搜索返回文档信息并排除无权访问的知识库"""
+        # Arrange
+        private_kb = KnowledgeBase(
+            id=generate_id('kb'),
+            name='私有知识库',
+            code=f'private_{generate_id()[:8]}',
+            visible='private',
+            status='active',
+            created_by=admin_user.id,
+            created_at=datetime.utcnow()
+        )
+        document = Document(
+            id=generate_id('doc'),
+            knowledge_base_id=knowledge_base.id,
+            name='安全规范.pdf',
+            file_name='安全规范.pdf',
+            file_path='test/安全规范.pdf',
+            file_size=2048,
+            file_type='pdf',
+            status='completed',
+            uploaded_at=datetime.utcnow()
+        )
+        db_session.session.add_all([private_kb, document])
+        db_session.session.commit()
+        
+        hits = [
+            {
+                'id': f'{document.id}_chunk_{i}',
+                'content': f'<b>第{i}段</b> 井下安全规范',
+                'metadata': {'document_id': document.id, 'chunk_index': i},
+                'similarity': 0.9 - i * 0.1,
+                'kb_id': knowledge_base.id
+            }
+            for i in range(3)
+        ]
+        search = mocker.patch(
+            'utils.rag_service.rag_service.search_collections', return_value=hits
+        )
+        
+        # Act
+        response = client.post('/api/search/documents',
+                              json={'keyword': '安全', 'docType': 'pdf', 'page': 2, 'pageSize': 2},
+                              headers=auth_headers_user)
+        
+        # Assert
+        assert response.status_code == 200
+        body = response.get_json()['body']
+        assert body['total'] == 3
+        assert len(body['list']) == 1
+        item = body['list'][0]
+        assert item['title'] == '安全规范.pdf'
+        assert item['knowledgeBase'] == knowledge_base.name
+        assert item['pageNumber'] == 3
+        assert '<em>安全</em>' in item['excerpt']
+        assert '<b>' not in item['excerpt']
+        
+        kwargs = search.call_args.kwargs
+        assert knowledge_base.id in kwargs['kb_ids']
+        assert private_kb.id not in kwargs['kb_ids']
+        assert kwargs['top_k'] == 200
+        assert kwargs['where'] == {'file_type': {'$in': ['pdf']}}
+    
+    def test_search_documents_total_spans_pages(self, client, db_session, auth_headers_user,
+                                                knowledge_base, admin_user, mocker):
+        """测试按相关度排序时 total 为候选总数，可以翻到第二页，停用的知识库不参与搜索"""
+        # Arrange
+        disabled_kb = KnowledgeBase(
+            id=generate_id('kb'),
+            name='停用知识库',
+            code=f'disabled_{generate_id()[:8]}',
+            visible='all',
+            status='disabled',
+            created_by=admin_user.id,
+            created_at=datetime.utcnow()
+        )
+        document = Document(
+            id=generate_id('doc'),
+            knowledge_base_id=knowledge_base.id,
+            name='通风规程.txt',
+            file_name='通风规程.txt',
+            file_path='test/通风规程.txt',
+            file_size=1024,
+            file_type='txt',
+            status='completed',
+            uploaded_at=datetime.utcnow()
+        )
+        db_session.session.add_all([disabled_kb, document])
+        db_session.session.commit()
+        
+        hits = [
+            {
+                'id': f'{document.id}_chunk_{i}',
+                'content': f'第{i}段 通风设备检查',
+                'metadata': {'document_id': document.id, 'chunk_index': i},
+                'similarity': 0.9 - i * 0.05,
+                'kb_id': knowledge_base.id
+            }
+            for i in range(5)
+        ]
+        search = mocker.patch(
+            'utils.rag_service.rag_service.search_collections',
+            side_effect=lambda **kwargs: hits[:kwargs['top_k']]
+        )
+        
+        # Act
+        first = client.post('/api/search/documents',
+                            json={'keyword': '通风', 'page': 1, 'pageSize': 2},
+                            headers=auth_headers_user)
+        second = client.post('/api/search/documents',
+                             json={'keyword': '通风', 'page': 2, 'pageSize': 2},
+                             headers=auth_headers_user)
+        
+        # Assert
+        first_body = first.get_json()['body']
+        second_body = second.get_json()['body']
+        assert first_body['total'] == second_body['total'] == 5
+        assert [item['pageNumber'] for item in first_body['list']] == [1, 2]
+        assert [item['pageNumber'] for item in second_body['list']] == [3, 4]
+        assert disabled_kb.id not in search.call_args.kwargs['kb_ids']
+    
     def test_get_hot_keywords(self, client, db_session, auth_headers_user):
         """测试获取热门关键词"""
         # Arrange
@@ -0,0 +1,200 @@
+"""
+问答结果缓存
+同一知识库下检索到相同文本块的相同（或语义相近的）问题直接返回已生成的答案，跳过 LLM 生成
+"""
+import hashlib
+import json
+import math
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.cache import LRUCache
+from utils.embedding_cache import QueryEmbeddingCache
+
+
+class AnswerCache:
+    """
+    问答结果缓存
+
+    精确命中键为（知识库及其版本, LLM 模型, 检索到的文本块ID集合, 归一化问题）。
+    语义命中只在知识库、模型和文本块集合都相同的条目中查找，问题向量的余弦相似度
+    达到 semantic_threshold 即视为同一问题，因此不会返回依据不同上下文生成的答案。
+
+    本进程内知识库的文本块增删时版本号递增，旧条目不再命中；其他进程修改的知识库
+    通常会改变检索到的文本块集合，剩余情况由 ttl 兜底。
+    """
+
+    # 每个（知识库, 模型, 文本块集合）下参与语义比较的最近问题数
+    SEMANTIC_BUCKET_SIZE = 16
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = 3600,
+        semantic_threshold: float = 0.95,
+        enabled: bool = True
+    ):
+        """
+        Args:
+            max_size: 最多缓存的答案数
+            ttl: 过期时间（秒），None 或 0 表示不过期
+            semantic_threshold: 语义命中的余弦相似度阈值，0 表示只做精确命中
+            enabled: 是否启用
+        """
+        self.enabled = enabled
+        self.semantic_threshold = semantic_threshold
+        self._answers = LRUCache(max_size=max_size, ttl=ttl)
+        self._buckets = LRUCache(max_size=max_size, ttl=ttl)
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def initialize(self, app):
+        """
+        按应用配置重建缓存
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.enabled = app.config.get('ANSWER_CACHE_ENABLED', True)
+        self.semantic_threshold = app.config.get('ANSWER_CACHE_SEMANTIC_THRESHOLD', 0.95)
+        max_size = app.config.get('ANSWER_CACHE_SIZE', 1024)
+        ttl = app.config.get('ANSWER_CACHE_TTL', 3600)
+        self._answers = LRUCache(max_size=max_size, ttl=ttl)
+        self._buckets = LRUCache(max_size=max_size, ttl=ttl)
+
+    def _scope(self, kb_ids: List[str]) -> List[List[Any]]:
+        """知识库及其当前版本号"""
+        with self._lock:
+            return [[kb_id, self._versions.get(kb_id, 0)] for kb_id in sorted(kb_ids)]
+
+    @staticmethod
+    def _hash(*parts) -> str:
+        raw = json.dumps(parts, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _keys(self, kb_ids, model, chunk_ids, question):
+        """返回（答案键, 语义分桶键）"""
+        bucket_key = self._hash(self._scope(kb_ids), model, sorted(chunk_ids))
+        answer_key = self._hash(bucket_key, QueryEmbeddingCache.normalize(question))
+        return answer_key, bucket_key
+
+    def get(
+        self,
+        kb_ids: List[str],
+        model: str,
+        chunk_ids: List[str],
+        question: str,
+        query_embedding: Optional[List[float]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找已缓存的答案
+
+        Args:
+            kb_ids: 检索的知识库ID列表
+            model: LLM 模型名称
+            chunk_ids: 检索到的文本块ID列表
+            question: 用户问题
+            query_embedding: 问题向量（提供时启用语义命中）
+
+        Returns:
+            {'answer': ..., 'references': [...]}，未命中时返回 None
+        """
+        if not self.enabled or not kb_ids:
+            return None
+
+        answer_key, bucket_key = self._keys(kb_ids, model, chunk_ids, question)
+        entry = self._answers.get(answer_key)
+        if entry is not None:
+            self._record('hits')
+            return entry
+
+        if query_embedding and self.semantic_threshold:
+            query_vector = self._unit(query_embedding)
+            for cached_key, vector in reversed(self._buckets.get(bucket_key) or []):
+                if self._dot(query_vector, vector) >= self.semantic_threshold:
+                    entry = self._answers.get(cached_key)
+                    if entry is not None:
+                        self._record('semantic_hits')
+                        return entry
+
+        self._record('misses')
+        return None
+
+    def set(
+        self,
+        kb_ids: List[str],
+        model: str,
+        chunk_ids: List[str],
+        question: str,
+        answer: str,
+        references: List[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None
+    ):
+        """
+        缓存生成的答案（参数同 get）
+
+        Args:
+            answer: 答案文本
+            references: 引用列表
+        """
+        if not self.enabled or not kb_ids or not answer:
+            return
+
+        answer_key, bucket_key = self._keys(kb_ids, model, chunk_ids, question)
+        self._answers.set(answer_key, {'answer': answer, 'references': references})
+
+        if query_embedding and self.semantic_threshold:
+            bucket = [
+                item for item in (self._buckets.get(bucket_key) or [])
+                if item[0] != answer_key
+            ]
+            bucket.append((answer_key, self._unit(query_embedding)))
+            self._buckets.set(bucket_key, bucket[-self.SEMANTIC_BUCKET_SIZE:])
+
+    def invalidate(self, kb_id: str = None):
+        """
+        使知识库的缓存答案失效（文本块增删时调用）
+
+        Args:
+            kb_id: 知识库ID，不指定则清空全部
+        """
+        if kb_id is None:
+            self._answers.clear()
+            self._buckets.clear()
+            return
+
+        with self._lock:
+            self._versions[kb_id] = self._versions.get(kb_id, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        answer_stats = self._answers.stats()
+        with self._lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': answer_stats['size'],
+                'maxSize': answer_stats['maxSize'],
+                'ttl': answer_stats['ttl'],
+                'hits': self.hits,
+                'semanticHits': self.semantic_hits,
+                'misses': self.misses,
+                'evictions': answer_stats['evictions'],
+                'hitRate': round((self.hits + self.semantic_hits) / total, 4) if total else 0.0
+            }
+
+    def _record(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def _unit(vector: List[float]) -> List[float]:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    @staticmethod
+    def _dot(a: List[float], b: List[float]) -> float:
+        return sum(x * y for x, y in zip(a, b))
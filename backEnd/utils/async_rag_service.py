@@ -0,0 +1,405 @@
+"""
+异步 RAG 服务
+供 ASGI 问答接口使用：查询向量和 LLM 生成通过 aiohttp 异步请求 Ollama，
+向量库和全文索引查询放到检索线程池执行，不阻塞事件循环。
+一个进程可以同时保持大量进行中的问答，而不需要为每个问答占用一个线程。
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+from utils.metrics import metrics
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - 可选依赖
+    aiohttp = None
+
+
+class AsyncRAGService:
+    """
+    异步 RAG 服务
+
+    与同步的 RAGService 共用向量库客户端、查询向量缓存、全文索引和检索线程池，
+    只把网络等待改为协程；同步接口保持不变。
+    """
+
+    def __init__(self, rag=None):
+        """
+        Args:
+            rag: 同步 RAGService 实例，不指定则使用全局 rag_service
+        """
+        self._rag = rag
+        self.ollama_base_url = None
+        self.default_llm_model = None
+        self.temperature = 0.7
+        self.max_tokens = 2048
+        self.connect_timeout = 5
+        self.embedding_timeout = 60
+        self.llm_timeout = 120
+        self.connection_limit = 256
+        self.connection_limit_per_host = 64
+        self.logger = logging.getLogger(__name__)
+        self._session = None
+        self._session_loop = None
+
+    @property
+    def rag(self):
+        """同步 RAG 服务（共享的检索组件）"""
+        if self._rag is None:
+            from utils.rag_service import rag_service
+            self._rag = rag_service
+        return self._rag
+
+    def initialize(self, app):
+        """
+        读取应用配置（协程中没有应用上下文，配置在启动时复制）
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.ollama_base_url = app.config.get('OLLAMA_BASE_URL')
+        self.default_llm_model = app.config.get('LLM_DEFAULT_MODEL')
+        self.temperature = app.config.get('LLM_TEMPERATURE', 0.7)
+        self.max_tokens = app.config.get('LLM_MAX_TOKENS', 2048)
+        self.connect_timeout = app.config.get('HTTP_CONNECT_TIMEOUT', 5)
+        self.embedding_timeout = app.config.get('EMBEDDING_TIMEOUT', 60)
+        self.llm_timeout = app.config.get('LLM_TIMEOUT', 120)
+        self.connection_limit = app.config.get('ASYNC_HTTP_LIMIT', 256)
+        self.connection_limit_per_host = app.config.get('ASYNC_HTTP_LIMIT_PER_HOST', 64)
+        self.logger = app.logger
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        """获取当前事件循环的 aiohttp 会话（连接池按事件循环创建）"""
+        if aiohttp is None:
+            raise RuntimeError('异步问答需要安装 aiohttp')
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        """关闭 aiohttp 会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    async def get_query_embedding(self, query: str, model: str = None) -> List[float]:
+        """
+        获取查询文本的向量（与同步服务共用查询向量缓存）
+
+        Args:
+            query: 查询文本
+            model: 嵌入模型名称（不指定则使用默认嵌入模型）
+
+        Returns:
+            查询向量
+        """
+        rag = self.rag
+        model = model or rag.embedding_model
+        embedding = rag.query_embedding_cache.get(model, query)
+        if embedding is not None:
+            return embedding
+
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.embedding_timeout)
+        start = time.perf_counter()
+        async with self._get_session().post(
+            f"{self.ollama_base_url}/api/embed",
+            json={"model": model, "input": [query]},
+            timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            result = await response.json()
+        metrics.observe_stage('retrieval', 'embed_query', time.perf_counter() - start)
+
+        embedding = result['embeddings'][0]
+        rag.query_embedding_cache.set(model, query, embedding)
+        return embedding
+
+    async def _retrieve_one(
+        self,
+        kb_id: str,
+        query: str,
+        query_embedding: List[float],
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[Dict[str, Any]]:
+        """在检索线程池中查询单个知识库（集合不存在时返回空列表）"""
+        rag = self.rag
+
+        def query_one():
+            collection = rag._get_existing_collection(kb_id)
+            if collection is None:
+                return []
+            return rag._retrieve(
+                kb_id, collection, query, query_embedding, top_k, similarity_threshold
+            )
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(rag._get_search_executor(), query_one)
+
+    async def search_documents(
+        self,
+        kb_id: str,
+        query: str,
+        top_k: int = 5,
+        similarity_threshold: float = 0.7,
+        embedding_model: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        在单个知识库中检索相关文档（检索失败时返回空列表）
+
+        Args:
+            kb_id: 知识库ID
+            query: 查询文本
+            top_k: 返回最相关的前N个结果
+            similarity_threshold: 相似度阈值（0-1之间）
+            embedding_model: 知识库的嵌入模型（不指定则使用默认嵌入模型）
+
+        Returns:
+            检索结果列表
+        """
+        try:
+            query_embedding = await self.get_query_embedding(query, embedding_model)
+            documents = await self._retrieve_one(
+                kb_id, query, query_embedding, top_k, similarity_threshold
+            )
+            self.logger.info(f'在知识库 {kb_id} 中检索到 {len(documents)} 个相关文档')
+            return documents
+        except Exception as e:
+            self.logger.error(f'检索文档失败: {str(e)}', exc_info=True)
+            return []
+
+    async def search_collections(
+        self,
+        kb_ids: List[str],
+        query: str,
+        top_k: int = 5,
+        similarity_threshold: float = 0.0,
+        embedding_models: Dict[str, str] = None,
+        timeout: float = None,
+        merge_key: str = 'score'
+    ) -> List[Dict[str, Any]]:
+        """
+        并发检索多个知识库并合并结果（规则同 RAGService.search_collections）
+
+        Args:
+            kb_ids: 知识库ID列表
+            query: 查询文本
+            top_k: 返回最相关的前N个结果（全局）
+            similarity_threshold: 相似度阈值（0-1之间）
+            embedding_models: {知识库ID: 嵌入模型}，未列出的知识库使用默认嵌入模型
+            timeout: 单个知识库的检索截止时间（秒），不指定则使用 SEARCH_COLLECTION_TIMEOUT
+            merge_key: 合并排序键，score 或 similarity
+
+        Returns:
+            按合并键降序排列的检索结果列表，每项包含 kb_id
+        """
+        if not kb_ids:
+            return []
+
+        rag = self.rag
+        embedding_models = embedding_models or {}
+        if timeout is None:
+            timeout = rag.search_timeout
+
+        models = {kb_id: embedding_models.get(kb_id) or rag.embedding_model for kb_id in kb_ids}
+        distinct_models = list(dict.fromkeys(models.values()))
+        embeddings = await asyncio.gather(
+            *(self.get_query_embedding(query, model) for model in distinct_models)
+        )
+        query_embeddings = dict(zip(distinct_models, embeddings))
+
+        tasks = {
+            asyncio.ensure_future(self._retrieve_one(
+                kb_id, query, query_embeddings[models[kb_id]], top_k, similarity_threshold
+            )): kb_id
+            for kb_id in kb_ids
+        }
+        done, not_done = await asyncio.wait(tasks, timeout=timeout or None)
+
+        per_collection = []
+        for task in done:
+            try:
+                documents = task.result()
+            except Exception as e:
+                self.logger.warning(f'检索知识库 {tasks[task]} 失败: {str(e)}')
+                continue
+            for doc in documents:
+                doc['kb_id'] = tasks[task]
+            per_collection.append(documents)
+
+        if not_done:
+            for task in not_done:
+                task.cancel()
+            self.logger.warning(
+                f'检索超时（{timeout}s），跳过知识库: {", ".join(tasks[t] for t in not_done)}'
+            )
+
+        merged = rag._merge_results(per_collection, top_k, merge_key)
+        self.logger.info(f'在 {len(kb_ids)} 个知识库中检索到 {len(merged)} 个相关文档')
+        return merged
+
+    async def generate_answer_stream(
+        self,
+        question: str,
+        context_documents: List[Dict[str, Any]],
+        model_name: str = None,
+        temperature: float = None,
+        max_tokens: int = None
+    ) -> AsyncIterator[str]:
+        """
+        使用 LLM 流式生成答案（Ollama OpenAI 兼容接口）
+
+        Args:
+            question: 用户问题
+            context_documents: 检索到的上下文文档
+            model_name: 使用的模型名称（如不指定则使用默认模型）
+            temperature: 温度参数
+            max_tokens: 最大token数
+
+        Yields:
+            按到达顺序返回的答案片段
+        """
+        model_name = model_name or self.default_llm_model
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.llm_timeout)
+
+        async with self._get_session().post(
+            f"{self.ollama_base_url}/v1/chat/completions",
+            json={
+                "model": model_name,
+                "messages": self.rag._build_messages(question, context_documents),
+                "temperature": self.temperature if temperature is None else temperature,
+                "max_tokens": self.max_tokens if max_tokens is None else max_tokens,
+                "stream": True
+            },
+            timeout=timeout
+        ) as response:
+            response.raise_for_status()
+
+            # OpenAI 兼容的 SSE 格式: "data: {...}"，以 "data: [DONE]" 结束
+            async for raw_line in response.content:
+                line = raw_line.decode('utf-8').strip()
+                if not line.startswith('data:'):
+                    continue
+
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+
+                choices = json.loads(payload).get('choices') or []
+                if not choices:
+                    continue
+
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+
+        self.logger.info(f'使用模型 {model_name} 流式生成了答案')
+
+    async def chat_stream(
+        self,
+        question: str,
+        kb_id: str = None,
+        model_name: str = None,
+        top_k: int = 5,
+        similarity_threshold: float = 0.7,
+        embedding_model: str = None,
+        kb_ids: List[str] = None,
+        embedding_models: Dict[str, str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式 RAG 问答流程（事件格式同 RAGService.chat_stream）
+
+        Yields:
+            {'type': 'references', 'references': [...], 'context_count': n}
+            {'type': 'token', 'content': '...'}
+        """
+        start = time.perf_counter()
+        if kb_id:
+            mode = 'single'
+            context_documents = await self.search_documents(
+                kb_id, question, top_k, similarity_threshold, embedding_model
+            )
+        elif kb_ids:
+            mode = 'all'
+            context_documents = await self.search_collections(
+                kb_ids, question, top_k, similarity_threshold,
+                embedding_models=embedding_models, merge_key='similarity'
+            )
+        else:
+            mode = 'none'
+            context_documents = []
+        metrics.observe_stage('chat', 'retrieve', time.perf_counter() - start)
+        metrics.record_retrieval(mode, len(context_documents))
+
+        # 与同步服务共用问答结果缓存
+        cache_key = self.rag._answer_cache_key(
+            question, kb_id, kb_ids, model_name, embedding_model, context_documents
+        )
+        cached = self.rag.answer_cache.get(**cache_key)
+        if cached is not None:
+            self.logger.info('命中问答结果缓存')
+            yield {
+                'type': 'references',
+                'references': cached['references'],
+                'context_count': len(context_documents)
+            }
+            yield {'type': 'token', 'content': cached['answer']}
+            return
+
+        references = self.rag._build_references(context_documents)
+        yield {
+            'type': 'references',
+            'references': references,
+            'context_count': len(context_documents)
+        }
+
+        answer_parts = []
+        start = time.perf_counter()
+        async for content in self.generate_answer_stream(question, context_documents, model_name):
+            if not answer_parts:
+                metrics.observe_stage('chat', 'llm_first_token', time.perf_counter() - start)
+            answer_parts.append(content)
+            yield {'type': 'token', 'content': content}
+        metrics.observe_stage('chat', 'llm', time.perf_counter() - start)
+        metrics.record_tokens(completion_tokens=len(answer_parts))
+
+        self.rag.answer_cache.set(answer=''.join(answer_parts), references=references, **cache_key)
+
+    async def chat(self, question: str, **options) -> Dict[str, Any]:
+        """
+        完整的 RAG 问答流程（参数同 chat_stream）
+
+        Returns:
+            包含答案和引用的字典
+        """
+        answer_parts = []
+        references = []
+        context_count = 0
+        async for event in self.chat_stream(question, **options):
+            if event['type'] == 'references':
+                references = event['references']
+                context_count = event['context_count']
+            else:
+                answer_parts.append(event['content'])
+
+        return {
+            'answer': ''.join(answer_parts),
+            'references': references,
+            'context_count': context_count
+        }
+
+
+# 全局异步 RAG 服务实例
+async_rag_service = AsyncRAGService()
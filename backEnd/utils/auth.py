@@ -74,6 +74,44 @@ def verify_token(token):
         return None
 
 
+def authenticate(auth_header):
+    """
+    校验 Authorization 头并加载用户（需要应用上下文）
+    
+    Args:
+        auth_header: Authorization 请求头
+    
+    Returns:
+        tuple: (user, payload, None)，校验失败时为 (None, None, (错误码, 错误信息))；
+        user 为 CachedUser 用户快照，需要修改用户时请按 ID 重新查询 User
+    """
+    if not auth_header:
+        current_app.logger.warning('缺少Authorization头')
+        return None, None, (401, '请先登录')
+    
+    from utils.user_cache import auth_cache
+    
+    token = auth_header[7:] if auth_header.startswith('Bearer ') else auth_header
+    
+    # 验证token（同一token重复请求时使用已解码的载荷）
+    payload = auth_cache.get_payload(token)
+    if payload is None:
+        payload = verify_token(token)
+        if not payload:
+            return None, None, (401, '登录已过期，请重新登录')
+        auth_cache.set_payload(token, payload)
+    
+    # 查询用户信息（短时缓存的用户快照）
+    user = auth_cache.get_user(payload['user_id'])
+    if not user:
+        return None, None, (401, '用户不存在')
+    
+    if not user.is_active():
+        return None, None, (403, '账号已被禁用')
+    
+    return user, payload, None
+
+
 def require_auth(f):
     """
     需要登录的装饰器
@@ -82,31 +120,13 @@ def require_auth(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 获取Authorization头
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header:
-            current_app.logger.warning('缺少Authorization头')
-            return error_response(401, '请先登录')
+        user, payload, error = authenticate(request.headers.get('Authorization'))
+        if error:
+            return error_response(*error)
         
-        # 验证token
-        payload = verify_token(auth_header)
-        if not payload:
-            return error_response(401, '登录已过期，请重新登录')
-        
-        # 存储用户ID到g对象
+        # 存储用户信息到g对象
         g.user_id = payload['user_id']
         g.token_payload = payload
-        
-        # 查询用户信息（可选）
-        from models.user import User
-        user = User.query.get(g.user_id)
-        if not user:
-            return error_response(401, '用户不存在')
-        
-        if not user.is_active():
-            return error_response(403, '账号已被禁用')
-        
         g.current_user = user
         
         return f(*args, **kwargs)
@@ -137,6 +157,6 @@ def get_current_user_id():
 
 
 def get_current_user():
-    """获取当前登录用户对象"""
+    """获取当前登录用户快照（CachedUser）"""
     return getattr(g, 'current_user', None)
 
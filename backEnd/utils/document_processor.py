@@ -4,10 +4,37 @@
 """
 import os
 import re
-from typing import List, Dict, Any
+import json
+import codecs
+import logging
+import tempfile
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import PyPDF2
 import pdfplumber
-from flask import current_app
+from flask import current_app, has_app_context
+
+
+# 文本清理规则（_clean_text 与流式清理共用）
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_SPECIAL_CHAR_PATTERN = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9\s\.,!?;:，。！？；：、""''（）\(\)\-—]')
+
+# 分块分隔符（按优先级）
+DEFAULT_SEPARATORS = ['\n\n', '\n', '。', '！', '？', ';', '；', ',', '，', ' ']
+
+# TXT 文件尝试的编码及流式读取的块大小（字符数）
+TXT_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'utf-16']
+READ_BLOCK_SIZE = 64 * 1024
+
+# 按词元分块时，缓冲区达到 块大小 × 该倍数 个字符后才分词切块，减少重复分词
+TOKEN_DRAIN_FACTOR = 4
+
+
+def _get_logger() -> logging.Logger:
+    """获取日志记录器（在解析子进程中没有应用上下文）"""
+    if has_app_context():
+        return current_app.logger
+    return logging.getLogger(__name__)
 
 
 class DocumentProcessor:
@@ -25,36 +52,103 @@ class DocumentProcessor:
             提取的文本内容
         """
         try:
-            text = ""
-            
-            # 优先使用 pdfplumber（效果更好）
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-            except Exception as e:
-                current_app.logger.warning(f'pdfplumber 解析失败，尝试使用 PyPDF2: {str(e)}')
-                
-                # 备用方案：使用 PyPDF2
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for page in pdf_reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-            
-            # 清理文本
-            text = DocumentProcessor._clean_text(text)
+            text = DocumentProcessor._join_cleaned(DocumentProcessor.iter_pdf_pieces(file_path))
             
-            current_app.logger.info(f'PDF 解析成功，提取文本长度: {len(text)} 字符')
+            _get_logger().info(f'PDF 解析成功，提取文本长度: {len(text)} 字符')
             return text
             
         except Exception as e:
-            current_app.logger.error(f'PDF 解析失败: {str(e)}', exc_info=True)
+            _get_logger().error(f'PDF 解析失败: {str(e)}', exc_info=True)
             raise Exception(f'PDF 文件解析失败: {str(e)}')
     
+    @staticmethod
+    def iter_pdf_pages(file_path: str, start: int = 0, end: int = None) -> Iterator[str]:
+        """
+        逐页提取 PDF 文本（可只提取一个页码区间，用于分片并行解析）
+        
+        Args:
+            file_path: PDF 文件路径
+            start: 起始页（从 0 开始，包含）
+            end: 结束页（不包含），不指定则到最后一页
+            
+        Yields:
+            各页的原始文本（无文本的页为空字符串）
+        """
+        extracted = 0
+        
+        # 优先使用 pdfplumber（效果更好）
+        try:
+            with pdfplumber.open(file_path) as pdf:
+                for page in pdf.pages[start:end]:
+                    page_text = page.extract_text() or ''
+                    # 释放页面解析缓存，内存不随页数增长
+                    page.flush_cache()
+                    extracted += 1
+                    yield page_text
+            return
+        except Exception as e:
+            _get_logger().warning(f'pdfplumber 解析失败，尝试使用 PyPDF2: {str(e)}')
+        
+        # 备用方案：使用 PyPDF2（从 pdfplumber 失败的页继续）
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            page_count = len(pdf_reader.pages)
+            stop = page_count if end is None else min(end, page_count)
+            for index in range(start + extracted, stop):
+                yield pdf_reader.pages[index].extract_text() or ''
+    
+    @staticmethod
+    def extract_pdf_pages(file_path: str, start: int = 0, end: int = None) -> List[str]:
+        """
+        按页提取 PDF 文本
+        
+        Args:
+            file_path: PDF 文件路径
+            start: 起始页（从 0 开始，包含）
+            end: 结束页（不包含），不指定则到最后一页
+            
+        Returns:
+            各页的原始文本列表（无文本的页为空字符串）
+        """
+        return list(DocumentProcessor.iter_pdf_pages(file_path, start, end))
+    
+    @staticmethod
+    def iter_pdf_pieces(
+        file_path: str = None,
+        pages: Iterable[str] = None,
+        first_page: int = 1
+    ) -> Iterator[Tuple[str, int]]:
+        """
+        将 PDF 页面文本转换为带页码的文本片段
+        
+        Args:
+            file_path: PDF 文件路径（不指定 pages 时从文件逐页读取）
+            pages: 已提取的各页原始文本
+            first_page: 第一页的页码
+            
+        Yields:
+            (文本片段, 页码)
+        """
+        if pages is None:
+            pages = DocumentProcessor.iter_pdf_pages(file_path)
+        for page_number, page_text in enumerate(pages, start=first_page):
+            if page_text:
+                yield page_text + "\n", page_number
+    
+    @staticmethod
+    def get_pdf_page_count(file_path: str) -> int:
+        """
+        获取 PDF 页数（只读取页面目录，不解析内容）
+        
+        Args:
+            file_path: PDF 文件路径
+            
+        Returns:
+            页数
+        """
+        with open(file_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+    
     @staticmethod
     def extract_text_from_word(file_path: str) -> str:
         """
@@ -67,38 +161,45 @@ class DocumentProcessor:
             提取的文本内容
         """
         try:
-            # 尝试导入 python-docx
-            try:
-                import docx
-            except ImportError:
-                raise Exception('需要安装 python-docx: pip install python-docx')
-            
-            doc = docx.Document(file_path)
-            text = ""
-            
-            # 提取段落文本
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text += paragraph.text + "\n"
-            
-            # 提取表格文本
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text += cell.text + " "
-                    text += "\n"
-            
-            # 清理文本
-            text = DocumentProcessor._clean_text(text)
-            
-            current_app.logger.info(f'Word 解析成功，提取文本长度: {len(text)} 字符')
+            text = DocumentProcessor._join_cleaned(DocumentProcessor.iter_word_pieces(file_path))
+            
+            _get_logger().info(f'Word 解析成功，提取文本长度: {len(text)} 字符')
             return text
             
         except Exception as e:
-            current_app.logger.error(f'Word 解析失败: {str(e)}', exc_info=True)
+            _get_logger().error(f'Word 解析失败: {str(e)}', exc_info=True)
             raise Exception(f'Word 文件解析失败: {str(e)}')
     
+    @staticmethod
+    def iter_word_pieces(file_path: str) -> Iterator[Tuple[str, None]]:
+        """
+        逐段提取 Word 文本（先段落后表格）
+        
+        Args:
+            file_path: Word 文件路径
+            
+        Yields:
+            (文本片段, None)
+        """
+        # 尝试导入 python-docx
+        try:
+            import docx
+        except ImportError:
+            raise Exception('需要安装 python-docx: pip install python-docx')
+        
+        doc = docx.Document(file_path)
+        
+        # 提取段落文本
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():
+                yield paragraph.text + "\n", None
+        
+        # 提取表格文本
+        for table in doc.tables:
+            for row in table.rows:
+                cells = [cell.text + " " for cell in row.cells if cell.text.strip()]
+                yield ''.join(cells) + "\n", None
+    
     @staticmethod
     def extract_text_from_txt(file_path: str) -> str:
         """
@@ -111,31 +212,59 @@ class DocumentProcessor:
             提取的文本内容
         """
         try:
-            # 尝试多种编码
-            encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16']
-            
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        text = file.read()
-                    
-                    # 清理文本
-                    text = DocumentProcessor._clean_text(text)
-                    
-                    current_app.logger.info(
-                        f'TXT 解析成功（编码: {encoding}），提取文本长度: {len(text)} 字符'
-                    )
-                    return text
-                    
-                except UnicodeDecodeError:
-                    continue
+            encoding = DocumentProcessor.detect_encoding(file_path)
+            text = DocumentProcessor._join_cleaned(DocumentProcessor.iter_txt_pieces(file_path, encoding))
             
-            raise Exception('无法识别文件编码，请确保文件为 UTF-8 或 GBK 编码')
+            _get_logger().info(
+                f'TXT 解析成功（编码: {encoding}），提取文本长度: {len(text)} 字符'
+            )
+            return text
             
         except Exception as e:
-            current_app.logger.error(f'TXT 解析失败: {str(e)}', exc_info=True)
+            _get_logger().error(f'TXT 解析失败: {str(e)}', exc_info=True)
             raise Exception(f'TXT 文件解析失败: {str(e)}')
     
+    @staticmethod
+    def detect_encoding(file_path: str) -> str:
+        """
+        识别 TXT 文件编码（增量解码整个文件，不在内存中保留文本）
+        
+        Args:
+            file_path: TXT 文件路径
+            
+        Returns:
+            第一个能完整解码文件的编码
+        """
+        for encoding in TXT_ENCODINGS:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                with open(file_path, 'rb') as file:
+                    for block in iter(lambda: file.read(READ_BLOCK_SIZE), b''):
+                        decoder.decode(block)
+                decoder.decode(b'', final=True)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        
+        raise Exception('无法识别文件编码，请确保文件为 UTF-8 或 GBK 编码')
+    
+    @staticmethod
+    def iter_txt_pieces(file_path: str, encoding: str = None) -> Iterator[Tuple[str, None]]:
+        """
+        分块读取 TXT 文本
+        
+        Args:
+            file_path: TXT 文件路径
+            encoding: 文件编码（不指定则自动识别）
+            
+        Yields:
+            (文本片段, None)
+        """
+        encoding = encoding or DocumentProcessor.detect_encoding(file_path)
+        with open(file_path, 'r', encoding=encoding) as file:
+            for block in iter(lambda: file.read(READ_BLOCK_SIZE), ''):
+                yield block, None
+    
     @staticmethod
     def extract_text(file_path: str, file_type: str = None) -> str:
         """
@@ -161,6 +290,36 @@ class DocumentProcessor:
         else:
             raise Exception(f'不支持的文件类型: {file_type}')
     
+    @staticmethod
+    def iter_text_pieces(file_path: str, file_type: str = None) -> Iterator[Tuple[str, Optional[int]]]:
+        """
+        根据文件类型流式提取文本片段
+        
+        Args:
+            file_path: 文件路径
+            file_type: 文件类型（可选，自动从扩展名判断）
+            
+        Yields:
+            (原始文本片段, 页码)，非 PDF 文档页码为 None
+        """
+        if not file_type:
+            _, ext = os.path.splitext(file_path)
+            file_type = ext.lower().lstrip('.')
+        
+        if file_type == 'pdf':
+            extractor, label = DocumentProcessor.iter_pdf_pieces(file_path), 'PDF'
+        elif file_type in ['doc', 'docx']:
+            extractor, label = DocumentProcessor.iter_word_pieces(file_path), 'Word'
+        elif file_type == 'txt':
+            extractor, label = DocumentProcessor.iter_txt_pieces(file_path), 'TXT'
+        else:
+            raise Exception(f'不支持的文件类型: {file_type}')
+        
+        try:
+            yield from extractor
+        except Exception as e:
+            raise Exception(f'{label} 文件解析失败: {str(e)}')
+    
     @staticmethod
     def _clean_text(text: str) -> str:
         """
@@ -173,10 +332,10 @@ class DocumentProcessor:
             清理后的文本
         """
         # 移除多余的空白字符
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_PATTERN.sub(' ', text)
         
         # 移除特殊字符（保留中文、英文、数字、常用标点）
-        text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s\.,!?;:，。！？；：、""''（）\(\)\-—]', '', text)
+        text = _SPECIAL_CHAR_PATTERN.sub('', text)
         
         # 移除多余的换行
         text = re.sub(r'\n\s*\n', '\n', text)
@@ -186,86 +345,384 @@ class DocumentProcessor:
         
         return text
     
+    @staticmethod
+    def iter_clean_text(pieces: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[str, Any]]:
+        """
+        流式清理文本
+        
+        逐片段处理，拼接结果与对全文调用 _clean_text 完全一致：
+        跨片段的连续空白只保留一个空格，全文首尾空白被去除。
+        
+        Args:
+            pieces: (原始文本片段, 页码) 序列
+            
+        Yields:
+            (清理后的文本片段, 页码)
+        """
+        previous_ends_with_space = False
+        started = False
+        pending_space = ''
+        
+        for piece, page in pieces:
+            if not piece:
+                continue
+            
+            collapsed = _WHITESPACE_PATTERN.sub(' ', piece)
+            if previous_ends_with_space and collapsed.startswith(' '):
+                collapsed = collapsed[1:]
+            previous_ends_with_space = collapsed.endswith(' ') or (
+                previous_ends_with_space and not collapsed
+            )
+            
+            cleaned = _SPECIAL_CHAR_PATTERN.sub('', collapsed)
+            if not started:
+                cleaned = cleaned.lstrip()
+                if not cleaned:
+                    continue
+                started = True
+            
+            # 片段末尾的空白暂缓输出，后面没有内容时即为全文结尾空白
+            body = cleaned.rstrip()
+            if body:
+                yield pending_space + body, page
+                pending_space = cleaned[len(body):]
+            else:
+                pending_space += cleaned
+    
+    @staticmethod
+    def iter_split_text(
+        pieces: Iterable[Tuple[str, Any]],
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        separators: List[str] = None
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        流式分块已清理的文本
+        
+        清理后的文本不含换行，结果与对拼接后的全文调用 split_text 一致；
+        缓冲区只保留尚未输出的部分，内存占用与文档大小无关。
+        
+        Args:
+            pieces: (清理后的文本片段, 页码) 序列
+            chunk_size: 每个块的大小（字符数）
+            chunk_overlap: 块之间的重叠大小
+            separators: 分隔符列表（按优先级）
+            
+        Yields:
+            (文本块, 块起始位置所在的页码)
+        """
+        if not separators:
+            separators = DEFAULT_SEPARATORS
+        
+        buffer = ''
+        position = 0  # buffer 中尚未输出部分的起点
+        base = 0  # buffer[0] 在全文中的偏移
+        page_offsets: List[int] = []
+        page_numbers: List[Any] = []
+        
+        def page_at(offset):
+            index = bisect_right(page_offsets, offset) - 1
+            return page_numbers[index] if index >= 0 else None
+        
+        for piece, page in pieces:
+            if page is not None and (not page_numbers or page_numbers[-1] != page):
+                page_offsets.append(base + len(buffer))
+                page_numbers.append(page)
+            
+            buffer = buffer[position:] + piece
+            base += position
+            position = 0
+            
+            while len(buffer) - position > chunk_size:
+                # 找到合适的分割点
+                split_point = DocumentProcessor._find_split_point(
+                    buffer, position, chunk_size, separators
+                )
+                
+                chunk = buffer[position:position + split_point]
+                leading = len(chunk) - len(chunk.lstrip())
+                yield chunk.strip(), page_at(base + position + leading)
+                
+                # 准备下一块（带重叠）
+                if chunk_overlap > 0:
+                    position += max(0, split_point - chunk_overlap) or split_point
+                else:
+                    position += split_point
+        
+        # 添加最后一块
+        rest = buffer[position:]
+        if rest.strip():
+            leading = len(rest) - len(rest.lstrip())
+            yield rest.strip(), page_at(base + position + leading)
+    
+    @staticmethod
+    def iter_split_tokens(
+        pieces: Iterable[Tuple[str, Any]],
+        token_counter,
+        chunk_size: int = 512,
+        chunk_overlap: int = 64,
+        separators: List[str] = None
+    ) -> Iterator[Tuple[str, Any, int]]:
+        """
+        按词元数流式分块已清理的文本
+        
+        与 iter_split_text 的分割规则相同（优先在窗口后半段的分隔符处切分），
+        但块大小和重叠以嵌入模型的词元数计算；词元数来自切块时的分词结果，无需再次分词。
+        
+        Args:
+            pieces: (清理后的文本片段, 页码) 序列
+            token_counter: 词元计数器（utils.tokenizer.TokenCounter）
+            chunk_size: 每个块的最大词元数
+            chunk_overlap: 块之间重叠的词元数
+            separators: 分隔符列表（按优先级）
+            
+        Yields:
+            (文本块, 块起始位置所在的页码, 词元数)
+        """
+        if not separators:
+            separators = DEFAULT_SEPARATORS
+        
+        buffer = ''
+        base = 0  # buffer[0] 在全文中的偏移
+        drain_length = chunk_size * TOKEN_DRAIN_FACTOR  # 缓冲区达到该长度时分词切块
+        page_offsets: List[int] = []
+        page_numbers: List[Any] = []
+        
+        def page_at(offset):
+            index = bisect_right(page_offsets, offset) - 1
+            return page_numbers[index] if index >= 0 else None
+        
+        def drain(final):
+            """切出缓冲区中词元数足够的块，返回剩余文本在缓冲区中的起点"""
+            offsets = token_counter.offsets(buffer)
+            starts = [token_start for token_start, _ in offsets]
+            start = 0  # 当前块的起始词元
+            
+            while len(offsets) - start > chunk_size:
+                char_start = starts[start]
+                window = offsets[start + chunk_size - 1][1] - char_start
+                split_char = char_start + DocumentProcessor._find_split_point(
+                    buffer, char_start, window, separators
+                )
+                # 分割点之后开始的词元归入下一块，每块至少 1 个、至多 chunk_size 个词元
+                split = bisect_left(starts, split_char, start + 1, start + chunk_size)
+                
+                chunk = buffer[char_start:starts[split]]
+                leading = len(chunk) - len(chunk.lstrip())
+                yield chunk.strip(), page_at(base + char_start + leading), split - start
+                
+                # 准备下一块（带重叠）
+                next_start = split - chunk_overlap if chunk_overlap > 0 else split
+                start = next_start if next_start > start else split
+            
+            if final:
+                if start < len(offsets):
+                    rest = buffer[starts[start]:]
+                    if rest.strip():
+                        leading = len(rest) - len(rest.lstrip())
+                        yield rest.strip(), page_at(base + starts[start] + leading), len(offsets) - start
+                return len(buffer)
+            return starts[start] if start < len(offsets) else len(buffer)
+        
+        for piece, page in pieces:
+            if page is not None and (not page_numbers or page_numbers[-1] != page):
+                page_offsets.append(base + len(buffer))
+                page_numbers.append(page)
+            
+            buffer += piece
+            if len(buffer) >= drain_length:
+                consumed = yield from drain(final=False)
+                buffer = buffer[consumed:]
+                base += consumed
+                # 剩余部分不足一块，再读入足够的文本后才重新分词
+                drain_length = len(buffer) + chunk_size * TOKEN_DRAIN_FACTOR
+        
+        yield from drain(final=True)
+    
+    @staticmethod
+    def iter_chunks_with_metadata(
+        pieces: Iterable[Tuple[str, Any]],
+        document_id: str,
+        document_name: str,
+        kb_id: str,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        file_type: str = None,
+        token_counter=None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式清理、分块原始文本片段并附加元数据
+        
+        块总数在分块结束前未知，元数据中不包含 chunk_total，由调用方在入库完成后补写。
+        指定 token_counter 时块大小和重叠按词元数计算，元数据中记录每块的词元数 token_count。
+        
+        Args:
+            pieces: (原始文本片段, 页码) 序列
+            document_id: 文档ID
+            document_name: 文档名称
+            kb_id: 知识库ID
+            chunk_size: 块大小
+            chunk_overlap: 重叠大小
+            file_type: 文件类型
+            token_counter: 词元计数器，不指定则按字符数分块
+            
+        Yields:
+            包含元数据的块
+        """
+        text_length = 0
+        
+        def counted(cleaned_pieces):
+            nonlocal text_length
+            for piece, page in cleaned_pieces:
+                text_length += len(piece)
+                yield piece, page
+        
+        cleaned = counted(DocumentProcessor.iter_clean_text(pieces))
+        if token_counter is not None:
+            chunks = DocumentProcessor.iter_split_tokens(cleaned, token_counter, chunk_size, chunk_overlap)
+        else:
+            chunks = (
+                (chunk_text, page, None)
+                for chunk_text, page in DocumentProcessor.iter_split_text(cleaned, chunk_size, chunk_overlap)
+            )
+        
+        def with_metadata(i, chunk_text, page, token_count):
+            metadata = {
+                'document_id': document_id,
+                'document_name': document_name,
+                'kb_id': kb_id,
+                'chunk_index': i,
+                'source': document_name,
+                'file_type': file_type or ''
+            }
+            if page is not None:
+                metadata['page_number'] = page
+            if token_count is not None:
+                metadata['token_count'] = token_count
+            return {
+                'id': f"{document_id}_chunk_{i}",
+                'content': chunk_text,
+                'metadata': metadata
+            }
+        
+        # 保留一个块，全文结束后再确认文本长度有效
+        previous = None
+        for i, (chunk_text, page, token_count) in enumerate(chunks):
+            if previous is not None:
+                yield with_metadata(*previous)
+            previous = (i, chunk_text, page, token_count)
+        
+        if text_length < 10:
+            raise ValueError('文档内容为空或无法解析')
+        if previous is not None:
+            yield with_metadata(*previous)
+    
+    @staticmethod
+    def _join_cleaned(pieces: Iterable[Tuple[str, Any]]) -> str:
+        """流式清理文本片段并拼接为全文"""
+        return ''.join(piece for piece, _ in DocumentProcessor.iter_clean_text(pieces))
+    
     @staticmethod
     def split_text(
         text: str,
         chunk_size: int = 500,
         chunk_overlap: int = 50,
-        separators: List[str] = None
+        separators: List[str] = None,
+        compat: bool = True
     ) -> List[str]:
         """
         智能分块文本
         
+        段落（去除首尾空白的非空行）以换行拼接为一个缓冲区，分块过程只移动缓冲区中的起止偏移，
+        不复制剩余文本，耗时与文本长度成线性关系。
+        
         Args:
             text: 要分块的文本
             chunk_size: 每个块的大小（字符数）
             chunk_overlap: 块之间的重叠大小
             separators: 分隔符列表（按优先级）
-            
+            compat: 兼容模式，分块边界与旧版逐段拼接字符串的实现完全一致
+                （段落间的换行不计入块大小，块最多可能超出 1 个字符）；
+                关闭后段落间的换行计入块大小，块长度严格不超过 chunk_size
+                
         Returns:
             分块后的文本列表
         """
         if not separators:
-            separators = ['\n\n', '\n', '。', '！', '？', ';', '；', ',', '，', ' ']
+            separators = DEFAULT_SEPARATORS
         
-        chunks = []
-        current_chunk = ""
+        # 先按段落分割，拼接为一个缓冲区并记录每个段落的起止位置
+        paragraphs = [paragraph.strip() for paragraph in text.split('\n')]
+        paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+        buffer = '\n'.join(paragraphs)
+        joiner = 0 if compat else 1
         
-        # 先按段落分割
-        paragraphs = text.split('\n')
+        chunks = []
+        start = end = 0  # 当前块为 buffer[start:end]
+        paragraph_start = 0
         
         for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
+            paragraph_end = paragraph_start + len(paragraph)
+            current_length = end - start
             
             # 如果当前块加上新段落不超过限制，直接添加
-            if len(current_chunk) + len(paragraph) <= chunk_size:
-                if current_chunk:
-                    current_chunk += "\n" + paragraph
-                else:
-                    current_chunk = paragraph
+            if current_length + len(paragraph) + (joiner if current_length else 0) <= chunk_size:
+                if not current_length:
+                    start = paragraph_start
+                end = paragraph_end
             else:
                 # 当前块已满，保存并开始新块
-                if current_chunk:
-                    chunks.append(current_chunk)
+                if current_length:
+                    chunks.append(buffer[start:end])
                     
-                    # 添加重叠部分
+                    # 添加重叠部分（重叠文本与新段落在缓冲区中以换行相连）
                     if chunk_overlap > 0:
-                        overlap_text = current_chunk[-chunk_overlap:]
-                        current_chunk = overlap_text + "\n" + paragraph
+                        start = max(start, end - chunk_overlap)
                     else:
-                        current_chunk = paragraph
+                        start = paragraph_start
                 else:
-                    current_chunk = paragraph
+                    start = paragraph_start
+                end = paragraph_end
                 
                 # 如果单个段落就超过了块大小，需要进一步分割
-                while len(current_chunk) > chunk_size:
-                    # 找到合适的分割点
-                    split_point = chunk_size
-                    for sep in separators:
-                        pos = current_chunk.rfind(sep, 0, chunk_size)
-                        if pos > chunk_size // 2:  # 至少要分割一半以上
-                            split_point = pos + len(sep)
-                            break
+                while end - start > chunk_size:
+                    split_point = DocumentProcessor._find_split_point(
+                        buffer, start, chunk_size, separators
+                    )
                     
                     # 保存当前块
-                    chunks.append(current_chunk[:split_point].strip())
+                    chunks.append(buffer[start:start + split_point].strip())
                     
-                    # 准备下一块（带重叠）
+                    # 准备下一块（带重叠）；重叠不小于分割点时至少前进到分割点，避免死循环
                     if chunk_overlap > 0:
-                        overlap_start = max(0, split_point - chunk_overlap)
-                        current_chunk = current_chunk[overlap_start:]
+                        start += max(0, split_point - chunk_overlap) or split_point
                     else:
-                        current_chunk = current_chunk[split_point:]
+                        start += split_point
+            
+            paragraph_start = paragraph_end + 1
         
         # 添加最后一块
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        last_chunk = buffer[start:end].strip()
+        if last_chunk:
+            chunks.append(last_chunk)
         
-        current_app.logger.info(f'文本分块完成: {len(chunks)} 个块')
+        _get_logger().info(f'文本分块完成: {len(chunks)} 个块')
         return chunks
     
+    @staticmethod
+    def _find_split_point(buffer: str, start: int, chunk_size: int, separators: List[str]) -> int:
+        """
+        在 buffer[start:start + chunk_size] 中按分隔符优先级寻找分割点
+        
+        Returns:
+            分割点相对 start 的偏移
+        """
+        for sep in separators:
+            pos = buffer.rfind(sep, start, start + chunk_size) - start
+            if pos > chunk_size // 2:  # 至少要分割一半以上
+                return pos + len(sep)
+        return chunk_size
+    
     @staticmethod
     def create_chunks_with_metadata(
         text: str,
@@ -273,7 +730,8 @@ class DocumentProcessor:
         document_name: str,
         kb_id: str,
         chunk_size: int = 500,
-        chunk_overlap: int = 50
+        chunk_overlap: int = 50,
+        file_type: str = None
     ) -> List[Dict[str, Any]]:
         """
         创建带元数据的文本块
@@ -285,6 +743,7 @@ class DocumentProcessor:
             kb_id: 知识库ID
             chunk_size: 块大小
             chunk_overlap: 重叠大小
+            file_type: 文件类型（写入元数据，用于按类型过滤检索）
             
         Returns:
             包含元数据的块列表
@@ -305,13 +764,165 @@ class DocumentProcessor:
                     'kb_id': kb_id,
                     'chunk_index': i,
                     'chunk_total': len(chunks),
-                    'source': document_name
+                    'source': document_name,
+                    'file_type': file_type or ''
                 }
             })
         
         return chunks_with_metadata
 
 
+class SpooledChunks:
+    """
+    写入临时 JSONL 文件的文本块
+    
+    解析子进程把文本块逐行写入临时文件，父进程逐行读取，两端都不在内存中保留整个文档。
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    yield json.loads(line)
+        finally:
+            self.close()
+    
+    def close(self):
+        """删除临时文件"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def iter_document_chunks(
+    file_path: str,
+    file_type: str,
+    document_id: str,
+    document_name: str,
+    kb_id: str,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    token_counter=None
+) -> Iterator[Dict[str, Any]]:
+    """
+    流式解析文档并分块
+    
+    Args:
+        file_path: 文件路径
+        file_type: 文件类型
+        document_id: 文档ID
+        document_name: 文档名称
+        kb_id: 知识库ID
+        chunk_size: 块大小
+        chunk_overlap: 重叠大小
+        token_counter: 词元计数器，不指定则按字符数分块
+        
+    Yields:
+        包含元数据的块（不含 chunk_total）
+    """
+    pieces = DocumentProcessor.iter_text_pieces(file_path, file_type)
+    return DocumentProcessor.iter_chunks_with_metadata(
+        pieces, document_id, document_name, kb_id, chunk_size, chunk_overlap, file_type, token_counter
+    )
+
+
+def iter_page_chunks(
+    pages: Iterable[str],
+    document_id: str,
+    document_name: str,
+    kb_id: str,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    file_type: str = 'pdf',
+    token_counter=None
+) -> Iterator[Dict[str, Any]]:
+    """
+    对按页提取的 PDF 文本分块（分片解析后在父进程中拼接）
+    
+    Args:
+        pages: 按页顺序排列的原始文本
+        document_id: 文档ID
+        document_name: 文档名称
+        kb_id: 知识库ID
+        chunk_size: 块大小
+        chunk_overlap: 重叠大小
+        file_type: 文件类型
+        token_counter: 词元计数器，不指定则按字符数分块
+        
+    Yields:
+        包含元数据的块（不含 chunk_total）
+    """
+    pieces = DocumentProcessor.iter_pdf_pieces(pages=pages)
+    return DocumentProcessor.iter_chunks_with_metadata(
+        pieces, document_id, document_name, kb_id, chunk_size, chunk_overlap, file_type, token_counter
+    )
+
+
+def extract_and_chunk(
+    file_path: str,
+    file_type: str,
+    document_id: str,
+    document_name: str,
+    kb_id: str,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    spool_dir: str = None,
+    token_counter=None
+) -> Tuple[str, int, Optional[int]]:
+    """
+    解析文档并把文本块写入临时文件（模块级函数，可提交到进程池执行）
+    
+    Args:
+        file_path: 文件路径
+        file_type: 文件类型
+        document_id: 文档ID
+        document_name: 文档名称
+        kb_id: 知识库ID
+        chunk_size: 块大小
+        chunk_overlap: 重叠大小
+        spool_dir: 临时文件目录（不指定则使用系统临时目录）
+        token_counter: 词元计数器，不指定则按字符数分块
+        
+    Returns:
+        (临时文件路径, 块数, 页数)，非 PDF 文档页数为 None
+    """
+    fd, spool_path = tempfile.mkstemp(prefix=f'{document_id}_', suffix='.jsonl', dir=spool_dir)
+    chunk_count = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            for chunk in iter_document_chunks(
+                file_path, file_type, document_id, document_name, kb_id, chunk_size, chunk_overlap,
+                token_counter
+            ):
+                file.write(json.dumps(chunk, ensure_ascii=False))
+                file.write('\n')
+                chunk_count += 1
+    except Exception:
+        os.remove(spool_path)
+        raise
+    
+    page_count = DocumentProcessor.get_pdf_page_count(file_path) if file_type == 'pdf' else None
+    return spool_path, chunk_count, page_count
+
+
+def extract_pdf_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """
+    提取 PDF 的一个页码区间（模块级函数，可提交到进程池执行）
+    
+    Args:
+        file_path: PDF 文件路径
+        start: 起始页（包含）
+        end: 结束页（不包含）
+        
+    Returns:
+        各页的原始文本列表
+    """
+    return DocumentProcessor.extract_pdf_pages(file_path, start, end)
+
+
 # 全局文档处理器实例
 document_processor = DocumentProcessor()
-
@@ -0,0 +1,276 @@
+"""
+查询向量缓存
+相同（或仅空白、大小写不同）的问题直接复用向量，跳过 Ollama 嵌入请求
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from utils.cache import LRUCache
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量缓存
+
+    以（嵌入模型, 归一化文本）为键的进程内 LRU 缓存；配置 persist_dir 后
+    同时写入共享磁盘目录，多个 Web 进程之间可以复用已计算的向量。
+    磁盘条目的修改时间即写入时间：启动时和此后定期（后台线程）删除过期条目、遗留的临时文件，
+    条目数超过 max_disk_entries 时按写入时间删除最旧的条目，降到上限的 90%。
+    """
+
+    # 写入中断遗留的临时文件超过该时间（秒）后删除
+    TMP_FILE_TTL = 3600
+
+    def __init__(
+        self,
+        max_size: int = 2048,
+        ttl: Optional[float] = 86400,
+        persist_dir: Optional[str] = None,
+        max_disk_entries: int = 100000,
+        prune_interval: float = 600,
+        logger: logging.Logger = None
+    ):
+        """
+        Args:
+            max_size: 内存中最多缓存的向量数
+            ttl: 过期时间（秒），None 或 0 表示不过期
+            persist_dir: 共享磁盘缓存目录（不指定则只使用内存缓存）
+            max_disk_entries: 磁盘缓存最多保留的条目数，0 表示不限制
+            prune_interval: 写入后触发磁盘清理的最小间隔（秒）
+            logger: 日志记录器
+        """
+        self.ttl = ttl or None
+        self.persist_dir = persist_dir or None
+        self.max_disk_entries = max_disk_entries or 0
+        self.prune_interval = prune_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._memory = LRUCache(max_size=max_size, ttl=self.ttl)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._prune_lock = threading.Lock()
+        self._pruning = False
+        self._last_prune = time.monotonic()
+        self._writes_since_prune = 0
+
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            self.prune()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        归一化查询文本：全角转半角、去除首尾空白、合并连续空白、忽略大小写
+
+        Args:
+            text: 原始查询文本
+
+        Returns:
+            归一化后的文本
+        """
+        text = unicodedata.normalize('NFKC', text or '')
+        text = re.sub(r'\s+', ' ', text).strip()
+        return text.casefold()
+
+    def make_key(self, model: str, text: str) -> str:
+        """生成缓存键"""
+        raw = f'{model}\x00{self.normalize(text)}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        读取查询向量
+
+        Args:
+            model: 嵌入模型名称
+            text: 查询文本
+
+        Returns:
+            向量，未命中时返回 None
+        """
+        key = self.make_key(model, text)
+
+        embedding = self._memory.get(key)
+        if embedding is not None:
+            self._record(hit=True)
+            return embedding
+
+        if self.persist_dir:
+            embedding = self._read_disk(key)
+            if embedding is not None:
+                self._memory.set(key, embedding)
+                self._record(hit=True, disk=True)
+                return embedding
+
+        self._record(hit=False)
+        return None
+
+    def set(self, model: str, text: str, embedding: List[float]):
+        """
+        写入查询向量
+
+        Args:
+            model: 嵌入模型名称
+            text: 查询文本
+            embedding: 向量
+        """
+        key = self.make_key(model, text)
+        self._memory.set(key, embedding)
+
+        if self.persist_dir:
+            self._write_disk(key, embedding)
+
+    def clear(self):
+        """清空内存缓存"""
+        self._memory.clear()
+
+    def prune(self) -> int:
+        """
+        清理磁盘缓存：删除过期条目和遗留的临时文件，条目数超过上限时删除最旧的条目
+
+        Returns:
+            删除的文件数
+        """
+        if not self.persist_dir:
+            return 0
+
+        now = time.time()
+        removed = 0
+        entries = []
+        for root, _, files in os.walk(self.persist_dir):
+            for name in files:
+                if not name.endswith(('.json', '.tmp')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    age = now - os.stat(path).st_mtime
+                except OSError:
+                    continue
+
+                if name.endswith('.tmp'):
+                    if age > self.TMP_FILE_TTL:
+                        removed += self._remove_file(path)
+                elif self.ttl and age > self.ttl:
+                    removed += self._remove_file(path)
+                else:
+                    entries.append((age, path))
+
+        if self.max_disk_entries and len(entries) > self.max_disk_entries:
+            keep = int(self.max_disk_entries * 0.9)
+            entries.sort()
+            for _, path in entries[keep:]:
+                removed += self._remove_file(path)
+
+        if removed:
+            self.logger.info(f'清理查询向量磁盘缓存: 删除 {removed} 个文件')
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        memory_stats = self._memory.stats()
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'size': memory_stats['size'],
+                'maxSize': memory_stats['maxSize'],
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'diskHits': self.disk_hits,
+                'evictions': memory_stats['evictions'],
+                'hitRate': round(self.hits / total, 4) if total else 0.0,
+                'persistent': bool(self.persist_dir),
+                'maxDiskEntries': self.max_disk_entries
+            }
+
+    def _record(self, hit: bool, disk: bool = False):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+                if disk:
+                    self.disk_hits += 1
+            else:
+                self.misses += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.persist_dir, key[:2], f'{key}.json')
+
+    def _read_disk(self, key: str) -> Optional[List[float]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f'读取查询向量缓存失败: {str(e)}')
+            return None
+
+        if self.ttl and time.time() - entry.get('created_at', 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        return entry.get('embedding')
+
+    def _write_disk(self, key: str, embedding: List[float]):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免其他进程读到半个文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            created_at = time.time()
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump({'created_at': created_at, 'embedding': embedding}, file)
+            os.utime(tmp_path, (created_at, created_at))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.warning(f'写入查询向量缓存失败: {str(e)}')
+            return
+
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        """距上次清理超过 prune_interval，或写入数达到上限的 10% 时，在后台线程中清理磁盘缓存"""
+        now = time.monotonic()
+        with self._prune_lock:
+            self._writes_since_prune += 1
+            due = now - self._last_prune >= self.prune_interval
+            if self.max_disk_entries and self._writes_since_prune >= max(1, self.max_disk_entries // 10):
+                due = True
+            if self._pruning or not due:
+                return
+            self._pruning = True
+            self._last_prune = now
+            self._writes_since_prune = 0
+
+        threading.Thread(target=self._prune_in_background, name='embedding-cache-prune', daemon=True).start()
+
+    def _prune_in_background(self):
+        try:
+            self.prune()
+        except Exception as e:
+            self.logger.warning(f'清理查询向量磁盘缓存失败: {str(e)}')
+        finally:
+            with self._prune_lock:
+                self._pruning = False
+
+    @staticmethod
+    def _remove_file(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            # 其他进程可能已删除
+            return 0
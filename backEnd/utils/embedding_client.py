@@ -0,0 +1,170 @@
+"""
+嵌入向量客户端
+基于 Ollama /api/embed 批量接口，按批并发获取文本向量
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+from utils.http_client import PooledHTTPClient, http_client as default_http_client
+
+
+class EmbeddingError(Exception):
+    """嵌入向量获取失败"""
+
+
+class OllamaEmbeddingClient:
+    """
+    Ollama 批量嵌入客户端
+
+    将文本按 batch_size 切分为多个批次，通过有界线程池并发请求，
+    结果按输入顺序返回；失败的批次单独重试，已成功的批次不会重复请求。
+    重试只在这一层进行，请求不使用连接池的传输层重试。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        batch_size: int = 32,
+        max_workers: int = 4,
+        max_retries: int = 2,
+        retry_backoff: float = 1.0,
+        timeout: int = 60,
+        logger: logging.Logger = None,
+        http_client: PooledHTTPClient = None
+    ):
+        """
+        Args:
+            base_url: Ollama 服务地址
+            model: 默认嵌入模型名称
+            batch_size: 每个批次的文本数量
+            max_workers: 并发批次数上限
+            max_retries: 失败批次的最大重试次数
+            retry_backoff: 重试退避基数（秒），按 2 的指数增长
+            timeout: 单个批次请求超时时间（秒）
+            logger: 日志记录器
+            http_client: 带连接池的 HTTP 客户端（不指定则使用全局连接池）
+        """
+        self.base_url = base_url.rstrip('/') if base_url else base_url
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.http_client = http_client or default_http_client
+
+    def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        批量获取文本的向量嵌入
+
+        Args:
+            texts: 文本列表
+            model: 嵌入模型名称（不指定则使用默认模型）
+
+        Returns:
+            与输入顺序一致的向量列表
+        """
+        if not texts:
+            return []
+
+        model = model or self.model
+        batches = [
+            texts[start:start + self.batch_size]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+
+        pending = list(range(len(batches)))
+        last_errors = {}
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                self.logger.warning(
+                    f'{len(pending)} 个嵌入批次失败，{delay:.1f} 秒后进行第 {attempt} 次重试'
+                )
+                time.sleep(delay)
+
+            pending = self._run_batches(model, batches, pending, results, last_errors)
+            if not pending:
+                break
+
+        if pending:
+            first_error = last_errors.get(pending[0])
+            raise EmbeddingError(
+                f'{len(pending)}/{len(batches)} 个嵌入批次在重试后仍然失败: {first_error}'
+            )
+
+        embeddings = []
+        for batch_embeddings in results:
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _run_batches(self, model, batches, indexes, results, errors) -> List[int]:
+        """
+        并发执行指定批次
+
+        Returns:
+            本轮失败的批次序号列表
+        """
+        failed = []
+
+        # 单批次无需线程池调度
+        if len(indexes) == 1:
+            index = indexes[0]
+            try:
+                results[index] = self._embed_batch(model, batches[index])
+            except Exception as e:
+                errors[index] = e
+                failed.append(index)
+            return failed
+
+        workers = min(self.max_workers, len(indexes))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='embed') as executor:
+            futures = {
+                executor.submit(self._embed_batch, model, batches[index]): index
+                for index in indexes
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    self.logger.warning(f'嵌入批次 {index} 请求失败: {str(e)}')
+                    errors[index] = e
+                    failed.append(index)
+
+        return sorted(failed)
+
+    def _embed_batch(self, model: str, batch: List[str]) -> List[List[float]]:
+        """
+        请求单个批次的嵌入向量
+
+        Args:
+            model: 嵌入模型名称
+            batch: 批次文本
+
+        Returns:
+            批次向量列表
+        """
+        response = self.http_client.post(
+            f"{self.base_url}/api/embed",
+            json={
+                "model": model,
+                "input": batch
+            },
+            timeout=self.timeout,
+            retry=False
+        )
+        response.raise_for_status()
+
+        embeddings = response.json().get('embeddings') or []
+        if len(embeddings) != len(batch):
+            raise EmbeddingError(
+                f'嵌入数量不匹配: 期望 {len(batch)} 个，实际返回 {len(embeddings)} 个'
+            )
+        return embeddings
@@ -0,0 +1,187 @@
+"""
+内容寻址的文本块向量存储
+以 SHA-256(模型名, 文本) 为键保存已计算的向量，重复的文本块只需一次查找
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from contextlib import closing
+from typing import Dict, Iterable, List
+
+
+class EmbeddingStore:
+    """
+    文本块向量存储
+
+    只做按键精确查找，使用 SQLite 键值表（内容哈希 → float32 向量 BLOB），
+    不建向量索引。哈希中已包含模型名，不同模型（维度不同）的向量共用一张表，
+    跨文档、跨知识库共享。知识库集合中已不再引用的哈希由 RAG 服务在删除文本块后调用 delete_many 清理。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            hash TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            vector BLOB NOT NULL
+        ) WITHOUT ROWID;
+    '''
+
+    # 单条 SQL 的最大参数数，避免超出 SQLite 参数数量限制
+    BATCH_SIZE = 500
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def content_hash(model: str, text: str) -> str:
+        """
+        计算文本块的内容哈希
+
+        Args:
+            model: 嵌入模型名称
+            text: 文本内容
+
+        Returns:
+            十六进制 SHA-256 摘要
+        """
+        return hashlib.sha256(f'{model}\x00{text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        批量查找已存储的向量
+
+        Args:
+            model: 嵌入模型名称
+            hashes: 内容哈希列表
+
+        Returns:
+            命中的 {内容哈希: 向量}
+        """
+        hashes = list(dict.fromkeys(hashes))
+        if not hashes:
+            return {}
+
+        found = {}
+        with closing(self._connect()) as conn:
+            for batch in self._batches(hashes):
+                rows = conn.execute(
+                    f'SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({self._placeholders(batch)})',
+                    [model, *batch]
+                )
+                for content_hash, blob in rows:
+                    found[content_hash] = self._unpack(blob)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]):
+        """
+        批量保存向量
+
+        Args:
+            model: 嵌入模型名称
+            embeddings: {内容哈希: 向量}
+        """
+        if not embeddings:
+            return
+
+        rows = [(content_hash, model, self._pack(embedding)) for content_hash, embedding in embeddings.items()]
+        with self._write_lock, closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO embeddings (hash, model, vector) VALUES (?, ?, ?)',
+                    rows
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def delete_many(self, hashes: Iterable[str]) -> int:
+        """
+        批量删除向量
+
+        Args:
+            hashes: 内容哈希列表
+
+        Returns:
+            删除的记录数
+        """
+        hashes = list(dict.fromkeys(hashes))
+        if not hashes:
+            return 0
+
+        deleted = 0
+        with self._write_lock, closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for batch in self._batches(hashes):
+                    cursor = conn.execute(
+                        f'DELETE FROM embeddings WHERE hash IN ({self._placeholders(batch)})',
+                        batch
+                    )
+                    deleted += cursor.rowcount
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return deleted
+
+    def count(self) -> int:
+        """已存储的向量数"""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """获取命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / total, 4) if total else 0.0
+            }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _batches(self, items: List[str]) -> Iterable[List[str]]:
+        for start in range(0, len(items), self.BATCH_SIZE):
+            yield items[start:start + self.BATCH_SIZE]
+
+    @staticmethod
+    def _placeholders(batch: List[str]) -> str:
+        return ', '.join('?' * len(batch))
+
+    @staticmethod
+    def _pack(embedding: List[float]) -> bytes:
+        return array('f', embedding).tobytes()
+
+    @staticmethod
+    def _unpack(blob: bytes) -> List[float]:
+        vector = array('f')
+        vector.frombytes(blob)
+        return vector.tolist()
@@ -0,0 +1,191 @@
+"""
+模型服务 HTTP 连接池
+嵌入、问答、健康检查等对 Ollama 的请求共用一个连接池，保持长连接，
+避免每个请求重新建立 TCP 连接
+"""
+import threading
+from typing import Any, Dict, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledHTTPClient:
+    """
+    带连接池的 HTTP 客户端
+
+    所有线程共用同一个 Session 和 HTTPAdapter（urllib3 连接池是线程安全的，Ollama 接口
+    不使用 cookie，共享 Session 不会串扰请求状态）。每个主机最多 pool_maxsize 个连接，
+    连接用尽时请求排队等待空闲连接，而不是临时新建连接。
+
+    传输层重试按指数退避：连接失败（请求尚未发出）对所有方法重试；502/503/504 响应只对幂等方法
+    （GET 等）重试，POST 生成、对话请求可能已在服务端执行，不重试；读超时一律不重试。
+    自带重试逻辑的调用方（如嵌入客户端按批次重试）传 retry=False，只保留一层重试。
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        connect_timeout: float = 5,
+        read_timeout: float = 60,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5
+    ):
+        """
+        Args:
+            pool_connections: 缓存的主机连接池数量
+            pool_maxsize: 每个主机的最大连接数
+            connect_timeout: 建立连接超时时间（秒）
+            read_timeout: 默认读取超时时间（秒）
+            max_retries: 传输层最大重试次数（连接失败，以及幂等请求的网关错误）
+            retry_backoff: 重试退避基数（秒），按 2 的指数增长
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._session, self._no_retry_session = self._create_sessions()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._failures = 0
+
+    def initialize(self, app):
+        """
+        按应用配置重建连接池
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.pool_connections = app.config.get('HTTP_POOL_CONNECTIONS', 4)
+        self.pool_maxsize = app.config.get('HTTP_POOL_MAXSIZE', 16)
+        self.connect_timeout = app.config.get('HTTP_CONNECT_TIMEOUT', 5)
+        self.read_timeout = app.config.get('HTTP_READ_TIMEOUT', 60)
+        self.max_retries = app.config.get('HTTP_MAX_RETRIES', 2)
+        self.retry_backoff = app.config.get('HTTP_RETRY_BACKOFF', 0.5)
+        self.close()
+
+    def _create_sessions(self) -> Tuple[requests.Session, requests.Session]:
+        """
+        创建挂载连接池适配器的 Session
+
+        Returns:
+            (带传输层重试的 Session, 不重试的 Session)，两者共用同一组连接池
+        """
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            other=0,
+            status=self.max_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            backoff_factor=self.retry_backoff,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=True,
+            max_retries=retry
+        )
+        no_retry_adapter = HTTPAdapter(max_retries=0)
+        no_retry_adapter.poolmanager = adapter.poolmanager
+
+        sessions = []
+        for mounted in (adapter, no_retry_adapter):
+            session = requests.Session()
+            session.mount('http://', mounted)
+            session.mount('https://', mounted)
+            sessions.append(session)
+        return sessions[0], sessions[1]
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Union[float, Tuple[float, float], None] = None,
+        retry: bool = True,
+        **kwargs
+    ) -> requests.Response:
+        """
+        发送请求
+
+        Args:
+            method: 请求方法
+            url: 请求地址
+            timeout: 读取超时时间（秒），或 (连接超时, 读取超时)；不指定则使用默认值
+            retry: 是否使用传输层重试（调用方自行重试时传 False）
+            **kwargs: 传给 requests 的其他参数（json、stream 等）
+
+        Returns:
+            requests.Response 对象
+        """
+        if timeout is None:
+            timeout = self.read_timeout
+        if not isinstance(timeout, tuple):
+            timeout = (self.connect_timeout, timeout)
+
+        with self._lock:
+            self._requests += 1
+            session = self._session if retry else self._no_retry_session
+        try:
+            return session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._failures += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """发送 GET 请求"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """发送 POST 请求"""
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """关闭所有连接并按当前配置重建连接池"""
+        with self._lock:
+            old_sessions = (self._session, self._no_retry_session)
+            self._session, self._no_retry_session = self._create_sessions()
+        for session in old_sessions:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计
+
+        Returns:
+            请求数、失败数和各主机连接池的连接数、空闲连接数、已处理请求数
+        """
+        hosts = []
+        pools = self._session.get_adapter('http://').poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            hosts.append({
+                'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                'maxSize': self.pool_maxsize,
+                'connectionsCreated': pool.num_connections,
+                'idleConnections': idle,
+                'requests': pool.num_requests
+            })
+
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'failures': self._failures,
+                'pools': hosts
+            }
+
+
+# 全局模型服务 HTTP 客户端实例
+http_client = PooledHTTPClient()
+
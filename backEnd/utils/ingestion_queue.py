@@ -0,0 +1,869 @@
+"""
+文档入库任务队列
+上传接口只负责保存文件并登记任务，解析、分块、向量化由后台 worker 完成
+"""
+import os
+import socket
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy.orm.attributes import set_committed_value
+
+from extensions import db
+from utils.helpers import generate_id, get_beijing_now
+from utils.metrics import metrics
+
+
+class IngestionQueue:
+    """
+    基于数据库的入库任务队列
+
+    任务持久化在 ingestion_jobs 表中，worker 通过条件更新领取任务，
+    因此 Web 进程内的线程和独立的 worker 进程可以同时消费同一个队列。
+    执行中的任务由心跳线程定期更新 heartbeat_at（租约），各 worker 定期把心跳超时的任务重新入队，
+    其他进程中仍在运行的任务不会被误判为超时。
+    """
+
+    def __init__(self):
+        self.app = None
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self.parse_workers = 0
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._next_stale_check = 0.0
+        self._stale_check_lock = threading.Lock()
+
+    def initialize(self, app):
+        """
+        初始化队列，并按配置启动进程内 worker 线程
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.app = app
+        self.parse_workers = app.config.get('INGESTION_PARSE_WORKERS', 0)
+        self._check_tokenizer(app)
+        workers = app.config.get('INGESTION_EMBEDDED_WORKERS', 0)
+        if workers > 0:
+            self.start_workers(app, workers)
+
+    @staticmethod
+    def _check_tokenizer(app) -> bool:
+        """
+        按词元分块时检查默认嵌入模型的分词器能否加载，不能加载时在启动时记录一次警告
+
+        Args:
+            app: Flask 应用实例
+
+        Returns:
+            是否使用模型分词器（未按词元分块时返回 True）
+        """
+        if app.config.get('CHUNK_UNIT', 'char') != 'token':
+            return True
+
+        from utils.tokenizer import get_token_counter
+
+        counter = get_token_counter(app.config.get('EMBEDDING_MODEL_NAME'), app.config.get('TOKENIZER_PATH'))
+        if not counter.exact:
+            app.logger.warning(
+                f'CHUNK_UNIT=token 但无法加载嵌入模型 {counter.model_name} 的分词器'
+                f'（检查 tokenizers 依赖和 TOKENIZER_PATH），分块词元数将按字符类别估算'
+            )
+        return counter.exact
+
+    # ------------------------------------------------------------------
+    # 生产者
+    # ------------------------------------------------------------------
+    def enqueue(self, kb_id: str, document_ids: List[str], user_id: str = None, replacement: dict = None):
+        """
+        登记入库任务（调用方负责提交事务）
+
+        Args:
+            kb_id: 知识库ID
+            document_ids: 待处理的文档ID列表
+            user_id: 创建人ID
+            replacement: 替换文档时的新文件信息（document_id, name, file_name, file_path,
+                file_type, file_size, uploaded_by, previous_status），入库成功后才写入文档记录
+
+        Returns:
+            IngestionJob 对象
+        """
+        from models.ingestion_job import IngestionJob
+
+        job = IngestionJob(
+            id=generate_id('job'),
+            knowledge_base_id=kb_id,
+            document_ids=list(document_ids),
+            status='pending',
+            total=len(document_ids),
+            processed=0,
+            failed=0,
+            replacement=replacement,
+            created_by=user_id,
+            created_at=get_beijing_now()
+        )
+        db.session.add(job)
+        return job
+
+    def notify(self):
+        """唤醒空闲的进程内 worker"""
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # 消费者
+    # ------------------------------------------------------------------
+    def claim_next_job(self, worker_name: str = None):
+        """
+        领取一个待处理任务
+
+        Args:
+            worker_name: worker 标识
+
+        Returns:
+            领取成功的 IngestionJob，没有待处理任务时返回 None
+        """
+        from models.ingestion_job import IngestionJob
+
+        candidates = IngestionJob.query.filter_by(status='pending')\
+            .order_by(IngestionJob.created_at.asc())\
+            .limit(5)\
+            .all()
+
+        for job in candidates:
+            # 条件更新保证同一任务只会被一个 worker 领取
+            now = get_beijing_now()
+            claimed = IngestionJob.query.filter_by(id=job.id, status='pending').update({
+                'status': 'running',
+                'worker': worker_name or self._default_worker_name(),
+                'started_at': now,
+                'heartbeat_at': now,
+                'attempts': (job.attempts or 0) + 1
+            }, synchronize_session=False)
+            db.session.commit()
+
+            if claimed == 1:
+                db.session.refresh(job)
+                return job
+
+        return None
+
+    def run_pending(self, max_jobs: Optional[int] = None, worker_name: str = None) -> int:
+        """
+        在当前应用上下文中处理待处理任务
+
+        Args:
+            max_jobs: 最多处理的任务数（不指定则处理到队列为空）
+            worker_name: worker 标识
+
+        Returns:
+            处理的任务数
+        """
+        count = 0
+        while max_jobs is None or count < max_jobs:
+            job = self.claim_next_job(worker_name)
+            if job is None:
+                break
+            with self._heartbeat(job.id, job.worker) as lost:
+                self.process_job(job, lost)
+            count += 1
+        return count
+
+    def heartbeat(self, job_id: str, worker_name: str) -> bool:
+        """
+        更新运行中任务的心跳时间（续租）
+
+        Args:
+            job_id: 任务ID
+            worker_name: 领取任务的 worker 标识
+
+        Returns:
+            任务是否仍由该 worker 执行（已被重新入队或其他 worker 领取时返回 False）
+        """
+        from models.ingestion_job import IngestionJob
+
+        updated = IngestionJob.query.filter_by(id=job_id, status='running', worker=worker_name).update(
+            {'heartbeat_at': get_beijing_now()}, synchronize_session=False
+        )
+        db.session.commit()
+        return updated == 1
+
+    @contextmanager
+    def _heartbeat(self, job_id: str, worker_name: str):
+        """
+        执行任务期间在后台线程中按 INGESTION_HEARTBEAT_INTERVAL 发送心跳
+
+        Yields:
+            租约丢失事件：任务已被重新入队或由其他 worker 领取时置位
+        """
+        app = current_app._get_current_object()
+        interval = app.config.get('INGESTION_HEARTBEAT_INTERVAL', 30)
+        lost = threading.Event()
+        if interval <= 0:
+            yield lost
+            return
+
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(interval):
+                with app.app_context():
+                    try:
+                        if not self.heartbeat(job_id, worker_name):
+                            app.logger.warning(f'入库任务 {job_id} 已不属于 worker {worker_name}，停止心跳')
+                            lost.set()
+                            return
+                    except Exception as e:
+                        app.logger.warning(f'入库任务 {job_id} 心跳失败: {str(e)}')
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=beat, name=f'ingestion-heartbeat-{job_id}', daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stopped.set()
+            thread.join()
+
+    def process_job(self, job, lost: Optional[threading.Event] = None):
+        """
+        执行入库任务
+
+        任务状态和进度只在任务仍由本 worker 执行时写入（条件更新）；租约丢失（心跳发现任务已被
+        重新入队，或进度更新未命中）后不再处理剩余文档，也不覆盖新 worker 的任务状态。
+
+        Args:
+            job: 已领取的 IngestionJob
+            lost: 租约丢失事件（由心跳线程置位）
+        """
+        from models.knowledge_base import KnowledgeBase, Document
+
+        current_app.logger.info(f'开始执行入库任务: {job.id}, 文档数: {job.total}')
+
+        # 提交后 job 会从数据库重新加载，领取者需在开始时记下
+        worker_name = job.worker
+        kb = KnowledgeBase.query.get(job.knowledge_base_id)
+        if not kb:
+            self._update_job(job, worker_name, {
+                'status': 'failed',
+                'error_message': '知识库不存在',
+                'finished_at': get_beijing_now()
+            })
+            return
+
+        replacements = {job.replacement['document_id']: job.replacement} if job.replacement else {}
+        processed = job.processed or 0
+        failed = job.failed or 0
+        documents = []
+        for doc_id in job.document_ids or []:
+            document = Document.query.get(doc_id)
+
+            if document and document.status in ('pending', 'processing'):
+                documents.append(document)
+                continue
+            if document is None:
+                failed += 1
+                if doc_id in replacements:
+                    # 文档已被删除，替换用的新文件不再需要
+                    self._remove_upload(replacements[doc_id]['file_path'])
+            processed += 1
+
+        if not self._update_progress(job, worker_name, kb, processed, failed):
+            return
+
+        # 解析在进程池中并行执行，按完成顺序进入向量化阶段
+        for document, chunks, error in self.parse_documents(documents, kb, replacements):
+            if lost is not None and lost.is_set():
+                current_app.logger.warning(f'入库任务 {job.id} 已被重新入队，放弃剩余文档')
+                return
+
+            if not self.store_document(document, kb, chunks, error, replacements.get(document.id)):
+                failed += 1
+            processed += 1
+
+            if not self._update_progress(job, worker_name, kb, processed, failed):
+                return
+
+        values = {'finished_at': get_beijing_now()}
+        if job.total and failed >= job.total:
+            values.update(status='failed', error_message='所有文档处理失败')
+        else:
+            values['status'] = 'completed'
+        if not self._update_job(job, worker_name, values):
+            current_app.logger.warning(f'入库任务 {job.id} 已不属于 worker {worker_name}，不更新任务状态')
+            return
+
+        kb.progress = 100
+        kb.updated_at = get_beijing_now()
+        db.session.commit()
+
+        current_app.logger.info(
+            f'入库任务完成: {job.id}, 成功: {job.total - failed}, 失败: {failed}'
+        )
+
+    def _update_job(self, job, worker_name: str, values: dict) -> bool:
+        """
+        条件更新任务：仅当任务仍处于 running 且由领取它的 worker 执行时写入
+
+        Args:
+            job: 已领取的 IngestionJob
+            worker_name: 领取任务的 worker 标识
+            values: 要更新的字段
+
+        Returns:
+            是否更新成功（任务已被重新入队或由其他 worker 领取时返回 False）
+        """
+        from models.ingestion_job import IngestionJob
+
+        updated = IngestionJob.query.filter_by(id=job.id, status='running', worker=worker_name).update(
+            values, synchronize_session=False
+        )
+        db.session.commit()
+        if updated != 1:
+            return False
+
+        for key, value in values.items():
+            set_committed_value(job, key, value)
+        return True
+
+    def _update_progress(self, job, worker_name: str, kb, processed: int, failed: int) -> bool:
+        """写入任务进度并同步知识库进度，任务已不属于本 worker 时返回 False"""
+        if not self._update_job(job, worker_name, {'processed': processed, 'failed': failed}):
+            current_app.logger.warning(f'入库任务 {job.id} 已不属于 worker {worker_name}，放弃剩余文档')
+            return False
+
+        kb.progress = job.progress
+        db.session.commit()
+        return True
+
+    def process_document(self, document, kb) -> bool:
+        """
+        解析、分块、向量化单个文档并更新文档状态
+
+        Args:
+            document: Document 对象
+            kb: 所属 KnowledgeBase 对象
+
+        Returns:
+            是否处理成功
+        """
+        for document, chunks, error in self.parse_documents([document], kb):
+            return self.store_document(document, kb, chunks, error)
+        return False
+
+    def parse_documents(
+        self,
+        documents,
+        kb,
+        replacements: Optional[dict] = None
+    ) -> Iterator[Tuple[object, Optional[Iterable[dict]], Optional[Exception]]]:
+        """
+        解析并分块一批文档
+
+        配置了 INGESTION_PARSE_WORKERS 时提交到进程池并行解析，子进程把文本块写入临时文件，
+        按完成顺序返回；页数超过 PDF_SHARD_PAGES 的 PDF 按页码区间拆分到多个进程解析，
+        再按页序拼接分块。未配置进程池时在当前线程中流式解析。PDF 文档同时填写 page_count。
+
+        Args:
+            documents: Document 对象列表
+            kb: 所属 KnowledgeBase 对象
+            replacements: {文档ID: 替换文档的新文件信息}，这些文档解析新文件
+
+        Yields:
+            (文档, 文本块迭代器, 异常)，解析失败时文本块迭代器为 None
+        """
+        from utils.document_processor import (
+            document_processor, SpooledChunks, extract_and_chunk, extract_pdf_page_range,
+            iter_document_chunks, iter_page_chunks
+        )
+        from utils.kb_settings import kb_settings_cache
+        from utils.tokenizer import get_token_counter
+
+        if not documents:
+            return
+
+        for document in documents:
+            document.status = 'processing'
+            document.error_message = None
+        db.session.commit()
+
+        upload_folder = current_app.config.get('UPLOAD_FOLDER')
+        shard_pages = current_app.config.get('PDF_SHARD_PAGES', 50)
+
+        # 分块参数优先使用知识库自己的配置
+        settings = kb_settings_cache.get(kb.id) or {}
+        chunk_size = settings.get('chunk_size') or current_app.config.get('CHUNK_SIZE', 500)
+        chunk_overlap = settings.get('chunk_overlap')
+        if chunk_overlap is None:
+            chunk_overlap = current_app.config.get('CHUNK_OVERLAP', 50)
+        token_counter = None
+        if current_app.config.get('CHUNK_UNIT', 'char') == 'token':
+            # 按知识库嵌入模型的词元数分块
+            chunk_size = current_app.config.get('CHUNK_TOKEN_SIZE', 512)
+            chunk_overlap = current_app.config.get('CHUNK_TOKEN_OVERLAP', 64)
+            token_counter = get_token_counter(
+                settings.get('embedding_model') or current_app.config.get('EMBEDDING_MODEL_NAME'),
+                current_app.config.get('TOKENIZER_PATH')
+            )
+
+        replacements = replacements or {}
+
+        def source_of(document, field):
+            # 替换文档时解析新文件，文档记录在入库成功前保持原文件信息
+            replacement = replacements.get(document.id)
+            return replacement[field] if replacement else getattr(document, field)
+
+        def file_path_of(document):
+            return os.path.join(upload_folder, source_of(document, 'file_path'))
+
+        def parse_args(document):
+            return (
+                file_path_of(document),
+                source_of(document, 'file_type'),
+                document.id,
+                source_of(document, 'name'),
+                kb.id,
+                chunk_size,
+                chunk_overlap
+            )
+
+        def pdf_page_count(document):
+            if source_of(document, 'file_type') != 'pdf':
+                return None
+            try:
+                return document_processor.get_pdf_page_count(file_path_of(document))
+            except Exception:
+                return None
+
+        pool = self._get_parse_pool()
+        if pool is None:
+            for document in documents:
+                document.page_count = pdf_page_count(document)
+                yield document, iter_document_chunks(*parse_args(document), token_counter=token_counter), None
+            return
+
+        # 子进程中不能再创建进程池，大 PDF 的分片在这里直接提交到同一个进程池
+        futures = {}
+        shards = {}
+        for document in documents:
+            page_count = pdf_page_count(document) if shard_pages > 0 else None
+
+            if page_count and page_count > shard_pages:
+                ranges = [
+                    (start, min(start + shard_pages, page_count))
+                    for start in range(0, page_count, shard_pages)
+                ]
+                shards[document.id] = [None] * len(ranges)
+                for index, (start, end) in enumerate(ranges):
+                    future = pool.submit(extract_pdf_page_range, file_path_of(document), start, end)
+                    futures[future] = (document, index)
+            else:
+                future = pool.submit(extract_and_chunk, *parse_args(document), token_counter=token_counter)
+                futures[future] = (document, None)
+
+        failed_ids = set()
+        try:
+            for future in as_completed(futures):
+                document, shard_index = futures[future]
+                if document.id in failed_ids:
+                    continue
+
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    self._reset_parse_pool()
+                    result, error = None, e
+                except Exception as e:
+                    result, error = None, e
+                else:
+                    error = None
+
+                if error is not None:
+                    if shard_index is not None:
+                        failed_ids.add(document.id)
+                        error = Exception(f'PDF 文件解析失败: {str(error)}')
+                    yield document, None, error
+                    continue
+
+                if shard_index is None:
+                    spool_path, _, page_count = result
+                    document.page_count = page_count
+                    yield document, SpooledChunks(spool_path), None
+                    continue
+
+                document_shards = shards[document.id]
+                document_shards[shard_index] = result
+                if any(shard is None for shard in document_shards):
+                    continue
+
+                pages = [page for shard in document_shards for page in shard]
+                document.page_count = len(pages)
+                del shards[document.id]
+                yield document, iter_page_chunks(
+                    pages, document.id, source_of(document, 'name'), kb.id, chunk_size, chunk_overlap,
+                    source_of(document, 'file_type'),
+                    token_counter
+                ), None
+        finally:
+            # 任务中途放弃（租约丢失）时取消尚未开始的解析
+            for future in futures:
+                future.cancel()
+
+    def store_document(
+        self,
+        document,
+        kb,
+        chunks: Optional[Iterable[dict]],
+        error: Optional[Exception] = None,
+        replacement: Optional[dict] = None
+    ) -> bool:
+        """
+        按批向量化文本块并更新文档状态
+
+        文本块按 INGESTION_EMBED_BATCH_SIZE 分批写入向量库，内存占用与文档大小无关；
+        块总数在最后一批时才确定，多批写入时入库完成后补写 chunk_total。
+
+        文档已有入库的文本块时（替换文档、任务重试）按内容哈希与新文本块比对：
+        内容未变的块保留向量只更新元数据，只为新增或变化的块计算向量。
+        消失的块在其他写入都成功后最后删除，中途失败时删除本次新增的块即可恢复原有文本块。
+
+        替换文档时新文件信息在入库成功后才写入文档记录，随后删除旧文件；
+        失败时保留原文件和文档记录，删除新文件。
+
+        Args:
+            document: Document 对象
+            kb: 所属 KnowledgeBase 对象
+            chunks: 文本块迭代器
+            error: 解析阶段的异常
+            replacement: 替换文档的新文件信息
+
+        Returns:
+            是否处理成功
+        """
+        from utils.embedding_store import EmbeddingStore
+        from utils.kb_settings import kb_settings_cache
+        from utils.rag_service import rag_service
+
+        batch_size = current_app.config.get('INGESTION_EMBED_BATCH_SIZE', 256)
+        embedding_model = kb_settings_cache.get_embedding_model(kb.id) or rag_service.embedding_model
+        added_ids = []
+
+        try:
+            if error is not None:
+                raise error
+
+            existing = rag_service.get_chunk_hashes(kb.id, document.id, embedding_model)
+            taken_ids = {chunk_id for chunk_ids in existing.values() for chunk_id in chunk_ids}
+            kept = []
+
+            total = 0
+            batch = []
+            flushed = False
+            for chunk in self._timed_chunks(chunks):
+                total += 1
+                content_hash = EmbeddingStore.content_hash(embedding_model, chunk['content'])
+                same_ids = existing.get(content_hash)
+                if same_ids:
+                    # 内容未变，沿用原文本块ID和向量
+                    if rag_service.embedding_store:
+                        chunk['metadata']['content_hash'] = content_hash
+                    kept.append((same_ids.pop(), chunk['metadata']))
+                    continue
+
+                chunk['id'] = self._unique_chunk_id(chunk['id'], taken_ids)
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    added_ids.extend(item['id'] for item in batch)
+                    rag_service.add_documents(kb.id, batch, embedding_model)
+                    batch = []
+                    flushed = True
+
+            if total == 0:
+                raise ValueError('文档内容为空或无法解析')
+
+            for chunk in batch:
+                chunk['metadata']['chunk_total'] = total
+            if batch:
+                added_ids.extend(item['id'] for item in batch)
+                rag_service.add_documents(kb.id, batch, embedding_model)
+
+            if kept:
+                for _, metadata in kept:
+                    metadata['chunk_total'] = total
+                rag_service.update_chunk_metadata(
+                    kb.id,
+                    [chunk_id for chunk_id, _ in kept],
+                    [metadata for _, metadata in kept]
+                )
+            if flushed:
+                rag_service.update_chunk_total(kb.id, document.id, total)
+            vanished = [chunk_id for chunk_ids in existing.values() for chunk_id in chunk_ids]
+            if vanished:
+                rag_service.delete_chunks(kb.id, vanished)
+
+            old_file_path = None
+            if replacement:
+                old_file_path = document.file_path
+                document.name = replacement['name']
+                document.file_name = replacement['file_name']
+                document.file_path = replacement['file_path']
+                document.file_type = replacement['file_type']
+                document.file_size = replacement['file_size']
+                document.uploaded_by = replacement.get('uploaded_by')
+                document.uploaded_at = get_beijing_now()
+            document.status = 'completed'
+            document.chunk_count = total
+            document.error_message = None
+            document.processed_at = get_beijing_now()
+            with metrics.stage('ingestion', 'db_write'):
+                db.session.commit()
+            metrics.record_ingestion('completed', len(added_ids), len(kept), len(vanished))
+            if old_file_path and old_file_path != document.file_path:
+                self._remove_upload(old_file_path)
+
+            current_app.logger.info(
+                f'文档入库成功: {document.name} (ID: {document.id}), 共 {total} 个块，'
+                f'新增 {len(added_ids)} 个，保留 {len(kept)} 个，删除 {len(vanished)} 个'
+            )
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'文档入库失败: {document.id}: {str(e)}', exc_info=error is None)
+
+            # 清理本次已部分写入的向量块，原有文本块保持不变
+            if added_ids:
+                try:
+                    rag_service.delete_chunks(kb.id, added_ids)
+                except Exception:
+                    pass
+
+            if replacement:
+                # 替换失败：原文件、文档信息和文本块保持不变
+                document.status = replacement.get('previous_status') or 'completed'
+                document.error_message = f'替换文档失败，已保留原文档: {str(e)}'
+                self._remove_upload(replacement['file_path'])
+            else:
+                document.status = 'failed'
+                document.error_message = str(e)
+            document.processed_at = get_beijing_now()
+            db.session.commit()
+            metrics.record_ingestion('failed')
+            return False
+
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    def _remove_upload(file_path: str):
+        """删除上传目录中的文件（不存在时忽略）"""
+        if not file_path:
+            return
+        path = os.path.join(current_app.config.get('UPLOAD_FOLDER'), file_path)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            current_app.logger.warning(f'删除文件失败: {path}, {str(e)}')
+
+    @staticmethod
+    def _timed_chunks(chunks: Iterable[dict]) -> Iterator[dict]:
+        """逐个读取文本块并累计读取耗时（解析和分块按需进行，耗时记为 parse 阶段）"""
+        iterator = iter(chunks)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield chunk
+        finally:
+            metrics.observe_stage('ingestion', 'parse', elapsed)
+
+    @staticmethod
+    def _unique_chunk_id(chunk_id: str, taken_ids: set) -> str:
+        """
+        生成不与文档现有文本块冲突的ID（保留的块沿用原ID，序号可能已经变化）
+
+        Args:
+            chunk_id: 按序号生成的文本块ID
+            taken_ids: 已占用的ID集合（会加入新ID）
+
+        Returns:
+            可用的文本块ID
+        """
+        candidate = chunk_id
+        revision = 1
+        while candidate in taken_ids:
+            candidate = f'{chunk_id}_r{revision}'
+            revision += 1
+        taken_ids.add(candidate)
+        return candidate
+
+    def requeue_stale_jobs(self, timeout_seconds: int) -> int:
+        """
+        将心跳超时的运行中任务重新放回队列（worker 异常退出后的恢复）
+
+        Args:
+            timeout_seconds: 心跳超时时间（秒）
+
+        Returns:
+            重新入队的任务数
+        """
+        from models.ingestion_job import IngestionJob
+        from models.knowledge_base import Document
+
+        deadline = get_beijing_now() - timedelta(seconds=timeout_seconds)
+        last_seen = db.func.coalesce(IngestionJob.heartbeat_at, IngestionJob.started_at)
+        stale_jobs = IngestionJob.query.filter(
+            IngestionJob.status == 'running',
+            last_seen < deadline
+        ).all()
+
+        requeued = 0
+        for job in stale_jobs:
+            # 条件更新：检查期间刚发送过心跳的任务不会被重新入队
+            updated = IngestionJob.query.filter(
+                IngestionJob.id == job.id,
+                IngestionJob.status == 'running',
+                last_seen < deadline
+            ).update({
+                'status': 'pending',
+                'processed': 0,
+                'failed': 0,
+                'worker': None,
+                'heartbeat_at': None
+            }, synchronize_session=False)
+            if updated != 1:
+                continue
+
+            requeued += 1
+            Document.query.filter(
+                Document.id.in_(job.document_ids or []),
+                Document.status == 'processing'
+            ).update({'status': 'pending'}, synchronize_session=False)
+
+        db.session.commit()
+        if requeued:
+            current_app.logger.warning(f'重新入队心跳超时任务: {requeued} 个')
+
+        return requeued
+
+    def _requeue_stale_jobs_periodically(self, app):
+        """按 INGESTION_HEARTBEAT_INTERVAL 检查心跳超时任务（同一进程的多个 worker 线程只检查一次）"""
+        interval = max(app.config.get('INGESTION_HEARTBEAT_INTERVAL', 30), 1)
+        with self._stale_check_lock:
+            now = time.monotonic()
+            if now < self._next_stale_check:
+                return
+            self._next_stale_check = now + interval
+
+        try:
+            self.requeue_stale_jobs(app.config.get('INGESTION_HEARTBEAT_TIMEOUT', 180))
+        except Exception as e:
+            app.logger.warning(f'恢复超时入库任务失败: {str(e)}')
+            db.session.rollback()
+
+    # ------------------------------------------------------------------
+    # worker 线程
+    # ------------------------------------------------------------------
+    def start_workers(self, app, num_workers: int):
+        """
+        启动 worker 线程池
+
+        Args:
+            app: Flask 应用实例
+            num_workers: 线程数
+        """
+        self._stop_event.clear()
+
+        for i in range(num_workers):
+            worker_name = f'{self._default_worker_name()}-{i}'
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(app, worker_name),
+                name=f'ingestion-{i}',
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        app.logger.info(f'入库 worker 已启动: {num_workers} 个线程')
+
+    def stop(self, timeout: float = None):
+        """停止 worker 线程和解析进程池"""
+        self._stop_event.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._reset_parse_pool()
+
+    def join(self):
+        """阻塞等待 worker 线程退出"""
+        for thread in self._threads:
+            thread.join()
+
+    def _worker_loop(self, app, worker_name: str):
+        """worker 主循环：定期恢复心跳超时的任务，有任务时连续处理，空闲时按间隔轮询"""
+        poll_interval = app.config.get('INGESTION_POLL_INTERVAL', 2)
+
+        while not self._stop_event.is_set():
+            processed = 0
+            with app.app_context():
+                try:
+                    self._requeue_stale_jobs_periodically(app)
+                    processed = self.run_pending(max_jobs=1, worker_name=worker_name)
+                except Exception as e:
+                    app.logger.error(f'入库 worker {worker_name} 异常: {str(e)}', exc_info=True)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+            if not processed:
+                self._wakeup.wait(poll_interval)
+                self._wakeup.clear()
+
+    def _get_parse_pool(self) -> Optional[ProcessPoolExecutor]:
+        """获取共享的解析进程池（各 worker 线程共用），未配置时返回 None"""
+        if self.parse_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._parse_pool is None:
+                # spawn 启动子进程，避免 fork 时复制其他线程持有的锁
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._parse_pool
+
+    def _reset_parse_pool(self):
+        """关闭解析进程池（进程池损坏时下次使用会重新创建）"""
+        with self._pool_lock:
+            pool, self._parse_pool = self._parse_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _default_worker_name() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# 全局入库队列实例
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,149 @@
+"""
+知识库检索配置缓存
+问答、检索和入库热路径上按知识库读取 top_k、相似度阈值、分块参数和向量模型，
+避免每条消息都查询知识库表和模型表
+"""
+from typing import Any, Dict, Optional
+
+from utils.cache import LRUCache
+
+
+class KnowledgeBaseSettingsCache:
+    """
+    知识库配置缓存
+
+    缓存的是从数据库行复制出的普通字典，不持有 ORM 对象，可以跨请求、跨线程使用。
+    本进程内通过 /update 等接口修改配置时主动失效；ttl 兜底其他进程修改后的过期时间。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 300):
+        """
+        Args:
+            max_size: 最多缓存的知识库数（模型名称缓存同样大小）
+            ttl: 过期时间（秒），None 或 0 表示不过期
+        """
+        self._settings = LRUCache(max_size=max_size, ttl=ttl)
+        self._model_names = LRUCache(max_size=max_size, ttl=ttl)
+
+    def initialize(self, app):
+        """
+        按应用配置重建缓存
+
+        Args:
+            app: Flask 应用实例
+        """
+        max_size = app.config.get('KB_SETTINGS_CACHE_SIZE', 1024)
+        ttl = app.config.get('KB_SETTINGS_CACHE_TTL', 300)
+        self._settings = LRUCache(max_size=max_size, ttl=ttl)
+        self._model_names = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, kb_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取知识库的检索配置（需要应用上下文，未命中时查询数据库）
+
+        Args:
+            kb_id: 知识库ID
+
+        Returns:
+            {top_k, similarity_threshold, chunk_size, chunk_overlap, vector_model_id, embedding_model, index_config}，
+            知识库不存在时返回 None；embedding_model 为 None 表示使用系统默认嵌入模型
+        """
+        if not kb_id:
+            return None
+
+        settings = self._settings.get(kb_id)
+        if settings is not None:
+            return settings
+
+        from models.knowledge_base import KnowledgeBase
+
+        kb = KnowledgeBase.query.get(kb_id)
+        if kb is None:
+            return None
+
+        settings = {
+            'top_k': kb.top_k,
+            'similarity_threshold': kb.similarity_threshold,
+            'chunk_size': kb.chunk_size,
+            'chunk_overlap': kb.chunk_overlap,
+            'vector_model_id': kb.vector_model_id,
+            'embedding_model': self.get_model_name(kb.vector_model_id),
+            'index_config': dict(kb.index_config or {})
+        }
+        self._settings.set(kb_id, settings)
+        return settings
+
+    def get_model_name(self, model_id: str) -> Optional[str]:
+        """
+        获取模型名称（需要应用上下文，未命中时查询数据库）
+
+        Args:
+            model_id: 模型ID
+
+        Returns:
+            模型名称，模型不存在时返回 None
+        """
+        if not model_id:
+            return None
+
+        name = self._model_names.get(model_id)
+        if name is not None:
+            return name
+
+        from models.model import Model
+
+        model = Model.query.get(model_id)
+        if model is None:
+            return None
+
+        self._model_names.set(model_id, model.name)
+        return model.name
+
+    def get_embedding_model(self, kb_id: str) -> Optional[str]:
+        """
+        获取知识库使用的嵌入模型名称
+
+        Args:
+            kb_id: 知识库ID
+
+        Returns:
+            嵌入模型名称，未配置时返回 None（使用系统默认嵌入模型）
+        """
+        settings = self.get(kb_id)
+        return settings['embedding_model'] if settings else None
+
+    def invalidate(self, kb_id: str = None):
+        """
+        使知识库配置失效
+
+        Args:
+            kb_id: 知识库ID，不指定则清空全部
+        """
+        if kb_id is None:
+            self._settings.clear()
+        else:
+            self._settings.pop(kb_id)
+
+    def invalidate_model(self, model_id: str = None):
+        """
+        使模型名称失效（引用该模型的知识库配置一并失效）
+
+        Args:
+            model_id: 模型ID，不指定则清空全部
+        """
+        if model_id is None:
+            self._model_names.clear()
+        else:
+            self._model_names.pop(model_id)
+        self._settings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        return {
+            'settings': self._settings.stats(),
+            'modelNames': self._model_names.stats()
+        }
+
+
+# 全局知识库配置缓存实例
+kb_settings_cache = KnowledgeBaseSettingsCache()
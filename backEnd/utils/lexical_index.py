@@ -0,0 +1,473 @@
+"""
+知识库全文倒排索引
+为每个知识库维护一个 SQLite 倒排索引，按 BM25 打分，补足向量检索对编号、条款号等精确词的召回
+"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from heapq import nlargest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+except ImportError:  # pragma: no cover - 可选依赖
+    jieba = None
+
+
+# 编号类词元（GB50021-2001、3.2.1、M12x1.5）或连续汉字
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[.\-_/][a-z0-9]+)*|[一-鿿]+')
+_ALNUM_PART_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str, use_jieba: bool = True) -> List[str]:
+    """
+    分词
+
+    编号类词元保留完整形式并额外拆出各组成部分；中文使用 jieba 搜索引擎模式分词，
+    未安装 jieba 时退化为二元切分。
+
+    Args:
+        text: 文本
+        use_jieba: 是否使用 jieba（已安装时）
+
+    Returns:
+        词元列表（可重复）
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        if '一' <= token[0] <= '鿿':
+            if use_jieba and jieba is not None:
+                tokens.extend(word for word in jieba.lcut_for_search(token) if word.strip())
+            elif len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            parts = _ALNUM_PART_PATTERN.findall(token)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+def _encode_varints(values: Iterable[int]) -> bytes:
+    """将非负整数序列编码为变长字节"""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _decode_varints(data: bytes) -> List[int]:
+    """解码变长字节为整数序列"""
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+def _encode_postings(entries: List[Tuple[int, int, int]], last_row: int = 0) -> bytes:
+    """
+    编码倒排记录
+
+    每条记录为 (块行号, 词频, 块长度)，行号按升序做差分编码。
+    """
+    values = []
+    for row, tf, length in entries:
+        values.extend((row - last_row, tf, length))
+        last_row = row
+    return _encode_varints(values)
+
+
+def _decode_postings(data: bytes) -> List[Tuple[int, int, int]]:
+    """解码倒排记录"""
+    values = _decode_varints(data)
+    entries = []
+    row = 0
+    for i in range(0, len(values), 3):
+        row += values[i]
+        entries.append((row, values[i + 1], values[i + 2]))
+    return entries
+
+
+class LexicalIndex:
+    """
+    按知识库分文件存储的 BM25 倒排索引
+
+    每个词条一行，倒排记录以差分变长编码打包为 BLOB，查询只读取查询词对应的行，
+    不扫描文本块内容。文本块记录其词条ID，删除文档时只需重写相关词条。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INTEGER PRIMARY KEY,
+            chunk_id TEXT NOT NULL UNIQUE,
+            document_id TEXT NOT NULL,
+            length INTEGER NOT NULL,
+            term_ids BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks (document_id);
+        CREATE TABLE IF NOT EXISTS terms (
+            id INTEGER PRIMARY KEY,
+            term TEXT NOT NULL UNIQUE,
+            df INTEGER NOT NULL,
+            last_row INTEGER NOT NULL,
+            postings BLOB NOT NULL
+        );
+    '''
+
+    # BM25 参数
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, base_dir: str, logger: logging.Logger = None):
+        """
+        Args:
+            base_dir: 索引文件目录
+            logger: 日志记录器
+        """
+        self.base_dir = base_dir
+        self.logger = logger or logging.getLogger(__name__)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def add(self, kb_id: str, chunks: List[Dict]):
+        """
+        添加（或覆盖同ID的）文本块
+
+        Args:
+            kb_id: 知识库ID
+            chunks: 文本块列表，每项包含 id, content, metadata.document_id
+        """
+        if not chunks:
+            return
+
+        with self._write(kb_id) as conn:
+            use_jieba = self._uses_jieba(conn)
+
+            chunk_ids = [chunk['id'] for chunk in chunks]
+            self._remove_rows(conn, self._select_rows(conn, 'chunk_id', chunk_ids))
+
+            postings: Dict[str, List[Tuple[int, int, int]]] = {}
+            chunk_terms: Dict[int, List[str]] = {}
+            added_length = 0
+            for chunk in chunks:
+                counts = Counter(tokenize(chunk.get('content', ''), use_jieba))
+                length = sum(counts.values())
+                document_id = (chunk.get('metadata') or {}).get('document_id', '')
+                row = conn.execute(
+                    'INSERT INTO chunks (chunk_id, document_id, length, term_ids) VALUES (?, ?, ?, ?)',
+                    (chunk['id'], document_id, length, b'')
+                ).lastrowid
+                added_length += length
+                chunk_terms[row] = list(counts)
+                for term, tf in counts.items():
+                    postings.setdefault(term, []).append((row, tf, length))
+
+            term_ids = self._append_postings(conn, postings)
+
+            conn.executemany(
+                'UPDATE chunks SET term_ids = ? WHERE id = ?',
+                [
+                    (_encode_varints(self._deltas(sorted(term_ids[term] for term in terms))), row)
+                    for row, terms in chunk_terms.items()
+                ]
+            )
+            self._update_totals(conn, len(chunks), added_length)
+
+    def delete_document(self, kb_id: str, document_id: str) -> int:
+        """
+        删除文档的全部文本块
+
+        Args:
+            kb_id: 知识库ID
+            document_id: 文档ID
+
+        Returns:
+            删除的文本块数
+        """
+        if not os.path.exists(self._path(kb_id)):
+            return 0
+        with self._write(kb_id) as conn:
+            rows = self._select_rows(conn, 'document_id', [document_id])
+            self._remove_rows(conn, rows)
+            return len(rows)
+
+    def delete_chunks(self, kb_id: str, chunk_ids: List[str]) -> int:
+        """
+        按文本块ID删除
+
+        Args:
+            kb_id: 知识库ID
+            chunk_ids: 文本块ID列表
+
+        Returns:
+            删除的文本块数
+        """
+        if not chunk_ids or not os.path.exists(self._path(kb_id)):
+            return 0
+        with self._write(kb_id) as conn:
+            rows = self._select_rows(conn, 'chunk_id', chunk_ids)
+            self._remove_rows(conn, rows)
+            return len(rows)
+
+    def drop(self, kb_id: str):
+        """删除知识库的索引文件"""
+        path = self._path(kb_id)
+        with self._lock_for(path):
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def search(self, kb_id: str, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            kb_id: 知识库ID
+            query: 查询文本
+            limit: 返回的最大结果数
+
+        Returns:
+            按得分降序的 (文本块ID, 得分) 列表
+        """
+        path = self._path(kb_id)
+        if not os.path.exists(path):
+            return []
+
+        conn = self._connect(path)
+        try:
+            use_jieba = self._uses_jieba(conn)
+            query_terms = Counter(tokenize(query, use_jieba))
+            if not query_terms:
+                return []
+
+            total_chunks, total_length = self._totals(conn)
+            if not total_chunks:
+                return []
+            avg_length = total_length / total_chunks or 1.0
+
+            placeholders = ','.join('?' * len(query_terms))
+            rows = conn.execute(
+                f'SELECT term, df, postings FROM terms WHERE term IN ({placeholders})',
+                list(query_terms)
+            ).fetchall()
+
+            scores: Dict[int, float] = {}
+            for term, df, data in rows:
+                idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+                weight = idf * query_terms[term]
+                for row, tf, length in _decode_postings(data):
+                    norm = tf + self.K1 * (1 - self.B + self.B * length / avg_length)
+                    scores[row] = scores.get(row, 0.0) + weight * tf * (self.K1 + 1) / norm
+
+            top = nlargest(limit, scores.items(), key=lambda item: item[1])
+            if not top:
+                return []
+
+            placeholders = ','.join('?' * len(top))
+            chunk_ids = dict(conn.execute(
+                f'SELECT id, chunk_id FROM chunks WHERE id IN ({placeholders})',
+                [row for row, _ in top]
+            ).fetchall())
+            return [(chunk_ids[row], round(score, 4)) for row, score in top if row in chunk_ids]
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+    def _path(self, kb_id: str) -> str:
+        safe_id = re.sub(r'[^A-Za-z0-9_\-]', '_', kb_id)
+        return os.path.join(self.base_dir, f'kb_{safe_id}.sqlite')
+
+    def _lock_for(self, path: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = threading.Lock()
+            return lock
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _write(self, kb_id: str):
+        """写事务：进程内按文件加锁，跨进程由 BEGIN IMMEDIATE 串行化"""
+        return _WriteTransaction(self, self._path(kb_id))
+
+    def _uses_jieba(self, conn: sqlite3.Connection) -> bool:
+        """索引建立时使用的分词器，查询必须与之一致"""
+        row = conn.execute("SELECT value FROM meta WHERE key = 'tokenizer'").fetchone()
+        if row is None:
+            return jieba is not None
+        if row[0] == 'jieba' and jieba is None:
+            self.logger.warning('索引使用 jieba 分词建立，但当前环境未安装 jieba')
+        return row[0] == 'jieba'
+
+    def _totals(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        values = dict(conn.execute(
+            "SELECT key, value FROM meta WHERE key IN ('chunk_count', 'total_length')"
+        ).fetchall())
+        return int(values.get('chunk_count', 0)), int(values.get('total_length', 0))
+
+    def _update_totals(self, conn: sqlite3.Connection, chunk_delta: int, length_delta: int):
+        chunk_count, total_length = self._totals(conn)
+        conn.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            [
+                ('chunk_count', str(chunk_count + chunk_delta)),
+                ('total_length', str(total_length + length_delta))
+            ]
+        )
+
+    def _select_rows(self, conn: sqlite3.Connection, column: str, values: List[str]):
+        rows = []
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows.extend(conn.execute(
+                f'SELECT id, length, term_ids FROM chunks WHERE {column} IN ({placeholders})',
+                batch
+            ).fetchall())
+        return rows
+
+    def _append_postings(
+        self,
+        conn: sqlite3.Connection,
+        postings: Dict[str, List[Tuple[int, int, int]]]
+    ) -> Dict[str, int]:
+        """追加倒排记录（新行号总是大于已有行号，直接拼接字节），返回 {词条: 词条ID}"""
+        term_ids = {}
+        for term, entries in postings.items():
+            existing = conn.execute(
+                'SELECT id, last_row FROM terms WHERE term = ?', (term,)
+            ).fetchone()
+            if existing is None:
+                term_ids[term] = conn.execute(
+                    'INSERT INTO terms (term, df, last_row, postings) VALUES (?, ?, ?, ?)',
+                    (term, len(entries), entries[-1][0], _encode_postings(entries))
+                ).lastrowid
+            else:
+                term_id, last_row = existing
+                conn.execute(
+                    'UPDATE terms SET df = df + ?, last_row = ?, postings = postings || ? WHERE id = ?',
+                    (len(entries), entries[-1][0], _encode_postings(entries, last_row), term_id)
+                )
+                term_ids[term] = term_id
+        return term_ids
+
+    def _remove_rows(self, conn: sqlite3.Connection, rows):
+        """删除文本块并从相关词条的倒排记录中移除"""
+        if not rows:
+            return
+
+        removed = {row for row, _, _ in rows}
+        affected_terms = set()
+        for _, _, data in rows:
+            affected_terms.update(self._undeltas(_decode_varints(data)))
+
+        for term_id in affected_terms:
+            existing = conn.execute(
+                'SELECT postings FROM terms WHERE id = ?', (term_id,)
+            ).fetchone()
+            if existing is None:
+                continue
+            entries = [entry for entry in _decode_postings(existing[0]) if entry[0] not in removed]
+            if entries:
+                conn.execute(
+                    'UPDATE terms SET df = ?, last_row = ?, postings = ? WHERE id = ?',
+                    (len(entries), entries[-1][0], _encode_postings(entries), term_id)
+                )
+            else:
+                conn.execute('DELETE FROM terms WHERE id = ?', (term_id,))
+
+        conn.executemany('DELETE FROM chunks WHERE id = ?', [(row,) for row in removed])
+        self._update_totals(conn, -len(rows), -sum(length for _, length, _ in rows))
+
+    @staticmethod
+    def _deltas(values: List[int]) -> List[int]:
+        previous = 0
+        deltas = []
+        for value in values:
+            deltas.append(value - previous)
+            previous = value
+        return deltas
+
+    @staticmethod
+    def _undeltas(deltas: List[int]) -> List[int]:
+        total = 0
+        values = []
+        for delta in deltas:
+            total += delta
+            values.append(total)
+        return values
+
+
+class _WriteTransaction:
+    """LexicalIndex 写事务上下文"""
+
+    def __init__(self, index: LexicalIndex, path: str):
+        self.index = index
+        self.path = path
+        self.lock = index._lock_for(path)
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        try:
+            self.conn = self.index._connect(self.path)
+            self.conn.executescript(LexicalIndex.SCHEMA)
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('tokenizer', ?)",
+                ('jieba' if jieba is not None else 'bigram',)
+            )
+        except Exception:
+            if self.conn is not None:
+                self.conn.close()
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.conn.close()
+            self.lock.release()
+        return False
@@ -0,0 +1,282 @@
+"""
+运行指标
+记录接口请求耗时、问答和入库各阶段耗时、LLM 词元数和文本块数，以 Prometheus 文本格式在 /metrics 输出。
+不依赖 prometheus_client：每次记录只有一次二分查找和一次加锁计数。
+指标保存在进程内存中，多进程部署时每个进程分别输出自己的指标。
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+
+# 耗时直方图的桶上界（秒），覆盖从毫秒级检索到分钟级的 LLM 生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# 数量直方图的桶上界
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增计数器"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        增加计数
+
+        Args:
+            amount: 增加量（不能为负）
+            **labels: 标签值，需与 labelnames 一致
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in values
+        ]
+
+
+class Histogram:
+    """累积直方图（桶计数、总和、次数）"""
+
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（非累积，最后一个为 +Inf）, 总和]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值
+            **labels: 标签值，需与 labelnames 一致
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def get(self, **labels) -> Dict[str, float]:
+        """获取某组标签的次数和总和"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                return {'count': 0, 'sum': 0.0}
+            return {'count': sum(state[0]), 'sum': state[1]}
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(float(total))}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _StageTimer:
+    """计时上下文，退出时记录阶段耗时（异常退出也记录）"""
+
+    __slots__ = ('registry', 'pipeline', 'stage', 'start')
+
+    def __init__(self, registry, pipeline: str, stage: str):
+        self.registry = registry
+        self.pipeline = pipeline
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe_stage(self.pipeline, self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics = []
+        self._lock = threading.Lock()
+
+        self.http_request_duration = self.histogram(
+            'http_request_duration_seconds', '接口请求耗时（秒），流式接口为返回响应头的耗时',
+            ('blueprint', 'endpoint', 'method', 'status')
+        )
+        self.stage_duration = self.histogram(
+            'rag_stage_duration_seconds', '问答、检索和入库各阶段耗时（秒）', ('pipeline', 'stage')
+        )
+        self.llm_tokens = self.counter(
+            'rag_llm_tokens_total', 'LLM 词元数（prompt 为输入，completion 为输出）', ('type',)
+        )
+        self.retrieved_chunks = self.histogram(
+            'rag_retrieved_chunks', '每次问答检索到的文本块数', ('mode',), buckets=COUNT_BUCKETS
+        )
+        self.ingested_chunks = self.counter(
+            'rag_ingested_chunks_total', '入库的文本块数（added 新增，kept 沿用，deleted 删除）', ('result',)
+        )
+        self.ingested_documents = self.counter(
+            'rag_ingested_documents_total', '入库处理的文档数', ('status',)
+        )
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def initialize(self, app):
+        """
+        读取配置并为所有接口注册请求耗时统计
+
+        Args:
+            app: Flask 应用实例
+        """
+        from flask import g, request
+
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _start_request_timer():
+            g._metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _observe_request(response):
+            start = g.pop('_metrics_start', None)
+            if start is not None:
+                self.http_request_duration.observe(
+                    time.perf_counter() - start,
+                    blueprint=request.blueprint or '',
+                    # 未匹配路由的请求不使用原始路径，避免标签数量无限增长
+                    endpoint=request.endpoint or 'unmatched',
+                    method=request.method,
+                    status=response.status_code
+                )
+            return response
+
+    def stage(self, pipeline: str, stage: str):
+        """
+        阶段计时上下文
+
+        用法:
+            with metrics.stage('chat', 'retrieve'):
+                ...
+        """
+        return _StageTimer(self, pipeline, stage)
+
+    def observe_stage(self, pipeline: str, stage: str, seconds: float):
+        if self.enabled:
+            self.stage_duration.observe(seconds, pipeline=pipeline, stage=stage)
+
+    def record_tokens(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        if not self.enabled:
+            return
+        if prompt_tokens:
+            self.llm_tokens.inc(prompt_tokens, type='prompt')
+        if completion_tokens:
+            self.llm_tokens.inc(completion_tokens, type='completion')
+
+    def record_retrieval(self, mode: str, chunk_count: int):
+        if self.enabled:
+            self.retrieved_chunks.observe(chunk_count, mode=mode)
+
+    def record_ingestion(self, status: str, added: int = 0, kept: int = 0, deleted: int = 0):
+        if not self.enabled:
+            return
+        self.ingested_documents.inc(status=status)
+        for result, count in (('added', added), ('kept', kept), ('deleted', deleted)):
+            if count:
+                self.ingested_chunks.inc(count, result=result)
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式（0.0.4）"""
+        with self._lock:
+            registered = list(self._metrics)
+
+        lines = []
+        for metric in registered:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标实例
+metrics = MetricsRegistry()
@@ -3,13 +3,37 @@ RAG（Retrieval-Augmented Generation）服务
 处理知识检索、向量化、LLM调用等核心功能
 """
 import os
+import json
 import time
-import requests
-from typing import List, Dict, Any, Optional, Tuple
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import chromadb
 from chromadb.config import Settings
 from flask import current_app
 
+from utils.answer_cache import AnswerCache
+from utils.embedding_client import OllamaEmbeddingClient
+from utils.embedding_cache import QueryEmbeddingCache
+from utils.embedding_store import EmbeddingStore
+from utils.http_client import http_client
+from utils.lexical_index import LexicalIndex
+from utils.metrics import metrics
+
+
+# 向量索引参数名到 ChromaDB 集合元数据键的映射
+INDEX_PARAM_KEYS = {
+    'space': 'hnsw:space',
+    'M': 'hnsw:M',
+    'efConstruction': 'hnsw:construction_ef',
+    'efSearch': 'hnsw:search_ef'
+}
+
+# ChromaDB 未设置索引参数时的默认值（早期创建的集合）
+CHROMA_INDEX_DEFAULTS = {'space': 'l2', 'M': 16, 'efConstruction': 100, 'efSearch': 10}
+
 
 class RAGService:
     """RAG 服务类"""
@@ -20,6 +44,20 @@ class RAGService:
         self.ollama_base_url = None
         self.embedding_model = None
         self.default_llm_model = None
+        self.embedding_client = None
+        self.query_embedding_cache = QueryEmbeddingCache()
+        self.answer_cache = AnswerCache()
+        self.embedding_store = None
+        self.search_max_workers = 8
+        self.search_timeout = None
+        self.lexical_index = None
+        self.hybrid_candidates = 20
+        self.rrf_k = 60
+        self.index_config = {'space': 'cosine', 'M': 16, 'efConstruction': 100, 'efSearch': 64}
+        self._search_executor = None
+        self._rebuild_executor = None
+        self._rebuilding = set()
+        self._executor_lock = threading.Lock()
         
     def initialize(self, app=None):
         """
@@ -32,6 +70,39 @@ class RAGService:
             self.ollama_base_url = app.config.get('OLLAMA_BASE_URL')
             self.embedding_model = app.config.get('EMBEDDING_MODEL_NAME')
             self.default_llm_model = app.config.get('LLM_DEFAULT_MODEL')
+            self.search_max_workers = app.config.get('SEARCH_MAX_WORKERS', 8)
+            self.search_timeout = app.config.get('SEARCH_COLLECTION_TIMEOUT')
+            self.index_config = {
+                'space': app.config.get('CHROMA_DISTANCE', 'cosine'),
+                'M': app.config.get('CHROMA_HNSW_M', 16),
+                'efConstruction': app.config.get('CHROMA_HNSW_EF_CONSTRUCTION', 100),
+                'efSearch': app.config.get('CHROMA_HNSW_EF_SEARCH', 64)
+            }
+            
+            # 初始化批量嵌入客户端
+            self.embedding_client = OllamaEmbeddingClient(
+                base_url=self.ollama_base_url,
+                model=self.embedding_model,
+                batch_size=app.config.get('EMBEDDING_BATCH_SIZE', 32),
+                max_workers=app.config.get('EMBEDDING_MAX_WORKERS', 4),
+                max_retries=app.config.get('EMBEDDING_MAX_RETRIES', 2),
+                timeout=app.config.get('EMBEDDING_TIMEOUT', 60),
+                logger=app.logger,
+                http_client=http_client
+            )
+            
+            # 初始化查询向量缓存
+            self.query_embedding_cache = QueryEmbeddingCache(
+                max_size=app.config.get('QUERY_EMBEDDING_CACHE_SIZE', 2048),
+                ttl=app.config.get('QUERY_EMBEDDING_CACHE_TTL', 86400),
+                persist_dir=app.config.get('QUERY_EMBEDDING_CACHE_DIR'),
+                max_disk_entries=app.config.get('QUERY_EMBEDDING_CACHE_DISK_MAX_ENTRIES', 100000),
+                prune_interval=app.config.get('QUERY_EMBEDDING_CACHE_PRUNE_INTERVAL', 600),
+                logger=app.logger
+            )
+            
+            # 初始化问答结果缓存
+            self.answer_cache.initialize(app)
             
             # 初始化 ChromaDB 客户端
             persist_directory = app.config.get('CHROMA_PERSIST_DIRECTORY')
@@ -39,42 +110,77 @@ class RAGService:
                 path=persist_directory
             )
             
+            # 文本块向量存储（按内容哈希去重）
+            if app.config.get('EMBEDDING_STORE_ENABLED', True):
+                self.embedding_store = EmbeddingStore(app.config.get('EMBEDDING_STORE_PATH'))
+            
+            # 全文倒排索引（与向量检索结果做 RRF 融合）
+            if app.config.get('HYBRID_SEARCH_ENABLED', True):
+                self.lexical_index = LexicalIndex(
+                    app.config.get('LEXICAL_INDEX_DIRECTORY'),
+                    logger=app.logger
+                )
+                self.hybrid_candidates = app.config.get('HYBRID_CANDIDATES', 20)
+                self.rrf_k = app.config.get('RRF_K', 60)
+            
             app.logger.info(f'RAG 服务初始化完成: Ollama={self.ollama_base_url}, '
                           f'Embedding={self.embedding_model}, LLM={self.default_llm_model}')
     
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def get_embeddings(self, texts: List[str], model: str = None) -> List[List[float]]:
         """
         获取文本的向量嵌入
         
         Args:
             texts: 文本列表
+            model: 嵌入模型名称（不指定则使用默认嵌入模型）
             
         Returns:
             向量列表
         """
         try:
-            url = f"{self.ollama_base_url}/api/embeddings"
-            
-            embeddings = []
-            for text in texts:
-                response = requests.post(
-                    url,
-                    json={
-                        "model": self.embedding_model,
-                        "prompt": text
-                    },
-                    timeout=30
-                )
-                response.raise_for_status()
-                result = response.json()
-                embeddings.append(result.get('embedding', []))
-            
-            return embeddings
+            # 按批次并发请求 /api/embed，结果保持输入顺序
+            return self.embedding_client.embed(texts, model=model)
             
         except Exception as e:
             current_app.logger.error(f'获取嵌入向量失败: {str(e)}', exc_info=True)
             raise
     
+    def get_query_embedding(self, query: str, model: str = None) -> List[float]:
+        """
+        获取查询文本的向量（优先使用查询向量缓存）
+        
+        Args:
+            query: 查询文本
+            model: 嵌入模型名称（不指定则使用默认嵌入模型）
+            
+        Returns:
+            查询向量
+        """
+        model = model or self.embedding_model
+        embedding = self.query_embedding_cache.get(model, query)
+        if embedding is not None:
+            return embedding
+        
+        with metrics.stage('retrieval', 'embed_query'):
+            embedding = self.get_embeddings([query], model=model)[0]
+        self.query_embedding_cache.set(model, query, embedding)
+        return embedding
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        获取 RAG 服务各缓存的统计信息
+        
+        Returns:
+            缓存名称到统计信息的字典
+        """
+        stats = {
+            'queryEmbedding': self.query_embedding_cache.stats(),
+            'answer': self.answer_cache.stats()
+        }
+        if self.embedding_store:
+            stats['embeddingStore'] = self.embedding_store.stats()
+        return stats
+    
     def get_or_create_collection(self, kb_id: str, kb_name: str = None):
         """
         获取或创建知识库的向量集合
@@ -95,10 +201,12 @@ class RAGService:
                 current_app.logger.info(f'使用现有向量集合: {collection_name}')
                 return collection
             except:
-                # 集合不存在，创建新集合
+                # 集合不存在，按知识库（或全局）索引参数创建新集合
+                metadata = {"kb_id": kb_id, "kb_name": kb_name or kb_id}
+                metadata.update(self._index_metadata(self._resolve_index_config(kb_id)))
                 collection = self.chroma_client.create_collection(
                     name=collection_name,
-                    metadata={"kb_id": kb_id, "kb_name": kb_name or kb_id}
+                    metadata=metadata
                 )
                 current_app.logger.info(f'创建新向量集合: {collection_name}')
                 return collection
@@ -107,13 +215,178 @@ class RAGService:
             current_app.logger.error(f'获取或创建向量集合失败: {str(e)}', exc_info=True)
             raise
     
-    def add_documents(self, kb_id: str, documents: List[Dict[str, Any]]):
+    def _resolve_index_config(self, kb_id: str, index_config: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        合并全局索引参数和知识库的索引参数
+        
+        Args:
+            kb_id: 知识库ID
+            index_config: 知识库索引参数，不指定则从知识库配置缓存读取
+            
+        Returns:
+            {space, M, efConstruction, efSearch}
+        """
+        if index_config is None:
+            from utils.kb_settings import kb_settings_cache
+            settings = kb_settings_cache.get(kb_id)
+            index_config = (settings or {}).get('index_config') or {}
+        
+        resolved = dict(self.index_config)
+        resolved.update({
+            key: value for key, value in index_config.items()
+            if key in INDEX_PARAM_KEYS and value is not None
+        })
+        return resolved
+    
+    @staticmethod
+    def _index_metadata(index_config: Dict[str, Any]) -> Dict[str, Any]:
+        """索引参数转换为 ChromaDB 集合元数据"""
+        return {INDEX_PARAM_KEYS[key]: value for key, value in index_config.items() if key in INDEX_PARAM_KEYS}
+    
+    @staticmethod
+    def _collection_space(collection) -> str:
+        """集合的距离度量（早期创建的集合为 l2）"""
+        return (collection.metadata or {}).get('hnsw:space', CHROMA_INDEX_DEFAULTS['space'])
+    
+    def get_index_config(self, kb_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取知识库向量集合当前生效的索引参数
+        
+        Args:
+            kb_id: 知识库ID
+            
+        Returns:
+            {space, M, efConstruction, efSearch, dimension, count}，集合不存在时返回 None
+        """
+        collection = self._get_existing_collection(kb_id)
+        if collection is None:
+            return None
+        
+        metadata = collection.metadata or {}
+        config = {
+            key: metadata.get(meta_key, CHROMA_INDEX_DEFAULTS[key])
+            for key, meta_key in INDEX_PARAM_KEYS.items()
+        }
+        sample = collection.peek(1)
+        config['dimension'] = len(sample['embeddings'][0]) if sample['embeddings'] else None
+        config['count'] = collection.count()
+        return config
+    
+    def rebuild_collection(self, kb_id: str, index_config: Dict[str, Any] = None, batch_size: int = 1000) -> int:
+        """
+        按新的索引参数重建知识库的向量集合（复制已有向量，不重新计算嵌入）
+        
+        新集合建好并校验数量后再替换原集合；替换期间（两次改名之间）的检索可能短暂返回空结果。
+        
+        Args:
+            kb_id: 知识库ID
+            index_config: 索引参数，不指定则使用知识库配置
+            batch_size: 每批复制的文本块数
+            
+        Returns:
+            复制的文本块数量
+        """
+        collection_name = f"kb_{kb_id}"
+        old = self._get_existing_collection(kb_id)
+        if old is None:
+            return 0
+        
+        rebuild_name = f"{collection_name}__rebuild"
+        retired_name = f"{collection_name}__old"
+        for name in (rebuild_name, retired_name):
+            try:
+                self.chroma_client.delete_collection(name=name)
+            except Exception:
+                pass
+        
+        metadata = {key: value for key, value in (old.metadata or {}).items() if not key.startswith('hnsw:')}
+        metadata.update(self._index_metadata(self._resolve_index_config(kb_id, index_config)))
+        new = self.chroma_client.create_collection(name=rebuild_name, metadata=metadata)
+        
+        try:
+            copied = 0
+            while True:
+                results = old.get(
+                    limit=batch_size,
+                    offset=copied,
+                    include=['documents', 'metadatas', 'embeddings']
+                )
+                if not results['ids']:
+                    break
+                new.add(
+                    ids=results['ids'],
+                    documents=results['documents'],
+                    metadatas=results['metadatas'],
+                    embeddings=[list(embedding) for embedding in results['embeddings']]
+                )
+                copied += len(results['ids'])
+            
+            if new.count() != old.count():
+                raise RuntimeError(f'重建的集合数量不一致: {new.count()} != {old.count()}')
+        except Exception:
+            self.chroma_client.delete_collection(name=rebuild_name)
+            raise
+        
+        # 原集合改名后再把新集合改为正式名称，最后删除原集合
+        old.modify(name=retired_name)
+        try:
+            new.modify(name=collection_name)
+        except Exception:
+            # 改名间隙中检索创建了空集合时，删除后重试
+            self.chroma_client.delete_collection(name=collection_name)
+            new.modify(name=collection_name)
+        self.chroma_client.delete_collection(name=retired_name)
+        
+        # 相似度随距离度量变化，已缓存的答案失效
+        self.answer_cache.invalidate(kb_id)
+        current_app.logger.info(f'重建向量集合: {collection_name}, 共 {copied} 个块')
+        return copied
+    
+    def start_rebuild(self, app, kb_id: str, index_config: Dict[str, Any] = None) -> bool:
+        """
+        在后台线程中重建知识库的向量集合
+        
+        Args:
+            app: Flask 应用实例
+            kb_id: 知识库ID
+            index_config: 索引参数，不指定则使用知识库配置
+            
+        Returns:
+            是否已提交（同一知识库正在重建时返回 False）
+        """
+        with self._executor_lock:
+            if kb_id in self._rebuilding:
+                return False
+            self._rebuilding.add(kb_id)
+            if self._rebuild_executor is None:
+                self._rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kb-rebuild')
+        
+        def run():
+            with app.app_context():
+                try:
+                    self.rebuild_collection(kb_id, index_config)
+                except Exception as e:
+                    app.logger.error(f'重建向量集合失败: {kb_id}, {str(e)}', exc_info=True)
+                finally:
+                    with self._executor_lock:
+                        self._rebuilding.discard(kb_id)
+        
+        self._rebuild_executor.submit(run)
+        return True
+    
+    def is_rebuilding(self, kb_id: str) -> bool:
+        """知识库的向量集合是否正在重建"""
+        with self._executor_lock:
+            return kb_id in self._rebuilding
+    
+    def add_documents(self, kb_id: str, documents: List[Dict[str, Any]], embedding_model: str = None):
         """
         向知识库添加文档
         
         Args:
             kb_id: 知识库ID
             documents: 文档列表，每个文档包含 id, content, metadata
+            embedding_model: 知识库的嵌入模型（不指定则使用默认嵌入模型）
         """
         try:
             collection = self.get_or_create_collection(kb_id)
@@ -123,16 +396,21 @@ class RAGService:
             doc_contents = [doc['content'] for doc in documents]
             doc_metadatas = [doc.get('metadata', {}) for doc in documents]
             
-            # 获取嵌入向量
-            embeddings = self.get_embeddings(doc_contents)
+            # 获取嵌入向量（已存储的文本块直接复用）
+            embeddings = self.get_document_embeddings(doc_contents, doc_metadatas, embedding_model)
             
             # 添加到向量库
-            collection.add(
-                ids=doc_ids,
-                documents=doc_contents,
-                embeddings=embeddings,
-                metadatas=doc_metadatas
-            )
+            with metrics.stage('ingestion', 'store'):
+                collection.add(
+                    ids=doc_ids,
+                    documents=doc_contents,
+                    embeddings=embeddings,
+                    metadatas=doc_metadatas
+                )
+                
+                if self.lexical_index:
+                    self.lexical_index.add(kb_id, documents)
+            self.answer_cache.invalidate(kb_id)
             
             current_app.logger.info(f'向知识库 {kb_id} 添加了 {len(documents)} 个文档块')
             
@@ -140,21 +418,369 @@ class RAGService:
             current_app.logger.error(f'添加文档到向量库失败: {str(e)}', exc_info=True)
             raise
     
+    def get_document_chunks(
+        self,
+        kb_id: str,
+        document_id: str,
+        include: List[str] = None
+    ) -> Dict[str, Any]:
+        """
+        按 document_id 元数据获取文档的全部文本块
+        
+        Args:
+            kb_id: 知识库ID
+            document_id: 文档ID
+            include: 需要返回的字段，默认 documents 和 metadatas
+            
+        Returns:
+            ChromaDB get 结果（ids, documents, metadatas, embeddings）
+        """
+        collection = self.get_or_create_collection(kb_id)
+        return collection.get(
+            where={"document_id": document_id},
+            include=include or ['documents', 'metadatas']
+        )
+    
+    def delete_document_chunks(self, kb_id: str, document_id: str):
+        """
+        按 document_id 元数据删除文档的全部文本块
+        
+        Args:
+            kb_id: 知识库ID
+            document_id: 文档ID
+        """
+        try:
+            collection = self.get_or_create_collection(kb_id)
+            hashes = self._collect_content_hashes(collection, where={"document_id": document_id})
+            collection.delete(where={"document_id": document_id})
+            if self.lexical_index:
+                self.lexical_index.delete_document(kb_id, document_id)
+            self.answer_cache.invalidate(kb_id)
+            self._release_embeddings(hashes)
+            current_app.logger.info(f'删除文档向量: kb={kb_id}, document={document_id}')
+        except Exception as e:
+            current_app.logger.error(f'删除文档向量失败: {str(e)}', exc_info=True)
+            raise
+    
+    def delete_chunks(self, kb_id: str, chunk_ids: List[str]):
+        """
+        按文本块ID删除
+        
+        Args:
+            kb_id: 知识库ID
+            chunk_ids: 文本块ID列表
+        """
+        if not chunk_ids:
+            return
+        collection = self.get_or_create_collection(kb_id)
+        hashes = self._collect_content_hashes(collection, ids=list(chunk_ids))
+        collection.delete(ids=list(chunk_ids))
+        if self.lexical_index:
+            self.lexical_index.delete_chunks(kb_id, list(chunk_ids))
+        self.answer_cache.invalidate(kb_id)
+        self._release_embeddings(hashes)
+    
+    def _collect_content_hashes(
+        self,
+        collection,
+        where: Dict[str, Any] = None,
+        ids: List[str] = None,
+        batch_size: int = 1000
+    ) -> set:
+        """
+        读取即将删除的文本块的内容哈希（未启用向量存储时不读取）
+        
+        Args:
+            collection: ChromaDB 集合对象
+            where: 元数据过滤条件
+            ids: 文本块ID列表
+            batch_size: 每批读取的块数
+            
+        Returns:
+            内容哈希集合
+        """
+        if not self.embedding_store:
+            return set()
+        
+        hashes = set()
+        offset = 0
+        while True:
+            results = collection.get(
+                ids=ids,
+                where=where,
+                include=['metadatas'],
+                limit=batch_size,
+                offset=offset
+            )
+            if not results['ids']:
+                break
+            hashes.update(
+                metadata['content_hash']
+                for metadata in results['metadatas']
+                if metadata and metadata.get('content_hash')
+            )
+            offset += len(results['ids'])
+        return hashes
+    
+    def _release_embeddings(self, hashes: set, batch_size: int = 500):
+        """
+        从向量存储中删除已没有任何知识库集合引用的内容哈希
+        
+        删除文本块后调用；与并发入库竞争时最多导致一次重复计算向量，不影响检索结果。
+        
+        Args:
+            hashes: 被删除文本块的内容哈希
+            batch_size: 每次查询的哈希数
+        """
+        if not self.embedding_store or not hashes:
+            return
+        
+        try:
+            unreferenced = set(hashes)
+            for collection in self.chroma_client.list_collections():
+                if not collection.name.startswith('kb_'):
+                    continue
+                pending = list(unreferenced)
+                for start in range(0, len(pending), batch_size):
+                    results = collection.get(
+                        where={'content_hash': {'$in': pending[start:start + batch_size]}},
+                        include=['metadatas']
+                    )
+                    unreferenced.difference_update(
+                        metadata.get('content_hash') for metadata in results['metadatas'] if metadata
+                    )
+                if not unreferenced:
+                    return
+            
+            deleted = self.embedding_store.delete_many(unreferenced)
+            current_app.logger.info(f'清理向量存储: 删除 {deleted} 个不再引用的向量')
+        except Exception as e:
+            # 清理失败只会留下多余的向量，不影响删除本身
+            current_app.logger.warning(f'清理向量存储失败: {str(e)}')
+    
+    def get_chunk_hashes(
+        self,
+        kb_id: str,
+        document_id: str,
+        embedding_model: str = None,
+        batch_size: int = 500
+    ) -> Dict[str, List[str]]:
+        """
+        获取文档已入库文本块的内容哈希（按当前嵌入模型计算）
+        
+        Args:
+            kb_id: 知识库ID
+            document_id: 文档ID
+            embedding_model: 知识库的嵌入模型（不指定则使用默认嵌入模型）
+            batch_size: 每批读取的块数
+            
+        Returns:
+            {内容哈希: [文本块ID, ...]}，内容相同的块对应多个ID
+        """
+        model = embedding_model or self.embedding_model
+        collection = self.get_or_create_collection(kb_id)
+        hashes: Dict[str, List[str]] = {}
+        offset = 0
+        while True:
+            results = collection.get(
+                where={"document_id": document_id},
+                include=['documents'],
+                limit=batch_size,
+                offset=offset
+            )
+            if not results['ids']:
+                break
+            
+            for chunk_id, text in zip(results['ids'], results['documents']):
+                content_hash = EmbeddingStore.content_hash(model, text)
+                hashes.setdefault(content_hash, []).append(chunk_id)
+            offset += len(results['ids'])
+        return hashes
+    
+    def update_chunk_metadata(
+        self,
+        kb_id: str,
+        chunk_ids: List[str],
+        metadatas: List[Dict[str, Any]],
+        batch_size: int = 500
+    ):
+        """
+        覆盖文本块的元数据（不重新计算向量）
+        
+        Args:
+            kb_id: 知识库ID
+            chunk_ids: 文本块ID列表
+            metadatas: 对应的元数据列表
+            batch_size: 每批更新的块数
+        """
+        collection = self.get_or_create_collection(kb_id)
+        for start in range(0, len(chunk_ids), batch_size):
+            collection.update(
+                ids=chunk_ids[start:start + batch_size],
+                metadatas=metadatas[start:start + batch_size]
+            )
+    
+    def update_chunk_total(self, kb_id: str, document_id: str, chunk_total: int, batch_size: int = 500):
+        """
+        补写文档全部文本块的 chunk_total 元数据（流式分批入库时块总数最后才确定）
+        
+        Args:
+            kb_id: 知识库ID
+            document_id: 文档ID
+            chunk_total: 块总数
+            batch_size: 每批读取和更新的块数
+        """
+        collection = self.get_or_create_collection(kb_id)
+        offset = 0
+        while True:
+            results = collection.get(
+                where={"document_id": document_id},
+                include=['metadatas'],
+                limit=batch_size,
+                offset=offset
+            )
+            if not results['ids']:
+                break
+            
+            metadatas = []
+            for metadata in results['metadatas']:
+                metadata = dict(metadata)
+                metadata['chunk_total'] = chunk_total
+                metadatas.append(metadata)
+            collection.update(ids=results['ids'], metadatas=metadatas)
+            offset += len(results['ids'])
+    
+    def copy_document_chunks(
+        self,
+        source_kb_id: str,
+        source_document_id: str,
+        target_kb_id: str,
+        target_document_id: str
+    ) -> int:
+        """
+        将文档的文本块（含向量）复制到另一个知识库，不重新计算向量
+        
+        Args:
+            source_kb_id: 源知识库ID
+            source_document_id: 源文档ID
+            target_kb_id: 目标知识库ID
+            target_document_id: 目标文档ID
+            
+        Returns:
+            复制的文本块数量
+        """
+        try:
+            results = self.get_document_chunks(
+                source_kb_id,
+                source_document_id,
+                include=['documents', 'metadatas', 'embeddings']
+            )
+            if not results or not results['ids']:
+                return 0
+            
+            # 文本块ID和元数据改为指向目标文档和知识库
+            new_ids = []
+            new_metadatas = []
+            for chunk_id, metadata in zip(results['ids'], results['metadatas']):
+                suffix = chunk_id[len(source_document_id):] if chunk_id.startswith(source_document_id) \
+                    else f"_chunk_{metadata.get('chunk_index', len(new_ids))}"
+                new_ids.append(f"{target_document_id}{suffix}")
+                
+                new_metadata = dict(metadata)
+                new_metadata['document_id'] = target_document_id
+                new_metadata['kb_id'] = target_kb_id
+                new_metadatas.append(new_metadata)
+            
+            target_collection = self.get_or_create_collection(target_kb_id)
+            target_collection.add(
+                ids=new_ids,
+                documents=results['documents'],
+                metadatas=new_metadatas,
+                embeddings=[list(embedding) for embedding in results['embeddings']]
+            )
+            
+            if self.lexical_index:
+                self.lexical_index.add(target_kb_id, [
+                    {'id': chunk_id, 'content': content, 'metadata': metadata}
+                    for chunk_id, content, metadata in zip(new_ids, results['documents'], new_metadatas)
+                ])
+            self.answer_cache.invalidate(target_kb_id)
+            
+            current_app.logger.info(
+                f'复制文档向量: {source_document_id} -> {target_document_id}, 共 {len(new_ids)} 个块'
+            )
+            return len(new_ids)
+            
+        except Exception as e:
+            current_app.logger.error(f'复制文档向量失败: {str(e)}', exc_info=True)
+            raise
+    
+    def get_document_embeddings(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]] = None,
+        model: str = None
+    ) -> List[List[float]]:
+        """
+        获取文本块的向量，优先从内容寻址的向量存储中查找
+        
+        Args:
+            texts: 文本块列表
+            metadatas: 对应的元数据列表（会写入 content_hash 字段）
+            model: 嵌入模型名称（不指定则使用默认嵌入模型）
+            
+        Returns:
+            与输入顺序一致的向量列表
+        """
+        model = model or self.embedding_model
+        if not self.embedding_store:
+            with metrics.stage('ingestion', 'embed'):
+                return self.get_embeddings(texts, model=model)
+        
+        hashes = [EmbeddingStore.content_hash(model, text) for text in texts]
+        if metadatas is not None:
+            for metadata, content_hash in zip(metadatas, hashes):
+                metadata['content_hash'] = content_hash
+        
+        stored = self.embedding_store.get_many(model, hashes)
+        
+        # 未命中的文本按哈希去重后再请求嵌入接口
+        missing = {}
+        for content_hash, text in zip(hashes, texts):
+            if content_hash not in stored and content_hash not in missing:
+                missing[content_hash] = text
+        
+        if missing:
+            with metrics.stage('ingestion', 'embed'):
+                new_embeddings = self.get_embeddings(list(missing.values()), model=model)
+            computed = dict(zip(missing.keys(), new_embeddings))
+            self.embedding_store.put_many(model, computed)
+            stored.update(computed)
+        
+        current_app.logger.info(
+            f'文本块向量: 共 {len(texts)} 个，复用 {len(texts) - len(missing)} 个，新计算 {len(missing)} 个'
+        )
+        return [stored[content_hash] for content_hash in hashes]
+    
     def search_documents(
         self, 
         kb_id: str, 
         query: str, 
         top_k: int = 5,
-        similarity_threshold: float = 0.7
+        similarity_threshold: float = 0.7,
+        where: Dict[str, Any] = None,
+        embedding_model: str = None
     ) -> List[Dict[str, Any]]:
         """
-        在知识库中检索相关文档
+        在知识库中检索相关文档（向量检索 + BM25 全文检索，RRF 融合）
         
         Args:
             kb_id: 知识库ID
             query: 查询文本
             top_k: 返回最相关的前N个结果
             similarity_threshold: 相似度阈值（0-1之间）
+            where: ChromaDB 元数据过滤条件（可选）
+            embedding_model: 知识库的嵌入模型（不指定则使用默认嵌入模型）
             
         Returns:
             检索结果列表
@@ -162,33 +788,14 @@ class RAGService:
         try:
             collection = self.get_or_create_collection(kb_id)
             
-            # 获取查询向量
-            query_embedding = self.get_embeddings([query])[0]
+            # 获取查询向量（命中缓存时不请求 Ollama）
+            query_embedding = self.get_query_embedding(query, embedding_model)
             
             # 检索相关文档
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=['documents', 'metadatas', 'distances']
+            documents = self._retrieve(
+                kb_id, collection, query, query_embedding, top_k, similarity_threshold, where
             )
             
-            # 处理结果
-            documents = []
-            if results and results['ids']:
-                for i, doc_id in enumerate(results['ids'][0]):
-                    # 计算相似度 (ChromaDB 返回的是距离，需要转换为相似度)
-                    distance = results['distances'][0][i]
-                    similarity = 1 / (1 + distance)  # 简单的距离转相似度公式
-                    
-                    # 过滤低于阈值的结果
-                    if similarity >= similarity_threshold:
-                        documents.append({
-                            'id': doc_id,
-                            'content': results['documents'][0][i],
-                            'metadata': results['metadatas'][0][i],
-                            'similarity': round(similarity, 4)
-                        })
-            
             current_app.logger.info(f'在知识库 {kb_id} 中检索到 {len(documents)} 个相关文档')
             return documents
             
@@ -196,6 +803,259 @@ class RAGService:
             current_app.logger.error(f'检索文档失败: {str(e)}', exc_info=True)
             return []
     
+    def search_collections(
+        self,
+        kb_ids: List[str],
+        query: str,
+        top_k: int = 5,
+        similarity_threshold: float = 0.0,
+        where: Dict[str, Any] = None,
+        embedding_models: Dict[str, str] = None,
+        timeout: float = None,
+        merge_key: str = 'score'
+    ) -> List[Dict[str, Any]]:
+        """
+        并发检索多个知识库并合并结果
+        
+        查询向量按嵌入模型各计算一次；各集合并行查询，超过截止时间仍未返回的集合被跳过，
+        不会拖慢整体结果。合并键为 score 时按融合得分堆合并（各集合结果已降序排列）；
+        融合得分只反映库内排名，跨知识库比较相关度时使用 similarity（归一化到 0-1 的向量相似度）。
+        
+        Args:
+            kb_ids: 知识库ID列表
+            query: 查询文本
+            top_k: 返回最相关的前N个结果（全局）
+            similarity_threshold: 相似度阈值（0-1之间）
+            where: ChromaDB 元数据过滤条件（可选）
+            embedding_models: {知识库ID: 嵌入模型}，未列出的知识库使用默认嵌入模型
+            timeout: 单个知识库的检索截止时间（秒），不指定则使用 SEARCH_COLLECTION_TIMEOUT，None 表示不限
+            merge_key: 合并排序键，score 或 similarity
+            
+        Returns:
+            按合并键降序排列的检索结果列表，每项包含 kb_id
+        """
+        if not kb_ids:
+            return []
+        
+        embedding_models = embedding_models or {}
+        if timeout is None:
+            timeout = self.search_timeout
+        
+        query_embeddings = {}
+        for kb_id in kb_ids:
+            model = embedding_models.get(kb_id) or self.embedding_model
+            if model not in query_embeddings:
+                query_embeddings[model] = self.get_query_embedding(query, model)
+        
+        def query_one(kb_id):
+            collection = self._get_existing_collection(kb_id)
+            if collection is None:
+                return []
+            query_embedding = query_embeddings[embedding_models.get(kb_id) or self.embedding_model]
+            documents = self._retrieve(
+                kb_id, collection, query, query_embedding, top_k, similarity_threshold, where
+            )
+            for doc in documents:
+                doc['kb_id'] = kb_id
+            return documents
+        
+        per_collection = []
+        executor = self._get_search_executor()
+        futures = {executor.submit(query_one, kb_id): kb_id for kb_id in kb_ids}
+        
+        # 所有集合同时开始检索，截止时间从提交时起算
+        done, not_done = wait(futures, timeout=timeout or None)
+        for future in done:
+            try:
+                per_collection.append(future.result())
+            except Exception as e:
+                current_app.logger.warning(f'检索知识库 {futures[future]} 失败: {str(e)}')
+        
+        if not_done:
+            # 已在执行的查询无法中断，结果直接丢弃；排队中的查询取消
+            for future in not_done:
+                future.cancel()
+            current_app.logger.warning(
+                f'检索超时（{timeout}s），跳过知识库: {", ".join(futures[f] for f in not_done)}'
+            )
+        
+        merged = self._merge_results(per_collection, top_k, merge_key)
+        
+        current_app.logger.info(f'在 {len(kb_ids)} 个知识库中检索到 {len(merged)} 个相关文档')
+        return merged
+    
+    @staticmethod
+    def _merge_results(
+        per_collection: List[List[Dict[str, Any]]],
+        top_k: int,
+        merge_key: str = 'score'
+    ) -> List[Dict[str, Any]]:
+        """
+        合并多个集合的检索结果，取全局前 top_k 个
+        
+        score：各集合结果已按融合得分降序排列，直接堆合并；
+        similarity 等其他键：集合内不按该键有序，取全部候选中最大的 top_k 个
+        """
+        if merge_key == 'score':
+            return list(islice(
+                heapq.merge(*per_collection, key=lambda doc: -doc['score']),
+                top_k
+            ))
+        return heapq.nlargest(
+            top_k,
+            (doc for documents in per_collection for doc in documents),
+            key=lambda doc: (doc[merge_key], doc['score'])
+        )
+    
+    def _retrieve(
+        self,
+        kb_id: str,
+        collection,
+        query: str,
+        query_embedding: List[float],
+        top_k: int,
+        similarity_threshold: float,
+        where: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        单个知识库的混合检索（不依赖应用上下文，可在线程池中执行）
+        
+        向量结果受相似度阈值过滤；全文检索命中的编号、条款号等精确词不受阈值限制。
+        两路结果按倒数排名融合（RRF），score 为融合得分。
+        """
+        if self.lexical_index is None:
+            documents = self._query_collection(
+                collection, query_embedding, top_k, similarity_threshold, where
+            )
+            for doc in documents:
+                doc['score'] = doc['similarity']
+            return documents
+        
+        candidates = max(top_k, self.hybrid_candidates)
+        vector_docs = self._query_collection(
+            collection, query_embedding, candidates, similarity_threshold, where
+        )
+        
+        try:
+            with metrics.stage('retrieval', 'lexical_query'):
+                lexical_hits = self.lexical_index.search(kb_id, query, limit=candidates)
+        except Exception as e:
+            self.lexical_index.logger.warning(f'全文检索失败，仅使用向量检索: {str(e)}')
+            lexical_hits = []
+        
+        # 只在全文检索中命中的块，从向量库补齐内容并计算相似度（同时应用元数据过滤）
+        docs_by_id = {doc['id']: doc for doc in vector_docs}
+        missing_ids = [chunk_id for chunk_id, _ in lexical_hits if chunk_id not in docs_by_id]
+        if missing_ids:
+            get_args = {'ids': missing_ids, 'include': ['documents', 'metadatas', 'embeddings']}
+            if where:
+                get_args['where'] = where
+            fetched = collection.get(**get_args)
+            space = self._collection_space(collection)
+            for i, chunk_id in enumerate(fetched['ids']):
+                distance = self._embedding_distance(query_embedding, fetched['embeddings'][i], space)
+                docs_by_id[chunk_id] = {
+                    'id': chunk_id,
+                    'content': fetched['documents'][i],
+                    'metadata': fetched['metadatas'][i],
+                    'similarity': round(self._distance_to_similarity(distance, space), 4)
+                }
+        
+        scores = {}
+        for rank, doc in enumerate(vector_docs, start=1):
+            scores[doc['id']] = 1.0 / (self.rrf_k + rank)
+        for rank, (chunk_id, _) in enumerate(lexical_hits, start=1):
+            if chunk_id in docs_by_id:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank)
+        
+        documents = []
+        for chunk_id in heapq.nlargest(top_k, scores, key=scores.get):
+            doc = docs_by_id[chunk_id]
+            doc['score'] = round(scores[chunk_id], 6)
+            documents.append(doc)
+        return documents
+    
+    def _query_collection(
+        self,
+        collection,
+        query_embedding: List[float],
+        top_k: int,
+        similarity_threshold: float,
+        where: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        在单个集合中检索并转换为相似度结果（按相似度降序）
+        """
+        query_args = {
+            'query_embeddings': [query_embedding],
+            'n_results': top_k,
+            'include': ['documents', 'metadatas', 'distances']
+        }
+        if where:
+            query_args['where'] = where
+        
+        with metrics.stage('retrieval', 'vector_query'):
+            results = collection.query(**query_args)
+        space = self._collection_space(collection)
+        
+        documents = []
+        if results and results['ids']:
+            for i, doc_id in enumerate(results['ids'][0]):
+                # 计算相似度 (ChromaDB 返回的是距离，需要转换为相似度)
+                distance = results['distances'][0][i]
+                similarity = self._distance_to_similarity(distance, space)
+                
+                # 过滤低于阈值的结果
+                if similarity >= similarity_threshold:
+                    documents.append({
+                        'id': doc_id,
+                        'content': results['documents'][0][i],
+                        'metadata': results['metadatas'][0][i],
+                        'similarity': round(similarity, 4)
+                    })
+        
+        return documents
+    
+    @staticmethod
+    def _distance_to_similarity(distance: float, space: str = 'l2') -> float:
+        """
+        ChromaDB 返回的是距离，转换为相似度
+        
+        cosine / ip 距离为 1 - 余弦（内积），相似度即余弦值（负值记为 0）；
+        l2 为平方欧氏距离，使用 1 / (1 + d)
+        """
+        if space in ('cosine', 'ip'):
+            return max(0.0, 1 - distance)
+        return 1 / (1 + distance)
+    
+    @staticmethod
+    def _embedding_distance(a: List[float], b: List[float], space: str = 'l2') -> float:
+        """按集合的距离度量计算两个向量的距离（与 ChromaDB 一致）"""
+        if space == 'ip':
+            return 1 - sum(x * y for x, y in zip(a, b))
+        if space == 'cosine':
+            norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+            return 1 - (sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0)
+        return sum((x - y) ** 2 for x, y in zip(a, b))
+    
+    def _get_existing_collection(self, kb_id: str):
+        """获取已存在的知识库集合，不存在时返回 None（不创建）"""
+        try:
+            return self.chroma_client.get_collection(name=f"kb_{kb_id}")
+        except Exception:
+            return None
+    
+    def _get_search_executor(self) -> ThreadPoolExecutor:
+        """获取多知识库检索共用的线程池"""
+        if self._search_executor is None:
+            with self._executor_lock:
+                if self._search_executor is None:
+                    self._search_executor = ThreadPoolExecutor(
+                        max_workers=self.search_max_workers,
+                        thread_name_prefix='kb-search'
+                    )
+        return self._search_executor
+    
     def generate_answer(
         self,
         question: str,
@@ -226,30 +1086,14 @@ class RAGService:
             if max_tokens is None:
                 max_tokens = current_app.config.get('LLM_MAX_TOKENS', 2048)
             
-            # 构建上下文
-            context = self._build_context(context_documents)
-            
-            # 构建提示词
-            prompt = self._build_prompt(question, context)
-            
             # 调用 Ollama API（兼容 OpenAI 格式）
             url = f"{self.ollama_base_url}/v1/chat/completions"
             
-            response = requests.post(
+            response = http_client.post(
                 url,
                 json={
                     "model": model_name,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "你是一个专业的知识库助手，能够根据提供的上下文信息准确回答用户的问题。"
-                                     "如果上下文中没有相关信息，请如实告知用户。"
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
+                    "messages": self._build_messages(question, context_documents),
                     "temperature": temperature,
                     "max_tokens": max_tokens,
                     "stream": False
@@ -260,6 +1104,8 @@ class RAGService:
             
             result = response.json()
             answer = result['choices'][0]['message']['content']
+            usage = result.get('usage') or {}
+            metrics.record_tokens(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
             
             # 构建引用列表
             references = self._build_references(context_documents)
@@ -271,6 +1117,118 @@ class RAGService:
             current_app.logger.error(f'生成答案失败: {str(e)}', exc_info=True)
             raise
     
+    def generate_answer_stream(
+        self,
+        question: str,
+        context_documents: List[Dict[str, Any]],
+        model_name: str = None,
+        temperature: float = None,
+        max_tokens: int = None
+    ) -> Iterator[str]:
+        """
+        使用 LLM 流式生成答案
+        
+        Args:
+            question: 用户问题
+            context_documents: 检索到的上下文文档
+            model_name: 使用的模型名称（如不指定则使用默认模型）
+            temperature: 温度参数
+            max_tokens: 最大token数
+            
+        Yields:
+            按到达顺序返回的答案片段
+        """
+        if not model_name:
+            model_name = self.default_llm_model
+        if temperature is None:
+            temperature = current_app.config.get('LLM_TEMPERATURE', 0.7)
+        if max_tokens is None:
+            max_tokens = current_app.config.get('LLM_MAX_TOKENS', 2048)
+        
+        url = f"{self.ollama_base_url}/v1/chat/completions"
+        
+        response = http_client.post(
+            url,
+            json={
+                "model": model_name,
+                "messages": self._build_messages(question, context_documents),
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "stream": True,
+                # 最后一个片段附带词元用量（不支持的服务会忽略该参数）
+                "stream_options": {"include_usage": True}
+            },
+            stream=True,
+            timeout=current_app.config.get('LLM_TIMEOUT', 120)
+        )
+        
+        usage = None
+        deltas = 0
+        try:
+            response.raise_for_status()
+            
+            # OpenAI 兼容的 SSE 格式: "data: {...}"，以 "data: [DONE]" 结束
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+                
+                chunk = json.loads(payload)
+                usage = chunk.get('usage') or usage
+                choices = chunk.get('choices') or []
+                if not choices:
+                    continue
+                
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    deltas += 1
+                    yield content
+            
+            current_app.logger.info(f'使用模型 {model_name} 流式生成了答案')
+        finally:
+            response.close()
+            # 服务未返回用量时，按片段数估算输出词元数（Ollama 每个片段约一个词元）
+            if usage:
+                metrics.record_tokens(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+            else:
+                metrics.record_tokens(completion_tokens=deltas)
+    
+    def _build_messages(
+        self,
+        question: str,
+        context_documents: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """
+        构建对话消息列表
+        
+        Args:
+            question: 用户问题
+            context_documents: 检索到的上下文文档
+            
+        Returns:
+            OpenAI 格式的消息列表
+        """
+        # 构建上下文
+        context = self._build_context(context_documents)
+        
+        # 构建提示词
+        prompt = self._build_prompt(question, context)
+        
+        return [
+            {
+                "role": "system",
+                "content": "你是一个专业的知识库助手，能够根据提供的上下文信息准确回答用户的问题。"
+                         "如果上下文中没有相关信息，请如实告知用户。"
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
     def _build_context(self, documents: List[Dict[str, Any]]) -> str:
         """
         构建上下文文本
@@ -347,45 +1305,129 @@ class RAGService:
         
         return references
     
+    def _retrieve_context(
+        self,
+        question: str,
+        kb_id: str,
+        kb_ids: List[str],
+        top_k: int,
+        similarity_threshold: float,
+        embedding_model: str = None,
+        embedding_models: Dict[str, str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        检索问答上下文：指定知识库时只检索该库；全部知识库模式下并发检索 kb_ids，
+        按向量相似度合并后取全局前 top_k 个；都未指定时不使用知识库
+        """
+        with metrics.stage('chat', 'retrieve'):
+            if kb_id:
+                mode = 'single'
+                documents = self.search_documents(
+                    kb_id=kb_id,
+                    query=question,
+                    top_k=top_k,
+                    similarity_threshold=similarity_threshold,
+                    embedding_model=embedding_model
+                )
+            elif kb_ids:
+                mode = 'all'
+                documents = self.search_collections(
+                    kb_ids=kb_ids,
+                    query=question,
+                    top_k=top_k,
+                    similarity_threshold=similarity_threshold,
+                    embedding_models=embedding_models,
+                    merge_key='similarity'
+                )
+            else:
+                mode = 'none'
+                documents = []
+        
+        metrics.record_retrieval(mode, len(documents))
+        return documents
+    
+    def _answer_cache_key(
+        self,
+        question: str,
+        kb_id: str,
+        kb_ids: List[str],
+        model_name: str,
+        embedding_model: str,
+        context_documents: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        问答结果缓存的查找参数
+        
+        单知识库问答时附带问题向量（检索时已写入查询向量缓存）以启用语义命中；
+        全部知识库模式下各库嵌入模型可能不同，只做精确命中
+        """
+        query_embedding = None
+        if kb_id:
+            query_embedding = self.query_embedding_cache.get(
+                embedding_model or self.embedding_model, question
+            )
+        return {
+            'kb_ids': [kb_id] if kb_id else (kb_ids or []),
+            'model': model_name or self.default_llm_model,
+            'chunk_ids': [doc['id'] for doc in context_documents],
+            'question': question,
+            'query_embedding': query_embedding
+        }
+    
     def chat(
         self,
         question: str,
         kb_id: str = None,
         model_name: str = None,
         top_k: int = 5,
-        similarity_threshold: float = 0.7
+        similarity_threshold: float = 0.7,
+        embedding_model: str = None,
+        kb_ids: List[str] = None,
+        embedding_models: Dict[str, str] = None
     ) -> Dict[str, Any]:
         """
         完整的 RAG 问答流程
         
         Args:
             question: 用户问题
-            kb_id: 知识库ID（可选，如果不指定则不使用知识库）
+            kb_id: 知识库ID（可选，与 kb_ids 都不指定则不使用知识库）
             model_name: 使用的模型名称
             top_k: 检索文档数量
             similarity_threshold: 相似度阈值
+            embedding_model: 知识库的嵌入模型（不指定则使用默认嵌入模型）
+            kb_ids: 全部知识库模式下检索的知识库ID列表（未指定 kb_id 时生效）
+            embedding_models: 全部知识库模式下 {知识库ID: 嵌入模型}
             
         Returns:
             包含答案和引用的字典
         """
         try:
-            context_documents = []
+            context_documents = self._retrieve_context(
+                question, kb_id, kb_ids, top_k, similarity_threshold,
+                embedding_model, embedding_models
+            )
             
-            # 如果指定了知识库，则检索相关文档
-            if kb_id:
-                context_documents = self.search_documents(
-                    kb_id=kb_id,
-                    query=question,
-                    top_k=top_k,
-                    similarity_threshold=similarity_threshold
-                )
+            # 相同知识库、相同上下文的相同问题直接返回缓存的答案
+            cache_key = self._answer_cache_key(
+                question, kb_id, kb_ids, model_name, embedding_model, context_documents
+            )
+            cached = self.answer_cache.get(**cache_key)
+            if cached is not None:
+                current_app.logger.info('命中问答结果缓存')
+                return {
+                    'answer': cached['answer'],
+                    'references': cached['references'],
+                    'context_count': len(context_documents)
+                }
             
             # 生成答案
-            answer, references = self.generate_answer(
-                question=question,
-                context_documents=context_documents,
-                model_name=model_name
-            )
+            with metrics.stage('chat', 'llm'):
+                answer, references = self.generate_answer(
+                    question=question,
+                    context_documents=context_documents,
+                    model_name=model_name
+                )
+            self.answer_cache.set(answer=answer, references=references, **cache_key)
             
             return {
                 'answer': answer,
@@ -397,6 +1439,77 @@ class RAGService:
             current_app.logger.error(f'RAG 问答失败: {str(e)}', exc_info=True)
             raise
     
+    def chat_stream(
+        self,
+        question: str,
+        kb_id: str = None,
+        model_name: str = None,
+        top_k: int = 5,
+        similarity_threshold: float = 0.7,
+        embedding_model: str = None,
+        kb_ids: List[str] = None,
+        embedding_models: Dict[str, str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式 RAG 问答流程：先返回引用，再逐段返回答案
+        
+        Args:
+            question: 用户问题
+            kb_id: 知识库ID（可选，与 kb_ids 都不指定则不使用知识库）
+            model_name: 使用的模型名称
+            top_k: 检索文档数量
+            similarity_threshold: 相似度阈值
+            embedding_model: 知识库的嵌入模型（不指定则使用默认嵌入模型）
+            kb_ids: 全部知识库模式下检索的知识库ID列表（未指定 kb_id 时生效）
+            embedding_models: 全部知识库模式下 {知识库ID: 嵌入模型}
+            
+        Yields:
+            {'type': 'references', 'references': [...], 'context_count': n}
+            {'type': 'token', 'content': '...'}
+        """
+        context_documents = self._retrieve_context(
+            question, kb_id, kb_ids, top_k, similarity_threshold,
+            embedding_model, embedding_models
+        )
+        
+        # 命中问答结果缓存时一次返回完整答案
+        cache_key = self._answer_cache_key(
+            question, kb_id, kb_ids, model_name, embedding_model, context_documents
+        )
+        cached = self.answer_cache.get(**cache_key)
+        if cached is not None:
+            current_app.logger.info('命中问答结果缓存')
+            yield {
+                'type': 'references',
+                'references': cached['references'],
+                'context_count': len(context_documents)
+            }
+            yield {'type': 'token', 'content': cached['answer']}
+            return
+        
+        references = self._build_references(context_documents)
+        yield {
+            'type': 'references',
+            'references': references,
+            'context_count': len(context_documents)
+        }
+        
+        answer_parts = []
+        start = time.perf_counter()
+        for content in self.generate_answer_stream(
+            question=question,
+            context_documents=context_documents,
+            model_name=model_name
+        ):
+            if not answer_parts:
+                metrics.observe_stage('chat', 'llm_first_token', time.perf_counter() - start)
+            answer_parts.append(content)
+            yield {'type': 'token', 'content': content}
+        metrics.observe_stage('chat', 'llm', time.perf_counter() - start)
+        
+        # 完整生成后才写入缓存，中断的回答不会被缓存
+        self.answer_cache.set(answer=''.join(answer_parts), references=references, **cache_key)
+    
     def check_ollama_health(self) -> Dict[str, Any]:
         """
         检查 Ollama 服务健康状态
@@ -408,7 +1521,7 @@ class RAGService:
             url = f"{self.ollama_base_url}/api/tags"
             start_time = time.time()
             
-            response = requests.get(url, timeout=5)
+            response = http_client.get(url, timeout=5)
             response_time = int((time.time() - start_time) * 1000)
             
             if response.status_code == 200:
@@ -442,7 +1555,13 @@ class RAGService:
         """
         try:
             collection_name = f"kb_{kb_id}"
+            collection = self._get_existing_collection(kb_id)
+            hashes = self._collect_content_hashes(collection) if collection is not None else set()
             self.chroma_client.delete_collection(name=collection_name)
+            if self.lexical_index:
+                self.lexical_index.drop(kb_id)
+            self.answer_cache.invalidate(kb_id)
+            self._release_embeddings(hashes)
             current_app.logger.info(f'删除向量集合: {collection_name}')
         except Exception as e:
             current_app.logger.error(f'删除向量集合失败: {str(e)}', exc_info=True)
@@ -0,0 +1,148 @@
+"""
+分块用的词元计数
+按嵌入模型的分词器计算文本块的词元数，分词器从本地文件加载；
+找不到分词器时退化为按字符类别估算
+"""
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # pragma: no cover - 可选依赖
+    Tokenizer = None
+
+
+# 估算规则：每个汉字（及全角符号）计 1 个词元，字母按 4 个、数字按 3 个一组计 1 个词元，其他符号各计 1 个
+_ESTIMATE_PATTERN = re.compile(r'[a-zA-Z]{1,4}|[0-9]{1,3}|[^\sa-zA-Z0-9]')
+
+
+class TokenCounter:
+    """
+    词元计数器
+
+    offsets 返回每个词元在原文中的 [起, 止) 字符区间，分块时据此把词元窗口换算为字符位置。
+    序列化时只保存模型名和分词器路径，提交到解析进程池后在子进程中重新获取（每个进程只加载一次）。
+    """
+
+    def __init__(self, model_name: str, tokenizer_path: Optional[str] = None, tokenizer=None):
+        """
+        Args:
+            model_name: 嵌入模型名称
+            tokenizer_path: 分词器文件或目录
+            tokenizer: 已加载的 tokenizers.Tokenizer 对象，不指定则按字符类别估算
+        """
+        self.model_name = model_name
+        self.tokenizer_path = tokenizer_path
+        self.tokenizer = tokenizer
+
+    def __reduce__(self):
+        return get_token_counter, (self.model_name, self.tokenizer_path)
+
+    @property
+    def exact(self) -> bool:
+        """是否使用模型分词器（否则为估算值）"""
+        return self.tokenizer is not None
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        """
+        分词并返回各词元的字符区间
+
+        Args:
+            text: 文本
+
+        Returns:
+            [(起始字符位置, 结束字符位置), ...]
+        """
+        if not text:
+            return []
+        if self.tokenizer is not None:
+            return self.tokenizer.encode(text, add_special_tokens=False).offsets
+        return [match.span() for match in _ESTIMATE_PATTERN.finditer(text)]
+
+    def count(self, text: str) -> int:
+        """
+        计算文本的词元数
+
+        Args:
+            text: 文本
+
+        Returns:
+            词元数
+        """
+        return len(self.offsets(text))
+
+
+def resolve_tokenizer_path(model_name: str, tokenizer_path: Optional[str]) -> Optional[str]:
+    """
+    查找嵌入模型对应的本地分词器文件
+
+    tokenizer_path 为文件时直接使用；为目录时依次查找
+    <目录>/<模型名>/tokenizer.json 和 <目录>/<模型名>.json，
+    模型名去掉 Ollama 的量化标签（:Q5_K_M 等），/ 替换为 __。
+
+    Args:
+        model_name: 嵌入模型名称
+        tokenizer_path: 分词器文件或目录
+
+    Returns:
+        分词器文件路径，找不到时返回 None
+    """
+    if not tokenizer_path:
+        return None
+    if os.path.isfile(tokenizer_path):
+        return tokenizer_path
+    if not os.path.isdir(tokenizer_path) or not model_name:
+        return None
+
+    base_name = model_name.split(':', 1)[0].replace('/', '__')
+    for candidate in (
+        os.path.join(tokenizer_path, base_name, 'tokenizer.json'),
+        os.path.join(tokenizer_path, f'{base_name}.json')
+    ):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+_counters: Dict[Tuple[str, str], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_name: str, tokenizer_path: Optional[str] = None) -> TokenCounter:
+    """
+    获取嵌入模型的词元计数器（按进程缓存，解析子进程中首次调用时加载）
+
+    Args:
+        model_name: 嵌入模型名称
+        tokenizer_path: 分词器文件或目录
+
+    Returns:
+        TokenCounter 对象
+    """
+    key = (model_name or '', tokenizer_path or '')
+    with _counters_lock:
+        counter = _counters.get(key)
+        if counter is not None:
+            return counter
+
+        logger = logging.getLogger(__name__)
+        path = resolve_tokenizer_path(model_name, tokenizer_path)
+        counter = None
+        if Tokenizer is None:
+            logger.warning(f'未安装 tokenizers，嵌入模型 {model_name} 按字符类别估算词元数')
+        elif path:
+            try:
+                counter = TokenCounter(model_name, tokenizer_path, Tokenizer.from_file(path))
+            except Exception as e:
+                logger.warning(f'加载分词器失败: {path}, {str(e)}')
+        else:
+            logger.warning(f'未找到嵌入模型 {model_name} 的分词器，按字符类别估算词元数')
+
+        if counter is None:
+            counter = TokenCounter(model_name, tokenizer_path)
+
+        _counters[key] = counter
+        return counter
@@ -0,0 +1,173 @@
+"""
+登录用户缓存
+每个需要登录的请求都要解码 JWT 并按用户ID查询用户表，轮询类接口尤其频繁。
+这里缓存解码后的 token 载荷和用户的身份快照（ID、用户名、姓名、角色、状态），
+命中时不再访问数据库
+"""
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+from utils.cache import LRUCache
+
+
+class CachedUser:
+    """
+    用户身份快照
+
+    从数据库行复制出的只读字段，不持有 ORM 对象，可以跨请求、跨线程使用。
+    提供与 User 模型相同的 is_admin / is_active 方法，供 g.current_user 的调用方使用。
+    """
+
+    __slots__ = ('id', 'username', 'name', 'role', 'status')
+
+    def __init__(self, id: str, username: str, name: str, role: str, status: str):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.role = role
+        self.status = status
+
+    @classmethod
+    def from_model(cls, user) -> 'CachedUser':
+        return cls(user.id, user.username, user.name, user.role, user.status)
+
+    def is_admin(self) -> bool:
+        """是否是管理员"""
+        return self.role == 'admin'
+
+    def is_active(self) -> bool:
+        """是否激活"""
+        return self.status == 'active'
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class AuthCache:
+    """
+    登录用户缓存
+
+    用户快照在本进程内通过管理员接口修改角色、状态或删除用户时主动失效；
+    ttl 较短，兜底其他进程修改后的过期时间。
+    token 载荷按 token 的 SHA-256 摘要缓存，过期时间不超过 token 自身的 exp。
+    """
+
+    def __init__(self, user_size: int = 1024, user_ttl: Optional[float] = 30, token_size: int = 4096):
+        """
+        Args:
+            user_size: 最多缓存的用户数
+            user_ttl: 用户快照过期时间（秒），0 表示不缓存用户
+            token_size: 最多缓存的 token 数
+        """
+        self.user_ttl = user_ttl
+        self._users = LRUCache(max_size=user_size, ttl=user_ttl)
+        self._tokens = LRUCache(max_size=token_size)
+
+    def initialize(self, app):
+        """
+        按应用配置重建缓存
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.user_ttl = app.config.get('AUTH_USER_CACHE_TTL', 30)
+        self._users = LRUCache(max_size=app.config.get('AUTH_USER_CACHE_SIZE', 1024), ttl=self.user_ttl)
+        self._tokens = LRUCache(max_size=app.config.get('AUTH_TOKEN_CACHE_SIZE', 4096))
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get_payload(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        获取已解码的 token 载荷
+
+        Args:
+            token: JWT token（不含 Bearer 前缀）
+
+        Returns:
+            载荷字典，未缓存或 token 已过期时返回 None
+        """
+        key = self._token_key(token)
+        payload = self._tokens.get(key)
+        if payload is None:
+            return None
+
+        # 过期的 token 交给 verify_token 重新校验并记录日志
+        if payload.get('exp', 0) <= time.time():
+            self._tokens.pop(key)
+            return None
+        return payload
+
+    def set_payload(self, token: str, payload: Dict[str, Any]):
+        """
+        缓存已校验通过的 token 载荷
+
+        Args:
+            token: JWT token（不含 Bearer 前缀）
+            payload: verify_token 返回的载荷
+        """
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+
+        remaining = exp - time.time()
+        if remaining > 0:
+            self._tokens.set(self._token_key(token), payload, ttl=remaining)
+
+    def get_user(self, user_id: str) -> Optional[CachedUser]:
+        """
+        获取用户身份快照（需要应用上下文，未命中时查询数据库）
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            用户快照，用户不存在时返回 None（不缓存不存在的用户）
+        """
+        if not user_id:
+            return None
+
+        user = self._users.get(user_id)
+        if user is not None:
+            return user
+
+        from models.user import User
+
+        model = User.query.get(user_id)
+        if model is None:
+            return None
+
+        user = CachedUser.from_model(model)
+        if self.user_ttl:
+            self._users.set(user_id, user)
+        return user
+
+    def invalidate_user(self, user_id: str = None):
+        """
+        使用户快照失效
+
+        Args:
+            user_id: 用户ID，不指定则清空全部
+        """
+        if user_id is None:
+            self._users.clear()
+        else:
+            self._users.pop(user_id)
+
+    def clear(self):
+        """清空用户快照和 token 载荷"""
+        self._users.clear()
+        self._tokens.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        return {
+            'users': self._users.stats(),
+            'tokens': self._tokens.stats()
+        }
+
+
+# 全局登录用户缓存实例
+auth_cache = AuthCache()